@@ -0,0 +1,293 @@
+import argparse
+import sqlite3
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+import db
+
+DEFAULT_HORIZON_DAYS = 730
+ARCHIVE_CHUNK_SIZE = 1000
+# Desks poll the change feed every few seconds, so tombstones of archived
+# appointments are dropped after a week; a desk started later loads its grid
+# without them.
+TOMBSTONE_DAYS = 7
+CLOSED_STATUSES = ('Завершен', 'Не явился', 'Отменен')
+
+# An appointment stays in the hot database while anything hanging off it is
+# still open: a lab order awaiting results, an unsettled payment or an active
+# prescription.
+OPEN_DEPENDENTS = """
+    EXISTS (SELECT 1 FROM main.payments pay WHERE pay.id_appointment = a.id_appointment
+            AND pay.payment_status IN ('Ожидает', 'Частично оплачен'))
+    OR EXISTS (SELECT 1 FROM main.medical_records r
+               JOIN main.lab_orders lo ON lo.id_record = r.id_record
+               WHERE r.id_appointment = a.id_appointment AND lo.status = 'Назначен')
+    OR EXISTS (SELECT 1 FROM main.medical_records r
+               JOIN main.prescriptions pr ON pr.id_record = r.id_record
+               WHERE r.id_appointment = a.id_appointment AND pr.is_active = 1)
+"""
+
+_BATCH = "id_appointment IN (SELECT id FROM temp.archive_appointments)"
+_RECORDS = "id_record IN (SELECT id FROM temp.archive_records)"
+# (table, rows belonging to the current batch), parents before children.
+ARCHIVE_TABLES = [
+    ("appointments", _BATCH),
+    ("appointment_services", _BATCH),
+    ("payments", _BATCH),
+    ("medical_records", _BATCH),
+    ("prescriptions", _RECORDS),
+    ("lab_orders", _RECORDS),
+]
+ARCHIVE_INDEXES = [
+    ("idx_appointments_patient_date", "appointments", "id_patient, appointment_date, appointment_time"),
+    ("idx_appointments_date", "appointments", "appointment_date"),
+    ("idx_appointment_services_appointment", "appointment_services", "id_appointment"),
+    ("idx_payments_appointment", "payments", "id_appointment"),
+    ("idx_medical_records_appointment", "medical_records", "id_appointment"),
+    ("idx_medical_records_patient_date", "medical_records", "id_patient, record_date"),
+    ("idx_prescriptions_record", "prescriptions", "id_record"),
+    ("idx_prescriptions_patient_date", "prescriptions", "id_patient, prescription_date"),
+    ("idx_lab_orders_record", "lab_orders", "id_record"),
+    ("idx_lab_orders_patient_date", "lab_orders", "id_patient, order_date"),
+]
+
+
+def _placeholders(values) -> str:
+    return ", ".join("?" for _ in values)
+
+
+def _main_path(conn: sqlite3.Connection) -> Path:
+    for row in conn.execute("PRAGMA database_list"):
+        if row[1] == "main":
+            return Path(row[2])
+    raise sqlite3.OperationalError("main database not found")
+
+
+def archive_path(conn: sqlite3.Connection, year: int) -> Path:
+    main = _main_path(conn)
+    return main.with_name(f"{main.stem}_archive_{year}{main.suffix}")
+
+
+def schema_name(year: int) -> str:
+    return f"archive_{year}"
+
+
+def attached(conn: sqlite3.Connection) -> List[str]:
+    return [row[1] for row in conn.execute("PRAGMA database_list") if row[1].startswith("archive_")]
+
+
+def attach(conn: sqlite3.Connection, year: int, create: bool = False) -> str:
+    schema = schema_name(year)
+    if schema in attached(conn):
+        return schema
+    path = archive_path(conn, year)
+    if not create and not path.exists():
+        raise FileNotFoundError(f"Архив за {year} год не найден: {path}")
+    conn.execute("ATTACH DATABASE ? AS " + schema, (str(path),))
+    return schema
+
+
+def catalog(conn: sqlite3.Connection, date_from: Optional[str] = None,
+            date_to: Optional[str] = None) -> List[Tuple[int, str, str]]:
+    # (year, first_date, last_date) of the archives whose dates overlap the
+    # requested range, oldest first.
+    cur = conn.execute(
+        """
+        SELECT year, first_date, last_date FROM archive_catalog
+        WHERE last_date >= COALESCE(?, '') AND first_date <= COALESCE(?, '9999-12-31')
+        ORDER BY year
+        """,
+        (date_from, date_to),
+    )
+    return [tuple(row) for row in cur.fetchall()]
+
+
+def archived_years(conn: sqlite3.Connection, date_from: Optional[str] = None,
+                   date_to: Optional[str] = None) -> List[int]:
+    # Only archives whose dates overlap the requested range are needed.
+    return [year for year, _, _ in catalog(conn, date_from, date_to)]
+
+
+def schemas(conn: sqlite3.Connection, years: Iterable[int], main: bool = True) -> Iterator[str]:
+    # "main", then the archive of each year in turn. An archive stays
+    # attached only until the next one is asked for, so any number of years
+    # fits within SQLite's limit of ten attached databases; callers read each
+    # schema's rows in full before moving on.
+    if main:
+        yield "main"
+    for year in years:
+        held = schema_name(year) in attached(conn)
+        schema = attach(conn, year)
+        try:
+            yield schema
+        finally:
+            if not held:
+                conn.execute(f"DETACH DATABASE {schema}")
+
+
+def _ensure_schema(conn: sqlite3.Connection, schema: str):
+    # Archive tables copy the columns and primary keys of the hot tables but
+    # no foreign keys: patients and doctors stay in the hot database.
+    for table, _ in ARCHIVE_TABLES:
+        columns = conn.execute(f"PRAGMA main.table_info({table})").fetchall()
+        existing = {row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")}
+        if not existing:
+            definitions = ", ".join(
+                f"{row[1]} {row[2]}{' PRIMARY KEY' if row[5] else ''}" for row in columns
+            )
+            conn.execute(f"CREATE TABLE {schema}.{table} ({definitions})")
+            continue
+        for row in columns:
+            if row[1] not in existing:
+                conn.execute(f"ALTER TABLE {schema}.{table} ADD COLUMN {row[1]} {row[2]}")
+    for name, table, columns in ARCHIVE_INDEXES:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.{name} ON {table} ({columns})")
+
+
+def _move_chunk(conn: sqlite3.Connection, schema: str, year: int, first: str, before: str,
+                chunk_size: int) -> dict:
+    counts = {}
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM temp.archive_appointments")
+        conn.execute("DELETE FROM temp.archive_records")
+        selected = conn.execute(
+            f"""
+            INSERT INTO temp.archive_appointments (id)
+            SELECT a.id_appointment FROM main.appointments a
+            WHERE a.status IN ({_placeholders(CLOSED_STATUSES)})
+              AND a.appointment_date >= ? AND a.appointment_date < ?
+              AND NOT ({OPEN_DEPENDENTS})
+            LIMIT ?
+            """,
+            (*CLOSED_STATUSES, first, before, chunk_size),
+        ).rowcount
+        if not selected:
+            conn.rollback()
+            return counts
+        conn.execute(f"INSERT INTO temp.archive_records (id) SELECT id_record FROM main.medical_records "
+                     f"WHERE {_BATCH}")
+        # The catalog dates span every event moved with the appointments, a
+        # payment made after the year's end included: the patient timeline
+        # skips archives by them. WHERE true keeps SQLite from reading ON
+        # CONFLICT as part of the FROM clause.
+        conn.execute(
+            f"""
+            WITH dates (day) AS (
+                SELECT appointment_date FROM main.appointments WHERE {_BATCH}
+                UNION ALL SELECT payment_date FROM main.payments WHERE {_BATCH}
+                UNION ALL SELECT record_date FROM main.medical_records WHERE {_BATCH}
+                UNION ALL SELECT prescription_date FROM main.prescriptions WHERE {_RECORDS}
+                UNION ALL SELECT order_date FROM main.lab_orders WHERE {_RECORDS}
+            )
+            INSERT INTO archive_catalog (year, first_date, last_date, appointments)
+            SELECT ?, MIN(day), MAX(day), (SELECT COUNT(*) FROM main.appointments WHERE {_BATCH})
+            FROM dates WHERE true
+            ON CONFLICT (year) DO UPDATE SET
+                first_date = MIN(first_date, excluded.first_date),
+                last_date = MAX(last_date, excluded.last_date),
+                appointments = appointments + excluded.appointments,
+                archived_at = CURRENT_TIMESTAMP
+            """,
+            (year,),
+        )
+        for table, where in ARCHIVE_TABLES:
+            columns = ", ".join(row[1] for row in conn.execute(f"PRAGMA main.table_info({table})"))
+            # OR REPLACE makes a rerun idempotent: in WAL mode a crash can
+            # commit the archive file without the matching delete below.
+            conn.execute(f"INSERT OR REPLACE INTO {schema}.{table} ({columns}) "
+                         f"SELECT {columns} FROM main.{table} WHERE {where}")
+        conn.execute("INSERT INTO maintenance_flags (name) VALUES (?)", (db.ARCHIVING_FLAG,))
+        conn.execute(f"INSERT OR REPLACE INTO main.appointment_tombstones (id_appointment, removed_at) "
+                     f"SELECT id, {db.CHANGE_TIMESTAMP} FROM temp.archive_appointments")
+        for table, where in reversed(ARCHIVE_TABLES):
+            counts[table] = conn.execute(f"DELETE FROM main.{table} WHERE {where}").rowcount
+        conn.execute("DELETE FROM maintenance_flags WHERE name = ?", (db.ARCHIVING_FLAG,))
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    return counts
+
+
+def archive(conn: sqlite3.Connection, before: str, chunk_size: int = ARCHIVE_CHUNK_SIZE,
+            progress: Optional[Callable[[int, dict], None]] = None) -> dict:
+    # Moves closed appointments dated before `before`, with their services,
+    # payments, records, prescriptions and lab orders, into one archive file
+    # per year. Each chunk is its own short transaction, so desks keep working
+    # while a large backlog is archived.
+    conn.commit()
+    with conn:
+        conn.execute(f"DELETE FROM main.appointment_tombstones WHERE removed_at < "
+                     f"strftime('%Y-%m-%d %H:%M:%f', 'now', '-{TOMBSTONE_DAYS} days')")
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS archive_appointments (id INTEGER PRIMARY KEY)")
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS archive_records (id INTEGER PRIMARY KEY)")
+    years = [int(row[0]) for row in conn.execute(
+        f"""
+        SELECT DISTINCT substr(appointment_date, 1, 4) FROM appointments
+        WHERE status IN ({_placeholders(CLOSED_STATUSES)}) AND appointment_date < ?
+        ORDER BY 1
+        """,
+        (*CLOSED_STATUSES, before),
+    )]
+    totals = {table: 0 for table, _ in ARCHIVE_TABLES}
+    # Existing archives pick up indexes added since they were created.
+    for year in sorted(set(archived_years(conn)) - set(years)):
+        schema = attach(conn, year)
+        try:
+            _ensure_schema(conn, schema)
+            conn.commit()
+        finally:
+            conn.execute(f"DETACH DATABASE {schema}")
+    for year in years:
+        schema = attach(conn, year, create=True)
+        try:
+            _ensure_schema(conn, schema)
+            conn.commit()
+            first, upper = f"{year}-01-01", min(before, f"{year + 1}-01-01")
+            while True:
+                counts = _move_chunk(conn, schema, year, first, upper, chunk_size)
+                if not counts:
+                    break
+                for table, count in counts.items():
+                    totals[table] += count
+                if progress is not None:
+                    progress(year, totals)
+        finally:
+            conn.execute(f"DETACH DATABASE {schema}")
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move closed historical appointments into per-year archives")
+    parser.add_argument("command", choices=["run", "list"])
+    parser.add_argument("--db", help="database path (default: the application database)")
+    parser.add_argument("--horizon-days", type=int, default=DEFAULT_HORIZON_DAYS,
+                        help="archive appointments older than this many days")
+    parser.add_argument("--chunk", type=int, default=ARCHIVE_CHUNK_SIZE, help="appointments per transaction")
+    parser.add_argument("--vacuum", action="store_true", help="compact the hot database afterwards")
+    args = parser.parse_args()
+
+    conn = db.get_connection(args.db)
+    try:
+        db.migrate(conn)
+        if args.command == "run":
+            before = (date.today() - timedelta(days=args.horizon_days)).isoformat()
+            totals = archive(conn, before, args.chunk,
+                             progress=lambda year, totals: print(f"{year}: {totals['appointments']} appointments"))
+            for table, count in totals.items():
+                print(f"{table}: {count} rows archived")
+            if args.vacuum:
+                conn.execute("VACUUM")
+        for row in conn.execute("SELECT * FROM archive_catalog ORDER BY year"):
+            print(f"{row['year']}: {row['appointments']} appointments, "
+                  f"{row['first_date']} — {row['last_date']}, {archive_path(conn, row['year']).name}")
+        size = _main_path(conn).stat().st_size
+        print(f"hot database: {size / 1024 / 1024:.1f} MiB")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
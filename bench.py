@@ -0,0 +1,174 @@
+import argparse
+import json
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import datagen
+import db
+from database import Database
+
+
+DEFAULT_SCALES = [10_000, 100_000]
+# Fixed reference date so every run at a given scale benchmarks identical data.
+BENCH_TODAY = date(2026, 1, 15)
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def prepare(scale: int, seed: int, data_dir: Path, regenerate: bool = False) -> Path:
+    path = data_dir / f"bench_{scale}_{seed}.sqlite3"
+    if regenerate or not path.exists():
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{path}{suffix}").unlink(missing_ok=True)
+        datagen.generate(path, scale, seed, BENCH_TODAY, progress=None)
+    else:
+        # Cached databases may predate newer migrations.
+        conn = db.get_connection(path)
+        try:
+            db.migrate(conn)
+        finally:
+            conn.close()
+    return path
+
+
+def working_copy(path: Path) -> Path:
+    # Write cases modify the database, so each run starts from a fresh copy.
+    copy = path.with_name(path.stem + "_run.sqlite3")
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{copy}{suffix}").unlink(missing_ok=True)
+    with sqlite3.connect(path) as source, sqlite3.connect(copy) as target:
+        source.backup(target)
+    return copy
+
+
+def _measure(func, runs: int) -> tuple[list[float], int]:
+    timings = []
+    rows = 0
+    for i in range(runs):
+        started = time.perf_counter()
+        result = func(i)
+        timings.append((time.perf_counter() - started) * 1000)
+        if isinstance(result, tuple):
+            result = result[0]
+        rows = len(result) if isinstance(result, list) else int(result is not None)
+    return timings, rows
+
+
+def cases(database: Database, rng: random.Random):
+    n_patients = database.conn.execute("SELECT MAX(id_patient) FROM patients").fetchone()[0]
+    month_from = (BENCH_TODAY - timedelta(days=30)).isoformat()
+    month_to = BENCH_TODAY.isoformat()
+    deep_cursor = None
+    for _ in range(50):
+        _, deep_cursor = database.get_appointments_page(cursor=deep_cursor)
+    # Writes go to a far-future day so they never collide with generated bookings.
+    write_day = date(2100, 1, 4)
+    written = []
+
+    def create(i):
+        day = (write_day + timedelta(days=i // 9)).isoformat()
+        time_ = f"{9 + i % 9:02d}:00:00"
+        id_appointment = database.create_appointment_with_services(
+            rng.randrange(1, n_patients + 1), 1, day, time_, 'Первичный', '', 1800,
+            [{'id_service': 1, 'price': 1800}],
+        )
+        written.append(id_appointment)
+        return id_appointment
+
+    def update(i):
+        return database.update_appointment_with_services(
+            written[i % len(written)], 1, 'Завершен', 'bench', 2700,
+            [{'id_service': 1, 'price': 1800}, {'id_service': 7, 'price': 900}],
+        )
+
+    return [
+        ("get_appointments[all]", 3, lambda i: database.get_appointments()),
+        ("get_appointments[status]", 5, lambda i: database.get_appointments('Запланирован')),
+        ("get_appointments[month]", 20, lambda i: database.get_appointments(None, month_from, month_to)),
+        ("get_appointments[status+month]", 20,
+         lambda i: database.get_appointments('Завершен', month_from, month_to)),
+        ("get_appointments_page[first]", 50, lambda i: database.get_appointments_page()),
+        ("get_appointments_page[page 51]", 50, lambda i: database.get_appointments_page(cursor=deep_cursor)),
+        ("get_appointments_page[patient sort]", 20,
+         lambda i: database.get_appointments_page(order_by='patient', descending=False)),
+        ("get_patient_appointments", 200,
+         lambda i: database.get_patient_appointments(rng.randrange(1, n_patients + 1))),
+        ("get_appointment_by_id", 200, lambda i: database.get_appointment_by_id(rng.randrange(1, 1000))),
+        ("authenticate", 200, lambda i: database.authenticate(f"patient{i + 1}", f"patient{i + 1}")),
+        ("search_patients", 100, lambda i: database.search_patients(rng.choice(datagen.LAST_NAMES)[:4])),
+        ("get_doctors", 100, lambda i: database.get_doctors()),
+        ("find_free_slots", 50, lambda i: database.find_free_slots(10, after=BENCH_TODAY.isoformat())),
+        ("create_appointment_with_services", 100, create),
+        ("update_appointment_with_services", 100, update),
+    ]
+
+
+def run(scales: list[int], seed: int, data_dir: Path, regenerate: bool, only: list[str]):
+    meta = {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'seed': seed,
+    }
+    for scale in scales:
+        path = working_copy(prepare(scale, seed, data_dir, regenerate))
+        database = Database(path)
+        rng = random.Random(seed)
+        for name, runs, func in cases(database, rng):
+            if only and not any(pattern in name for pattern in only):
+                continue
+            timings, rows = _measure(func, runs)
+            yield {
+                **meta,
+                'scale': scale,
+                'case': name,
+                'runs': runs,
+                'rows': rows,
+                'min_ms': round(min(timings), 3),
+                'median_ms': round(statistics.median(timings), 3),
+                'p95_ms': round(sorted(timings)[max(0, int(len(timings) * 0.95) - 1)], 3),
+                'mean_ms': round(statistics.fmean(timings), 3),
+            }
+        database.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Database methods on generated data")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES,
+                        help="numbers of appointments to generate")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", type=Path, default=Path(tempfile.gettempdir()) / "medical_bench")
+    parser.add_argument("--regenerate", action="store_true", help="rebuild cached databases")
+    parser.add_argument("--only", nargs="*", default=[], help="run cases whose name contains any of these")
+    parser.add_argument("--output", type=Path, help="write JSON lines here instead of stdout")
+    args = parser.parse_args()
+
+    args.data_dir.mkdir(parents=True, exist_ok=True)
+    out = args.output.open("w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for result in run(args.scales, args.seed, args.data_dir, args.regenerate, args.only):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
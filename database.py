@@ -0,0 +1,629 @@
+import base64
+import functools
+import json
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterator, Optional, List, Sequence, Tuple
+
+import db
+import labqueue
+import queries
+import records
+import scheduling
+from db import CHANGE_TIMESTAMP
+from instrumentation import Instrumentation
+from queries import APPOINTMENT_SORT_KEYS
+
+
+def _encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> list:
+    return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+
+# With a reader pool, methods marked _reads check out a read-only connection
+# for the duration of the call and methods marked _writes run on the writer
+# thread; self.conn resolves to whichever connection the current call holds.
+# Without a pool both decorators call straight through to self.conn.
+def _reads(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.pool is None or getattr(self._local, 'conn', None) is not None:
+            return method(self, *args, **kwargs)
+        with self.pool.connection() as conn:
+            with self._active_lock:
+                self._active.add(conn)
+            self._local.conn = conn
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self._local.conn = None
+                with self._active_lock:
+                    self._active.discard(conn)
+    return wrapper
+
+
+def _writes(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.writer is None or getattr(self._local, 'conn', None) is not None:
+            return method(self, *args, **kwargs)
+
+        def operation(conn):
+            self._local.conn = conn
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self._local.conn = None
+        return self.writer.submit(operation).result()
+    return wrapper
+
+
+class Database:
+    def __init__(self, db_path=None, profile: str = db.DEFAULT_PROFILE, *, setup: bool = True,
+                 instrument: Optional[Instrumentation] = None, readers: int = 0):
+        if setup:
+            db_path = db.setup_database(db_path, seed=True, profile=profile)
+        self.db_path = db_path
+        self.profile = profile
+        self._conn = db.get_connection(self.db_path)
+        self.settings = db.apply_profile(self._conn, profile)
+        self._local = threading.local()
+        self._active = set()
+        self._active_lock = threading.Lock()
+        self._cache = {}
+        self._cache_stats = {}
+        self._stats_lock = threading.Lock()
+        self._table_versions = {}
+        self.lab_metrics = labqueue.QueueMetrics()
+        self.instrumentation = instrument or Instrumentation.from_env()
+        # readers > 0 makes the instance safe to share between threads: reads
+        # use a pool of that many read-only connections and writes are queued
+        # to one writer thread that group-commits them (see pool.py).
+        self.pool = None
+        self.writer = None
+        if readers:
+            from pool import ReaderPool, WriterQueue
+            self.pool = ReaderPool(self.db_path, readers, profile, instrumentation=self.instrumentation)
+            self.writer = WriterQueue(self.db_path, profile, instrumentation=self.instrumentation)
+        if self.instrumentation is not None:
+            self.instrumentation.attach(self)
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return getattr(self._local, 'conn', None) or self._conn
+
+    def worker_copy(self) -> "Database":
+        if self.pool is not None:
+            # Pooled instances already are thread-safe; the copy only gets its
+            # own bookkeeping so interrupt() stops just this worker's queries.
+            worker = Database.__new__(Database)
+            # Instance attributes shadowing methods are instrumentation wrappers
+            # bound to self; they are re-created for the copy below.
+            worker.__dict__.update({k: v for k, v in self.__dict__.items() if not hasattr(Database, k)})
+            worker._local = threading.local()
+            worker._active = set()
+            worker._active_lock = threading.Lock()
+            if worker.instrumentation is not None:
+                worker.instrumentation.attach(worker)
+            return worker
+        worker = Database(self.db_path, self.profile, setup=False, instrument=self.instrumentation)
+        # Worker copies keep their own cache but report into the same counters.
+        worker._cache_stats = self._cache_stats
+        worker._stats_lock = self._stats_lock
+        worker.lab_metrics = self.lab_metrics
+        return worker
+
+    def interrupt(self):
+        if self.pool is None:
+            self._conn.interrupt()
+            return
+        with self._active_lock:
+            active = list(self._active)
+        for conn in active:
+            conn.interrupt()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.pool is not None:
+            self.pool.close()
+        self._conn.close()
+
+    # Reference tables are cached per connection. PRAGMA data_version changes
+    # when another connection commits; writes made through this connection are
+    # tracked with per-table counters because data_version ignores them.
+    def _cached(self, key: tuple, table: str, load) -> List[dict]:
+        # data_version values are only comparable on the same connection, so
+        # pooled readers each keep their own entry.
+        key = (*key, id(self.conn))
+        version = (self.conn.execute("PRAGMA data_version").fetchone()[0],
+                   self._table_versions.get(table, 0))
+        entry = self._cache.get(key)
+        hit = entry is not None and entry[0] == version
+        with self._stats_lock:
+            stats = self._cache_stats.setdefault(table, {'hits': 0, 'misses': 0})
+            stats['hits' if hit else 'misses'] += 1
+        if hit:
+            return list(entry[1])
+        rows = load()
+        self._cache[key] = (version, rows)
+        return list(rows)
+
+    def _touch(self, table: str):
+        self._table_versions[table] = self._table_versions.get(table, 0) + 1
+
+    def cache_stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                'hits': sum(s['hits'] for s in self._cache_stats.values()),
+                'misses': sum(s['misses'] for s in self._cache_stats.values()),
+                'tables': {table: dict(s) for table, s in self._cache_stats.items()},
+            }
+
+    @_reads
+    def get_appointments(self, status: Optional[str] = None,
+                         date_from: Optional[str] = None,
+                         date_to: Optional[str] = None) -> List[records.AppointmentRow]:
+        active, params = queries.appointment_filters(status, date_from, date_to)
+        return records.fetch_all(self.conn, records.AppointmentRow, queries.appointment_list(active), params)
+
+    def iter_appointments(self, status: Optional[str] = None, date_from: Optional[str] = None,
+                          date_to: Optional[str] = None) -> Iterator[records.AppointmentRow]:
+        # Lazy variant of get_appointments for large ranges: rows are fetched
+        # as the caller iterates, and a pooled connection stays checked out
+        # until the iterator is exhausted or closed.
+        active, params = queries.appointment_filters(status, date_from, date_to)
+        query = queries.appointment_list(active)
+        if self.pool is None:
+            yield from records.execute(self.conn, records.AppointmentRow, query, params)
+            return
+        with self.pool.connection() as conn:
+            yield from records.execute(conn, records.AppointmentRow, query, params)
+
+    @_reads
+    def get_appointments_page(self, status: Optional[str] = None,
+                              date_from: Optional[str] = None,
+                              date_to: Optional[str] = None,
+                              page_size: int = 200,
+                              cursor: Optional[str] = None,
+                              order_by: str = 'date',
+                              descending: bool = True) -> Tuple[List[records.AppointmentRow], Optional[str]]:
+        sort_key = APPOINTMENT_SORT_KEYS[order_by]
+        active, params = queries.appointment_filters(status, date_from, date_to)
+        query = queries.appointment_page(active, order_by, descending, seek=bool(cursor))
+        if cursor:
+            params.extend(queries.appointment_seek_params(order_by, _decode_cursor(cursor)))
+        params.append(page_size + 1)
+        rows = records.fetch_all(self.conn, records.AppointmentRow, query, params)
+        if len(rows) <= page_size:
+            return rows, None
+        rows = rows[:page_size]
+        last = rows[-1]
+        return rows, _encode_cursor([
+            last[key] if last[key] is not None else default for _, key, default in sort_key
+        ])
+
+    CHANGES_LIMIT = 500
+
+    @_reads
+    def get_appointment_changes(self, since: Optional[str] = None,
+                                limit: int = CHANGES_LIMIT) -> Tuple[List[records.AppointmentChange], str]:
+        # Returns appointments written after the `since` watermark, oldest
+        # first, along with those archived since (removed, every other column
+        # NULL), and the watermark to pass next time. Without `since` only the
+        # current watermark is returned. While the newest change is less than
+        # a second old the watermark keeps only its timestamp, so rows stamped
+        # in that same millisecond are sent again on the next poll rather than
+        # risk missing one committed a moment later; callers apply rows
+        # idempotently.
+        if since is None:
+            latest = self.conn.execute(queries.APPOINTMENT_WATERMARK).fetchone()[0]
+            return [], _encode_cursor([latest or '', 0])
+        changed_at, id_appointment = _decode_cursor(since)
+        rows = records.fetch_all(self.conn, records.AppointmentChange, queries.APPOINTMENT_CHANGES,
+                                 {'changed_at': changed_at, 'id_appointment': id_appointment, 'limit': limit})
+        if not rows:
+            return rows, since
+        last = rows[-1]
+        settled = (datetime.now(timezone.utc) - timedelta(seconds=1)).strftime('%Y-%m-%d %H:%M:%S')
+        if len(rows) == limit or last['updated_at'] < settled:
+            return rows, _encode_cursor([last['updated_at'], last['id_appointment']])
+        return rows, _encode_cursor([last['updated_at'], 0])
+
+    @_reads
+    def get_patients(self) -> List[records.Patient]:
+        def load():
+            return records.fetch_all(self.conn, records.Patient,
+                                     f"SELECT {records.columns(records.Patient)} FROM patients ORDER BY fio")
+        return self._cached(('patients',), 'patients', load)
+
+    SEARCH_CANDIDATES = 500
+
+    @_reads
+    def search_patients(self, query: str, limit: int = 20) -> List[records.PatientMatch]:
+        terms = re.findall(r"\w+", query)
+        if not terms:
+            return []
+        match = " ".join(f'"{term}"*' for term in terms)
+        # Short prefixes can match most of the table; rank only the first
+        # SEARCH_CANDIDATES hits so type-ahead stays fast on broad input.
+        return records.fetch_all(self.conn, records.PatientMatch, queries.PATIENT_SEARCH,
+                                 (match, self.SEARCH_CANDIDATES, limit))
+
+    # Common Russian inflection endings, longest first. SQLite has no Russian
+    # stemmer; cutting the ending and matching the rest as a prefix finds
+    # "боль" and "боли" for "болями".
+    _ENDINGS = sorted([
+        'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'иях', 'ией', 'ия', 'ие', 'ий', 'ию',
+        'ая', 'яя', 'ое', 'ее', 'ой', 'ей', 'ые', 'ых', 'их', 'ов', 'ев', 'ах', 'ях', 'ам', 'ям', 'ом', 'ем',
+        'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь',
+    ], key=len, reverse=True)
+    MIN_STEM = 3
+    # Prepositions and conjunctions would match nearly every note as prefixes.
+    STOP_WORDS = frozenset(['в', 'во', 'на', 'по', 'с', 'со', 'и', 'или', 'не', 'без', 'при', 'для', 'от',
+                            'до', 'из', 'к', 'о', 'об', 'у'])
+
+    @classmethod
+    def _stem(cls, term: str) -> str:
+        for ending in cls._ENDINGS:
+            if term.endswith(ending) and len(term) - len(ending) >= cls.MIN_STEM:
+                return term[:-len(ending)]
+        return term
+
+    @staticmethod
+    def _icd_range(prefix: str) -> Tuple[str, str]:
+        # "J0", "j0*" and "J06." all become a half-open range of codes.
+        code = prefix.strip().upper().rstrip("*")
+        if not re.fullmatch(r"[A-Z][0-9A-Z.]*", code):
+            raise ValueError(f"Некорректный код МКБ-10: {prefix}")
+        return code, code[:-1] + chr(ord(code[-1]) + 1)
+
+    RECORD_PAGE_SIZE = 50
+
+    @_reads
+    def search_medical_records(self, query: str = "", icd_prefix: Optional[str] = None,
+                               page_size: int = RECORD_PAGE_SIZE,
+                               cursor: Optional[str] = None) -> Tuple[List[records.RecordMatch], Optional[str]]:
+        # Text queries are ranked by bm25 over the notes and diagnosis; an ICD
+        # prefix alone lists matching records newest first. Either way the
+        # result is one page and a cursor for the next, as in
+        # get_appointments_page. Archived records are not searched.
+        terms = [self._stem(term) for term in re.findall(r"\w+", db.fold_yo_text(query).lower())
+                 if term not in self.STOP_WORDS]
+        if not terms and not icd_prefix:
+            return [], None
+        params = {'limit': page_size + 1}
+        if icd_prefix:
+            params['icd_from'], params['icd_to'] = self._icd_range(icd_prefix)
+        if terms:
+            params['match'] = " ".join(f'"{term}"*' for term in terms)
+            if cursor:
+                params['after_score'], params['after_id'] = _decode_cursor(cursor)
+        elif cursor:
+            params['after_date'], params['after_id'] = _decode_cursor(cursor)
+        query = queries.record_search(bool(terms), bool(icd_prefix), bool(cursor))
+        rows = records.fetch_all(self.conn, records.RecordMatch, query, params)
+        if len(rows) <= page_size:
+            return rows, None
+        rows = rows[:page_size]
+        last = rows[-1]
+        return rows, _encode_cursor([last.score if terms else last.record_date or '', last.id_record])
+
+    @_reads
+    def get_doctors(self, active_only: bool = True) -> List[records.Doctor]:
+        def load():
+            query = f"SELECT {records.columns(records.Doctor)} FROM doctors"
+            if active_only:
+                query += " WHERE is_active = 1"
+            query += " ORDER BY fio"
+            return records.fetch_all(self.conn, records.Doctor, query)
+        return self._cached(('doctors', active_only), 'doctors', load)
+
+    @_reads
+    def get_services(self, active_only: bool = True) -> List[records.Service]:
+        def load():
+            query = f"SELECT {records.columns(records.Service)} FROM service_pricelist"
+            if active_only:
+                query += " WHERE is_active = 1"
+            query += " ORDER BY service_category, service_name"
+            return records.fetch_all(self.conn, records.Service, query)
+        return self._cached(('services', active_only), 'service_pricelist', load)
+
+    @_reads
+    def get_appointment_services(self, id_appointment: int) -> List[records.AppointmentService]:
+        return records.fetch_all(self.conn, records.AppointmentService, """
+            SELECT aps.id, aps.id_appointment, aps.id_service, aps.quantity, aps.price,
+                   sp.service_name, sp.service_category
+            FROM appointment_services aps
+            JOIN service_pricelist sp ON aps.id_service = sp.id_service
+            WHERE aps.id_appointment = ?
+        """, (id_appointment,))
+
+    def _insert_patient(self, fio: str, phone: str, email: str) -> int:
+        cur = self.conn.execute("""
+            INSERT INTO patients (fio, phone, email, registration_date, created_at, updated_at)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+        """, (fio, phone, email, date.today().isoformat()))
+        self._touch('patients')
+        return cur.lastrowid
+
+    def _insert_appointment(self, id_patient: int, id_doctor: int,
+                            appointment_date: str, appointment_time: str,
+                            appointment_type: str, notes: str, price: float,
+                            duration_minutes: int = scheduling.DEFAULT_DURATION_MINUTES) -> int:
+        end_time = scheduling.add_minutes(appointment_time, duration_minutes)
+        scheduling.check_slot(self.conn, id_doctor, appointment_date, appointment_time, end_time)
+        cur = self.conn.execute(f"""
+            INSERT INTO appointments (id_patient, id_doctor, appointment_date, appointment_time, end_time,
+                                       appointment_type, status, price, notes, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, 'Запланирован', ?, ?, CURRENT_TIMESTAMP, {CHANGE_TIMESTAMP})
+        """, (id_patient, id_doctor, appointment_date, appointment_time, end_time, appointment_type, price, notes))
+        return cur.lastrowid
+
+    def _update_appointment(self, id_appointment: int, id_doctor: int, status: str, notes: str, price: float,
+                            duration_minutes: Optional[int] = None):
+        current = self.conn.execute("""
+            SELECT appointment_date, appointment_time, end_time FROM appointments WHERE id_appointment = ?
+        """, (id_appointment,)).fetchone()
+        end_time = current['end_time'] if current else None
+        if current and current['appointment_time']:
+            if duration_minutes is not None or end_time is None:
+                end_time = scheduling.add_minutes(current['appointment_time'],
+                                                  duration_minutes or scheduling.DEFAULT_DURATION_MINUTES)
+            if status not in scheduling.FREE_STATUSES:
+                scheduling.check_slot(self.conn, id_doctor, current['appointment_date'],
+                                      current['appointment_time'], end_time, exclude_id=id_appointment)
+        self.conn.execute(f"""
+            UPDATE appointments SET id_doctor = ?, status = ?, notes = ?, price = ?, end_time = ?,
+                                    updated_at = {CHANGE_TIMESTAMP}
+            WHERE id_appointment = ?
+        """, (id_doctor, status, notes, price, end_time, id_appointment))
+
+    # BEGIN IMMEDIATE takes the write lock before the overlap check, so two
+    # desks cannot both see a slot as free and book it.
+    @contextmanager
+    def _transaction(self):
+        if self.writer is not None and self.writer.is_writer_thread:
+            # The writer already runs this call inside a savepoint of its batch.
+            yield
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+
+    @_writes
+    def create_patient(self, fio: str, phone: str, email: str) -> int:
+        with self._transaction():
+            return self._insert_patient(fio, phone, email)
+
+    @_writes
+    def create_appointment(self, id_patient: int, id_doctor: int,
+                           appointment_date: str, appointment_time: str,
+                           appointment_type: str, notes: str, price: float) -> int:
+        with self._transaction():
+            return self._insert_appointment(id_patient, id_doctor, appointment_date, appointment_time,
+                                            appointment_type, notes, price)
+
+    @_writes
+    def add_appointment_service(self, id_appointment: int, id_service: int, price: float, quantity: int = 1):
+        with self._transaction():
+            self.conn.execute("""
+                INSERT INTO appointment_services (id_appointment, id_service, price, quantity)
+                VALUES (?, ?, ?, ?)
+            """, (id_appointment, id_service, price, quantity))
+
+    @_writes
+    def update_appointment(self, id_appointment: int, id_doctor: int, status: str, notes: str, price: float):
+        with self._transaction():
+            self._update_appointment(id_appointment, id_doctor, status, notes, price)
+
+    @_writes
+    def clear_appointment_services(self, id_appointment: int):
+        with self._transaction():
+            self.conn.execute("DELETE FROM appointment_services WHERE id_appointment = ?", (id_appointment,))
+
+    @_writes
+    def create_appointment_with_services(self, id_patient: Optional[int], id_doctor: int,
+                                         appointment_date: str, appointment_time: str,
+                                         appointment_type: str, notes: str, price: float,
+                                         services: List[dict], patient: Optional[dict] = None) -> int:
+        # services: [{'id_service': ..., 'price': ..., 'quantity': ...}]; a new
+        # patient ({'fio', 'phone', 'email'}) is created when id_patient is None.
+        if id_patient is None and not (patient and (patient.get('fio') or '').strip()):
+            raise ValueError("Не указан пациент: выберите пациента или введите ФИО нового")
+        with self._transaction():
+            duration = scheduling.services_duration(self.conn, services)
+            if id_patient is None:
+                id_patient = self._insert_patient(patient['fio'], patient.get('phone'), patient.get('email'))
+            id_appointment = self._insert_appointment(id_patient, id_doctor, appointment_date,
+                                                      appointment_time, appointment_type, notes, price,
+                                                      duration)
+            self.conn.executemany("""
+                INSERT INTO appointment_services (id_appointment, id_service, price, quantity)
+                VALUES (?, ?, ?, ?)
+            """, [(id_appointment, s['id_service'], s['price'], s.get('quantity', 1)) for s in services])
+        return id_appointment
+
+    @_writes
+    def update_appointment_with_services(self, id_appointment: int, id_doctor: int, status: str,
+                                         notes: str, price: float, services: List[dict]):
+        with self._transaction():
+            duration = scheduling.services_duration(self.conn, services)
+            self._update_appointment(id_appointment, id_doctor, status, notes, price, duration)
+            remaining = {}
+            for row in self.conn.execute("""
+                SELECT id, id_service, price, quantity FROM appointment_services
+                WHERE id_appointment = ? ORDER BY id
+            """, (id_appointment,)):
+                remaining.setdefault(row['id_service'], []).append(row)
+
+            inserts, updates = [], []
+            for s in services:
+                quantity = s.get('quantity', 1)
+                rows = remaining.get(s['id_service'])
+                if rows:
+                    row = rows.pop(0)
+                    if row['price'] != s['price'] or row['quantity'] != quantity:
+                        updates.append((s['price'], quantity, row['id']))
+                else:
+                    inserts.append((id_appointment, s['id_service'], s['price'], quantity))
+            deletes = [(row['id'],) for rows in remaining.values() for row in rows]
+
+            if deletes:
+                self.conn.executemany("DELETE FROM appointment_services WHERE id = ?", deletes)
+            if updates:
+                self.conn.executemany("UPDATE appointment_services SET price = ?, quantity = ? WHERE id = ?", updates)
+            if inserts:
+                self.conn.executemany("""
+                    INSERT INTO appointment_services (id_appointment, id_service, price, quantity)
+                    VALUES (?, ?, ?, ?)
+                """, inserts)
+
+    @_writes
+    def claim_lab_orders(self, worker: str, limit: int = labqueue.DEFAULT_CLAIM_SIZE,
+                         lease_seconds: int = labqueue.DEFAULT_LEASE_SECONDS) -> List[records.LabWorkItem]:
+        started = time.perf_counter()
+        with self._transaction():
+            items, expired = labqueue.claim(self.conn, worker, limit, lease_seconds)
+        self.lab_metrics.record('claim', time.perf_counter() - started,
+                                claims=1, claimed=len(items), expired=expired)
+        return items
+
+    @_writes
+    def post_lab_results(self, worker: str, results: List[Sequence]) -> Tuple[int, List[int]]:
+        # All results are written in one transaction; see labqueue.post_results.
+        started = time.perf_counter()
+        with self._transaction():
+            posted, rejected = labqueue.post_results(self.conn, worker, results)
+        self.lab_metrics.record('post', time.perf_counter() - started,
+                                posts=1, posted=posted, rejected=len(rejected))
+        return posted, rejected
+
+    @_writes
+    def release_lab_orders(self, worker: str, ids: List[int]) -> int:
+        started = time.perf_counter()
+        with self._transaction():
+            released = labqueue.release(self.conn, worker, ids)
+        self.lab_metrics.record('release', time.perf_counter() - started, released=released)
+        return released
+
+    @_reads
+    def get_lab_queue_status(self) -> dict:
+        return {**labqueue.queue_status(self.conn), 'metrics': self.lab_metrics.as_dict()}
+
+    @_reads
+    def find_free_slots(self, count: int = 5, id_doctor: Optional[int] = None,
+                        specialization: Optional[str] = None, after: Optional[str | datetime] = None,
+                        services: Optional[List[dict]] = None) -> List[dict]:
+        if isinstance(after, str):
+            after = datetime.fromisoformat(after)
+        duration = scheduling.services_duration(self.conn, services or [])
+        return scheduling.free_slots(self.conn, count, id_doctor, specialization, after, duration)
+
+    def export_query(self, kind: str, status: Optional[str] = None, date_from: Optional[str] = None,
+                     date_to: Optional[str] = None) -> Tuple[str, str, list]:
+        active, params = queries.appointment_filters(status, date_from, date_to)
+        if kind == 'appointments':
+            query, count_query = queries.appointment_export(active)
+        elif kind == 'medical_records':
+            query, count_query = queries.medical_record_export(active)
+        else:
+            raise ValueError(f"Неизвестный тип экспорта: {kind}")
+        return query, count_query, params
+
+    def _export(self, kind: str, path, status, date_from, date_to, fmt, compress, progress) -> int:
+        import export
+        query, count_query, params = self.export_query(kind, status, date_from, date_to)
+        total = self.conn.execute(count_query, params).fetchone()[0]
+        if progress is not None:
+            progress(0, total)
+        return export.write_rows(self.conn.execute(query, params), path, fmt, compress, total, progress)
+
+    @_reads
+    def export_appointments(self, path, status: Optional[str] = None, date_from: Optional[str] = None,
+                            date_to: Optional[str] = None, fmt: Optional[str] = None,
+                            compress: Optional[bool] = None, progress=None) -> int:
+        return self._export('appointments', path, status, date_from, date_to, fmt, compress, progress)
+
+    @_reads
+    def export_medical_records(self, path, status: Optional[str] = None, date_from: Optional[str] = None,
+                               date_to: Optional[str] = None, fmt: Optional[str] = None,
+                               compress: Optional[bool] = None, progress=None) -> int:
+        return self._export('medical_records', path, status, date_from, date_to, fmt, compress, progress)
+
+    @_reads
+    def get_report(self, name: str, date_from: str, date_to: str) -> List[dict]:
+        import reports
+        return reports.REPORTS[name].build(self.conn, date_from, date_to)
+
+    @_reads
+    def get_patient_appointments(self, id_patient: int, date_from: Optional[str] = None,
+                                 date_to: Optional[str] = None) -> List[records.PatientAppointment]:
+        import archive
+        # Archive files are read only for years that overlap the range.
+        years = archive.archived_years(self.conn, date_from, date_to)
+        rows = []
+        for schema in archive.schemas(self.conn, years):
+            rows.extend(records.fetch_all(self.conn, records.PatientAppointment,
+                                          queries.patient_appointments(schema), (id_patient, date_from, date_to)))
+        if years:
+            rows.sort(key=lambda row: (row['appointment_date'] or '', row['appointment_time'] or ''), reverse=True)
+        return rows
+
+    TIMELINE_LIMIT = 100
+    TIMELINE_START = ['9999-12-31', '', 0, 0]
+
+    @_reads
+    def get_patient_timeline(self, id_patient: int, since: Optional[str] = None,
+                             limit: int = TIMELINE_LIMIT) -> Tuple[List[records.TimelineEvent], Optional[str]]:
+        # Appointments, medical records, prescriptions, lab orders and payments
+        # of one patient, newest first, `limit` events per page, undated events
+        # last. Every query reads only this patient's rows through a
+        # (id_patient, date) index, so the table size does not matter.
+        import archive
+        event_date, event_time, rank, event_id = _decode_cursor(since) if since else self.TIMELINE_START
+        params = {'patient': id_patient, 'date': event_date, 'time': event_time,
+                  'rank': rank, 'id': event_id, 'limit': limit + 1}
+        rows = records.fetch_all(self.conn, records.TimelineEvent, queries.patient_timeline("main"), params)
+        # Archives hold older history, so they are read newest first and only
+        # until the page is full of events later than anything the next one
+        # holds. Past the dated events ('' sorts last) any archive may hold
+        # undated ones.
+        for year, _, last_date in reversed(archive.catalog(self.conn, None, event_date or None)):
+            if len(rows) > limit and rows[limit].event_date > last_date:
+                break
+            for schema in archive.schemas(self.conn, [year], main=False):
+                rows.extend(records.fetch_all(self.conn, records.TimelineEvent,
+                                              queries.patient_timeline(schema), params))
+            rows.sort(key=lambda row: (row.event_date, row.event_time, row.rank, row.id), reverse=True)
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        last = rows[-1]
+        return rows, _encode_cursor([last.event_date, last.event_time, last.rank, last.id])
+
+    @_reads
+    def get_appointment_by_id(self, id_appointment: int) -> Optional[records.AppointmentDetail]:
+        return records.fetch_one(self.conn, records.AppointmentDetail, queries.APPOINTMENT_BY_ID, (id_appointment,))
+
+    @_reads
+    def authenticate(self, login: str, password: str) -> Optional[dict]:
+        cur = self.conn.execute("""
+            SELECT u.*, p.fio as patient_fio
+            FROM users u
+            LEFT JOIN patients p ON u.id_patient = p.id_patient
+            WHERE u.login = ? AND u.password = ?
+        """, (login, password))
+        row = cur.fetchone()
+        return dict(row) if row else None
@@ -0,0 +1,319 @@
+import argparse
+import random
+import sqlite3
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+import db
+import scheduling
+
+
+LAST_NAMES = [
+    'Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Соколов',
+    'Михайлов', 'Новиков', 'Фёдоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семёнов',
+    'Егоров', 'Павлов', 'Козлов', 'Степанов', 'Николаев', 'Орлов', 'Андреев', 'Макаров',
+]
+MALE_NAMES = ['Александр', 'Алексей', 'Андрей', 'Дмитрий', 'Иван', 'Игорь', 'Михаил', 'Николай',
+              'Олег', 'Павел', 'Сергей', 'Юрий']
+FEMALE_NAMES = ['Анна', 'Елена', 'Екатерина', 'Ирина', 'Мария', 'Наталья', 'Ольга', 'Светлана',
+                'Татьяна', 'Юлия']
+PATRONYMIC_ROOTS = ['Александров', 'Алексеев', 'Андреев', 'Викторов', 'Дмитриев', 'Иванов',
+                    'Михайлов', 'Николаев', 'Петров', 'Сергеев']
+STREETS = ['Ленина', 'Пушкина', 'Горького', 'Гагарина', 'Мира', 'Советская', 'Садовая', 'Лесная']
+INSURERS = ['Страховая Компания 1', 'Страховая Компания 2', 'Страховая Компания 3']
+SPECIALIZATIONS = ['Терапевт', 'Хирург', 'Педиатр', 'Кардиолог', 'Невролог', 'Офтальмолог',
+                   'Отоларинголог', 'Эндокринолог', 'Дерматолог', 'Гастроэнтеролог']
+# name, category, duration in minutes, paid price
+SERVICES = [
+    ('Консультация терапевта', 'Консультация', 30, 1800),
+    ('Консультация хирурга', 'Консультация', 30, 2000),
+    ('Консультация педиатра', 'Консультация', 30, 1900),
+    ('Консультация кардиолога', 'Консультация', 30, 2500),
+    ('Консультация невролога', 'Консультация', 30, 2300),
+    ('Повторная консультация', 'Консультация', 15, 1200),
+    ('ЭКГ', 'Диагностика', 15, 900),
+    ('УЗИ брюшной полости', 'Диагностика', 30, 2200),
+    ('УЗИ щитовидной железы', 'Диагностика', 15, 1500),
+    ('Измерение внутриглазного давления', 'Диагностика', 15, 600),
+    ('Забор крови', 'Процедуры', 15, 300),
+    ('Внутримышечная инъекция', 'Процедуры', 15, 350),
+    ('Перевязка', 'Процедуры', 15, 700),
+    ('Снятие швов', 'Процедуры', 15, 800),
+    ('Вакцинация', 'Профилактика', 15, 1000),
+    ('Профилактический осмотр', 'Профилактика', 30, 1500),
+]
+DIAGNOSES = [
+    ('J06.9', 'Острая инфекция верхних дыхательных путей', 'Кашель, насморк, температура'),
+    ('R51', 'Головная боль', 'Головная боль'),
+    ('R10.4', 'Боль в области живота', 'Боль в животе'),
+    ('R05', 'Кашель', 'Кашель'),
+    ('I10', 'Эссенциальная гипертензия', 'Повышенное давление, головокружение'),
+    ('K29.7', 'Гастрит неуточнённый', 'Изжога, боль в эпигастрии'),
+    ('M54.5', 'Боль внизу спины', 'Боль в пояснице'),
+    ('E11.9', 'Сахарный диабет 2 типа без осложнений', 'Жажда, слабость'),
+    ('H52.1', 'Миопия', 'Снижение зрения вдаль'),
+    ('L20.9', 'Атопический дерматит неуточнённый', 'Зуд, сыпь'),
+    ('Z00.0', 'Общий медицинский осмотр', 'Жалоб нет'),
+]
+MEDICATIONS = [('Парацетамол', '500 мг'), ('Ибупрофен', '200 мг'), ('Амоксициллин', '500 мг'),
+               ('Омепразол', '20 мг'), ('Лизиноприл', '10 мг'), ('Метформин', '850 мг'),
+               ('Цетиризин', '10 мг')]
+LAB_TESTS = ['Общий анализ крови', 'Анализ мочи', 'Биохимический анализ крови', 'Глюкоза крови',
+             'Липидный профиль', 'ТТГ']
+
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = 18
+OCCUPANCY = 0.8
+CHUNK_SIZE = 10_000
+
+
+def _fio(rng: random.Random) -> tuple[str, str]:
+    last = rng.choice(LAST_NAMES)
+    root = rng.choice(PATRONYMIC_ROOTS)
+    if rng.random() < 0.55:
+        return f"{last}а {rng.choice(FEMALE_NAMES)} {root}на", 'Ж'
+    return f"{last} {rng.choice(MALE_NAMES)} {root}ич", 'M'
+
+
+def _chunks(rows, size: int = CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _insert(conn: sqlite3.Connection, sql: str, rows) -> int:
+    total = 0
+    for chunk in _chunks(rows):
+        with conn:
+            conn.executemany(sql, chunk)
+        total += len(chunk)
+    return total
+
+
+def _patients(rng: random.Random, count: int, today: date):
+    for i in range(1, count + 1):
+        fio, gender = _fio(rng)
+        birth = today - timedelta(days=rng.randrange(365, 365 * 90))
+        insurance = rng.choices(['ОМС', 'ДМС', 'Платно'], weights=[70, 20, 10])[0]
+        registered = today - timedelta(days=rng.randrange(0, 365 * 10))
+        yield (
+            i, f"MC{i:07d}", fio, birth.isoformat(), gender,
+            f"ул. {rng.choice(STREETS)}, д. {rng.randrange(1, 120)}, кв. {rng.randrange(1, 300)}",
+            f"79{rng.randrange(10 ** 9):09d}", f"patient{i}@mail.ru",
+            f"{rng.randrange(1000, 10000)}", f"{rng.randrange(100000, 1000000)}",
+            f"INS{i:08d}", insurance, rng.choice(INSURERS) if insurance != 'Платно' else None,
+            registered.isoformat(),
+        )
+
+
+def _doctors(rng: random.Random, count: int, today: date):
+    for i in range(1, count + 1):
+        fio, _ = _fio(rng)
+        yield (
+            i, fio, SPECIALIZATIONS[(i - 1) % len(SPECIALIZATIONS)], f"LN{i:05d}",
+            f"79{rng.randrange(10 ** 9):09d}", f"doctor{i}@clinic.ru", str(100 + i),
+            (today - timedelta(days=rng.randrange(30, 365 * 20))).isoformat(),
+            rng.choice([1200, 1300, 1500, 1800, 2000]), 1,
+        )
+
+
+def _status(rng: random.Random, day: date, today: date) -> str:
+    if day < today:
+        return rng.choices(['Завершен', 'Не явился', 'Отменен'], weights=[85, 8, 7])[0]
+    if day == today:
+        return rng.choices(['Завершен', 'На приеме', 'Запланирован'], weights=[40, 10, 50])[0]
+    return rng.choices(['Запланирован', 'Отменен'], weights=[95, 5])[0]
+
+
+def generate(db_path: str | Path, appointments: int = 100_000, seed: int = 42,
+             today: Optional[date] = None, progress=print) -> dict:
+    rng = random.Random(seed)
+    today = today or date.today()
+    n_doctors = max(10, appointments // 5000)
+    n_patients = max(100, appointments // 5)
+
+    path = db.setup_database(db_path, seed=False, profile="bulk-load")
+    conn = db.get_connection(path, "bulk-load")
+    if conn.execute("SELECT 1 FROM appointments LIMIT 1").fetchone():
+        raise ValueError(f"{path} already contains data")
+    started = time.perf_counter()
+    counts = {}
+
+    counts['patients'] = _insert(conn, """
+        INSERT INTO patients (id_patient, medical_card_number, fio, birth_date, gender, address, phone, email,
+                              passport_series, passport_number, insurance_policy_number, insurance_type,
+                              insurance_company, registration_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, _patients(rng, n_patients, today))
+    insurance = [None] + [row[0] for row in conn.execute("SELECT insurance_type FROM patients ORDER BY id_patient")]
+
+    counts['doctors'] = _insert(conn, """
+        INSERT INTO doctors (id_doctor, fio, specialization, license_number, phone, email, office_number,
+                             hire_date, consultation_price, is_active)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, _doctors(rng, n_doctors, today))
+    counts['doctor_schedules'] = _insert(conn, """
+        INSERT INTO doctor_schedules (id_doctor, weekday, start_time, end_time) VALUES (?, ?, ?, ?)
+    """, ((d, weekday, "09:00:00", "18:00:00") for d in range(1, n_doctors + 1) for weekday in range(5)))
+
+    counts['service_pricelist'] = _insert(conn, """
+        INSERT INTO service_pricelist (id_service, service_name, service_category, price_oms, price_dms,
+                                       price_paid, duration_minutes, is_active)
+        VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+    """, ((i, name, category, round(price * 0.6), round(price * 0.8), price, duration)
+          for i, (name, category, duration, price) in enumerate(SERVICES, start=1)))
+    price_columns = {'ОМС': 3, 'ДМС': 4, 'Платно': 5}
+    services = [(i, name, category, round(price * 0.6), round(price * 0.8), price)
+                for i, (name, category, _, price) in enumerate(SERVICES, start=1)]
+
+    counts['users'] = _insert(conn, """
+        INSERT INTO users (login, password, role, id_patient) VALUES (?, ?, ?, ?)
+    """, [('admin', 'admin', 'admin', None)] +
+        [(f"patient{i}", f"patient{i}", 'client', i) for i in range(1, n_patients + 1)])
+
+    per_day = n_doctors * SLOTS_PER_DAY * OCCUPANCY
+    working_days = int(appointments / per_day) + 1
+    start_day = today - timedelta(days=working_days * 7 // 5 - 14)
+
+    def slots():
+        day = start_day
+        while True:
+            if day.weekday() < 5:
+                for id_doctor in range(1, n_doctors + 1):
+                    for slot in range(SLOTS_PER_DAY):
+                        if rng.random() < OCCUPANCY:
+                            yield day, id_doctor, scheduling.from_minutes(9 * 60 + slot * SLOT_MINUTES)
+            day += timedelta(days=1)
+
+    # Rows are stamped when their visit took place, but never later than the
+    # end of `today` or the current UTC time (the clock of CHANGE_TIMESTAMP in
+    # database.py). A stamp in the future would hold the change feed's
+    # watermark ahead of every real edit.
+    latest_stamp = min(f"{today.isoformat()} 23:59:59",
+                       datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"))
+    ids = {'record': 0, 'prescription': 0, 'lab_order': 0, 'payment': 0, 'line': 0}
+    counts.update({'appointments': 0, 'appointment_services': 0, 'medical_records': 0,
+                   'prescriptions': 0, 'lab_orders': 0, 'payments': 0})
+    slot_iter = slots()
+    id_appointment = 0
+    while id_appointment < appointments:
+        batch = {key: [] for key in ('appointments', 'appointment_services', 'medical_records',
+                                     'prescriptions', 'lab_orders', 'payments')}
+        for _ in range(min(CHUNK_SIZE, appointments - id_appointment)):
+            id_appointment += 1
+            day, id_doctor, start = next(slot_iter)
+            id_patient = rng.randrange(1, n_patients + 1)
+            status = _status(rng, day, today)
+            kind = rng.choices(['Первичный', 'Повторный', 'Профилактический'], weights=[50, 35, 15])[0]
+            lines = rng.sample(services, rng.choice([1, 1, 1, 2, 2, 3]))
+            column = price_columns[insurance[id_patient]]
+            total = sum(s[column] for s in lines)
+            stamp = min(f"{day.isoformat()} {start}", latest_stamp)
+            batch['appointments'].append((
+                id_appointment, id_patient, id_doctor, day.isoformat(), start,
+                scheduling.add_minutes(start, SLOT_MINUTES), kind, status, total, None, stamp, stamp,
+            ))
+            for s in lines:
+                ids['line'] += 1
+                batch['appointment_services'].append((ids['line'], id_appointment, s[0], 1, s[column], stamp))
+            if status != 'Завершен':
+                continue
+
+            ids['record'] += 1
+            code, description, complaint = rng.choice(DIAGNOSES)
+            batch['medical_records'].append((
+                ids['record'], id_appointment, id_patient, id_doctor, day.isoformat(), complaint,
+                'Общий осмотр', code, description, 'Наблюдение, повторный приём по показаниям', stamp, stamp,
+            ))
+            if rng.random() < 0.6:
+                for medication, dosage in rng.sample(MEDICATIONS, rng.choice([1, 1, 2])):
+                    ids['prescription'] += 1
+                    batch['prescriptions'].append((
+                        ids['prescription'], ids['record'], id_patient, id_doctor, day.isoformat(),
+                        medication, dosage, rng.choice([3, 5, 7, 10, 14]), '2 раза в день',
+                        1 if (today - day).days < 14 else 0, stamp, stamp,
+                    ))
+            if rng.random() < 0.3:
+                ids['lab_order'] += 1
+                age = (today - day).days
+                lab_status = 'Назначен' if age < 3 else rng.choices(['Выполнен', 'Отменен'], weights=[95, 5])[0]
+                result_date = (day + timedelta(days=rng.randrange(1, 3))).isoformat() \
+                    if lab_status == 'Выполнен' else None
+                batch['lab_orders'].append((
+                    ids['lab_order'], ids['record'], id_patient, id_doctor, day.isoformat(),
+                    rng.choice(LAB_TESTS), lab_status, result_date,
+                    'В пределах нормы' if result_date else None, stamp, stamp,
+                ))
+            method = 'По полису' if insurance[id_patient] != 'Платно' else rng.choice(['Наличные', 'Карта'])
+            for s in lines:
+                ids['payment'] += 1
+                batch['payments'].append((
+                    ids['payment'], id_appointment, s[0], day.isoformat(), s[column], method,
+                    rng.choices(['Оплачен', 'Ожидает', 'Частично оплачен'], weights=[92, 5, 3])[0], stamp, stamp,
+                ))
+
+        with conn:
+            conn.executemany("""
+                INSERT INTO appointments (id_appointment, id_patient, id_doctor, appointment_date,
+                                          appointment_time, end_time, appointment_type, status, price, notes,
+                                          created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, batch['appointments'])
+            conn.executemany("""
+                INSERT INTO appointment_services (id, id_appointment, id_service, quantity, price, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, batch['appointment_services'])
+            conn.executemany("""
+                INSERT INTO medical_records (id_record, id_appointment, id_patient, id_doctor, record_date,
+                                             complaints, examination, diagnosis_icd10, diagnosis_description,
+                                             treatment_plan, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, batch['medical_records'])
+            conn.executemany("""
+                INSERT INTO prescriptions (id_prescription, id_record, id_patient, id_doctor, prescription_date,
+                                           medication_name, dosage, duration_days, instructions, is_active,
+                                           created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, batch['prescriptions'])
+            conn.executemany("""
+                INSERT INTO lab_orders (id_lab_order, id_record, id_patient, id_doctor, order_date, test_name,
+                                        status, result_date, result_text, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, batch['lab_orders'])
+            conn.executemany("""
+                INSERT INTO payments (id_payment, id_appointment, id_service, payment_date, amount,
+                                      payment_method, payment_status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, batch['payments'])
+        for key, rows in batch.items():
+            counts[key] += len(rows)
+        if progress:
+            progress(f"appointments: {id_appointment}/{appointments}")
+
+    conn.execute("ANALYZE")
+    conn.close()
+    counts['seconds'] = round(time.perf_counter() - started, 2)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill a new database with synthetic clinic data")
+    parser.add_argument("path")
+    parser.add_argument("--appointments", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--today", type=date.fromisoformat, default=None,
+                        help="reference date (YYYY-MM-DD); fix it for reproducible output")
+    args = parser.parse_args()
+    for table, count in generate(args.path, args.appointments, args.seed, args.today).items():
+        print(f"{table}: {count}")
+
+
+if __name__ == "__main__":
+    main()
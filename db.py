@@ -1,16 +1,88 @@
 import sqlite3
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
 
 
 DEFAULT_DB_PATH = Path(__file__).with_name("medical_clinic.sqlite3")
 
 
-def get_connection(db_path: Optional[str | Path] = None) -> sqlite3.Connection:
+DEFAULT_PROFILE = "desktop"
+
+# Appointment writes stamp updated_at with milliseconds so the change feed can
+# tell apart edits made within the same second. Both formats sort as text.
+CHANGE_TIMESTAMP = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+# Prepared statements sqlite3 keeps per connection (its default is 128);
+# queries.STATEMENTS alone holds several hundred variants.
+STATEMENT_CACHE_SIZE = 1024
+
+# Negative cache_size is in KiB, mmap_size in bytes, busy_timeout in ms.
+CONNECTION_PROFILES: dict[str, dict[str, object]] = {
+    "desktop": {
+        "journal_mode": "wal",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,
+        "mmap_size": 64 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    "server": {
+        "journal_mode": "wal",
+        "synchronous": "NORMAL",
+        "cache_size": -128000,
+        "mmap_size": 512 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 15000,
+    },
+    "bulk-load": {
+        "journal_mode": "wal",
+        "synchronous": "OFF",
+        "cache_size": -512000,
+        "mmap_size": 1024 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 60000,
+    },
+}
+
+
+def apply_profile(conn: sqlite3.Connection, profile: str = DEFAULT_PROFILE) -> dict[str, object]:
+    if profile not in CONNECTION_PROFILES:
+        raise ValueError(f"Unknown connection profile: {profile}")
+    for pragma, value in CONNECTION_PROFILES[profile].items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+    return read_settings(conn)
+
+
+_PRAGMA_NAMES = {
+    "synchronous": {0: "OFF", 1: "NORMAL", 2: "FULL", 3: "EXTRA"},
+    "temp_store": {0: "DEFAULT", 1: "FILE", 2: "MEMORY"},
+}
+
+
+def read_settings(conn: sqlite3.Connection) -> dict[str, object]:
+    settings = {}
+    for pragma in ("journal_mode", "synchronous", "cache_size", "mmap_size", "temp_store", "busy_timeout"):
+        value = conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+        settings[pragma] = _PRAGMA_NAMES.get(pragma, {}).get(value, value)
+    return settings
+
+
+def get_connection(db_path: Optional[str | Path] = None,
+                   profile: Optional[str] = None, instrumentation=None,
+                   read_only: bool = False) -> sqlite3.Connection:
     path = Path(db_path) if db_path is not None else DEFAULT_DB_PATH
-    conn = sqlite3.connect(path)
+    if read_only:
+        # Pooled readers move between threads, one at a time.
+        conn = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+    else:
+        conn = sqlite3.connect(path, cached_statements=STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON;")
+    if profile is not None:
+        apply_profile(conn, profile)
+    if instrumentation is not None:
+        instrumentation.attach_connection(conn)
     return conn
 
 
@@ -171,6 +243,451 @@ def init_db(conn: sqlite3.Connection) -> None:
     )
 
 
+SCHEMA_VERSION_TABLE = "schema_version"
+
+
+def _add_column(conn: sqlite3.Connection, table: str, column: str, declaration: str) -> None:
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+
+def _migrate_scheduling(conn: sqlite3.Connection) -> None:
+    _add_column(conn, "appointments", "end_time", "TEXT")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS doctor_schedules (
+            id_doctor INTEGER NOT NULL,
+            weekday INTEGER NOT NULL CHECK (weekday BETWEEN 0 AND 6),
+            start_time TEXT NOT NULL,
+            end_time TEXT NOT NULL,
+            PRIMARY KEY (id_doctor, weekday, start_time),
+            FOREIGN KEY (id_doctor) REFERENCES doctors(id_doctor)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        """
+        UPDATE appointments SET end_time = time(appointment_time, '+' || COALESCE((
+            SELECT SUM(sp.duration_minutes * COALESCE(aps.quantity, 1))
+            FROM appointment_services aps
+            JOIN service_pricelist sp ON aps.id_service = sp.id_service
+            WHERE aps.id_appointment = appointments.id_appointment
+        ), 30) || ' minutes')
+        WHERE end_time IS NULL
+        """
+    )
+    conn.execute("DROP INDEX IF EXISTS idx_appointments_doctor_date")
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_appointments_doctor_slot
+            ON appointments (id_doctor, appointment_date, appointment_time, end_time, status)
+        """
+    )
+
+
+# Aggregates recomputed from the base tables; used both for the initial fill
+# and by stats.rebuild(). NULL keys are folded to '' / 0 so that they can be
+# part of the primary key and matched by the triggers.
+DAILY_DOCTOR_STATS_SELECT = """
+    SELECT COALESCE(appointment_date, ''), COALESCE(id_doctor, 0), COALESCE(status, ''),
+           COUNT(*), COALESCE(SUM(price), 0)
+    FROM appointments
+    GROUP BY 1, 2, 3
+"""
+DAILY_REVENUE_SELECT = """
+    SELECT COALESCE(payment_date, ''), COALESCE(payment_method, ''), COALESCE(payment_status, ''),
+           COUNT(*), COALESCE(SUM(amount), 0)
+    FROM payments
+    GROUP BY 1, 2, 3
+"""
+
+
+def _stats_triggers(table: str, source: str, keys: list[tuple[str, str, str]],
+                    count: str, total: str, value: str, delete_guard: str = "") -> list[str]:
+    # keys: (stats column, source column, default for NULL); delete_guard is an
+    # optional WHEN condition for the delete trigger.
+    columns = ", ".join(column for column, _, _ in keys)
+
+    def key_values(row):
+        return ", ".join(f"COALESCE({row}.{col}, {default})" for _, col, default in keys)
+
+    def key_match(row):
+        return " AND ".join(f"{column} = COALESCE({row}.{col}, {default})" for column, col, default in keys)
+
+    def add(row):
+        return f"""
+            INSERT INTO {table} ({columns}, {count}, {total})
+            VALUES ({key_values(row)}, 1, COALESCE({row}.{value}, 0))
+            ON CONFLICT ({columns}) DO UPDATE SET
+                {count} = {count} + 1, {total} = {total} + excluded.{total};
+        """
+
+    def remove(row):
+        return f"""
+            UPDATE {table} SET {count} = {count} - 1, {total} = {total} - COALESCE({row}.{value}, 0)
+            WHERE {key_match(row)};
+            DELETE FROM {table} WHERE {key_match(row)} AND {count} <= 0;
+        """
+
+    watched = ", ".join([col for _, col, _ in keys] + [value])
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON {source} BEGIN {add('new')} END",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON {source}
+            {f"WHEN {delete_guard}" if delete_guard else ""} BEGIN {remove('old')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE OF {watched} ON {source} BEGIN
+            {remove('old')} {add('new')} END""",
+    ]
+
+
+STATS_TRIGGERS = [
+    ("daily_doctor_stats", "appointments",
+     [("stat_date", "appointment_date", "''"), ("id_doctor", "id_doctor", "0"), ("status", "status", "''")],
+     "visits", "revenue", "price"),
+    ("daily_revenue", "payments",
+     [("pay_date", "payment_date", "''"), ("payment_method", "payment_method", "''"),
+      ("payment_status", "payment_status", "''")],
+     "payments", "amount", "amount"),
+]
+
+
+def _migrate_stats(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS daily_doctor_stats (
+            stat_date TEXT NOT NULL,
+            id_doctor INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            visits INTEGER NOT NULL,
+            revenue NUMERIC NOT NULL,
+            PRIMARY KEY (stat_date, id_doctor, status)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS daily_revenue (
+            pay_date TEXT NOT NULL,
+            payment_method TEXT NOT NULL,
+            payment_status TEXT NOT NULL,
+            payments INTEGER NOT NULL,
+            amount NUMERIC NOT NULL,
+            PRIMARY KEY (pay_date, payment_method, payment_status)
+        ) WITHOUT ROWID
+        """
+    )
+    triggers = [statement for args in STATS_TRIGGERS for statement in _stats_triggers(*args)]
+    for statement in triggers:
+        conn.execute(statement)
+    conn.execute(f"INSERT OR REPLACE INTO daily_doctor_stats {DAILY_DOCTOR_STATS_SELECT}")
+    conn.execute(f"INSERT OR REPLACE INTO daily_revenue {DAILY_REVENUE_SELECT}")
+
+
+# Set by archive.py while it moves rows out; the daily statistics keep
+# counting archived rows instead of losing them to the delete triggers.
+ARCHIVING_FLAG = "archiving"
+
+
+def _migrate_archive(conn: sqlite3.Connection) -> None:
+    conn.execute("CREATE TABLE IF NOT EXISTS maintenance_flags (name TEXT PRIMARY KEY) WITHOUT ROWID")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS archive_catalog (
+            year INTEGER PRIMARY KEY,
+            first_date TEXT NOT NULL,
+            last_date TEXT NOT NULL,
+            appointments INTEGER NOT NULL,
+            archived_at TEXT DEFAULT (CURRENT_TIMESTAMP)
+        )
+        """
+    )
+    guard = f"NOT EXISTS (SELECT 1 FROM maintenance_flags WHERE name = '{ARCHIVING_FLAG}')"
+    for args in STATS_TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {args[0]}_ad")
+        conn.execute(_stats_triggers(*args, delete_guard=guard)[1])
+
+
+RECORD_SEARCH_COLUMNS = ["complaints", "examination", "diagnosis_icd10", "diagnosis_description", "treatment_plan"]
+# bm25 weights in RECORD_SEARCH_COLUMNS order: a hit in the diagnosis counts
+# for more than one in free-text notes.
+RECORD_SEARCH_RANK = "bm25(1.0, 1.0, 4.0, 4.0, 1.0)"
+
+
+def fold_yo(expr: str) -> str:
+    # unicode61 keeps ё and е apart; Russian text uses them interchangeably.
+    return f"replace(replace({expr}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def fold_yo_text(text: str) -> str:
+    return text.replace("ё", "е").replace("Ё", "Е")
+
+
+def _migrate_record_search(conn: sqlite3.Connection) -> None:
+    # The index reads its content through a view with ё folded, so that
+    # 'rebuild', snippets and the triggers below all see the same text.
+    columns = ", ".join(RECORD_SEARCH_COLUMNS)
+    folded = ", ".join(f"{fold_yo(column)} AS {column}" for column in RECORD_SEARCH_COLUMNS)
+    conn.execute(f"CREATE VIEW IF NOT EXISTS medical_records_search AS SELECT id_record, {folded} FROM medical_records")
+    conn.execute(
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS medical_records_fts USING fts5(
+            {columns},
+            content='medical_records_search', content_rowid='id_record',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3 4'
+        )
+        """
+    )
+
+    def values(row: str) -> str:
+        return ", ".join(fold_yo(f"{row}.{column}") for column in RECORD_SEARCH_COLUMNS)
+
+    insert = f"INSERT INTO medical_records_fts (rowid, {columns}) VALUES (new.id_record, {values('new')});"
+    delete = (f"INSERT INTO medical_records_fts (medical_records_fts, rowid, {columns}) "
+              f"VALUES ('delete', old.id_record, {values('old')});")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS medical_records_fts_ai AFTER INSERT ON medical_records "
+                 f"BEGIN {insert} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS medical_records_fts_ad AFTER DELETE ON medical_records "
+                 f"BEGIN {delete} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS medical_records_fts_au AFTER UPDATE OF {columns} "
+                 f"ON medical_records BEGIN {delete} {insert} END")
+    conn.execute("INSERT INTO medical_records_fts (medical_records_fts, rank) VALUES ('rank', ?)",
+                 (RECORD_SEARCH_RANK,))
+    conn.execute("INSERT INTO medical_records_fts (medical_records_fts) VALUES ('rebuild')")
+    # ICD-10 codes sort by chapter, so "everything under J0" is a range scan.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_medical_records_icd ON medical_records (diagnosis_icd10, record_date)")
+
+
+# One index per sortable appointment grid column, on the same expression the
+# ORDER BY uses, so an unfiltered page stops after one page of rows instead
+# of sorting the whole table. The appointment indexes go on to the primary
+# key, the tie-breaker of every sort, and then the grid's filter columns, so
+# a filtered page tests the filter on the index without reading the table.
+GRID_FILTER_COLUMNS = "status, appointment_date"
+GRID_SORT_INDEXES = [
+    ("idx_appointments_time", "appointments", f"appointment_time, id_appointment, {GRID_FILTER_COLUMNS}"),
+    ("idx_appointments_type", "appointments", f"COALESCE(appointment_type, ''), id_appointment, {GRID_FILTER_COLUMNS}"),
+    ("idx_appointments_price", "appointments", f"COALESCE(price, 0), id_appointment, {GRID_FILTER_COLUMNS}"),
+    ("idx_appointments_status", "appointments", "status, id_appointment, appointment_date"),
+    ("idx_patients_fio_sort", "patients", "COALESCE(fio, '')"),
+    ("idx_doctors_fio_sort", "doctors", "COALESCE(fio, '')"),
+]
+
+
+def _migrate_grid_sort(conn: sqlite3.Connection) -> None:
+    analyzed = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()
+    for name, table, columns in GRID_SORT_INDEXES:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+        # Without statistics for the new index the planner keeps sorting by
+        # doctor or patient through a full join.
+        if analyzed:
+            conn.execute(f"ANALYZE {name}")
+
+
+def _migrate_grid_filters(conn: sqlite3.Connection) -> None:
+    # Recreates the appointment sort indexes of migration 11 with the filter
+    # columns added to GRID_SORT_INDEXES since.
+    for name, table, _ in GRID_SORT_INDEXES:
+        if table == "appointments":
+            conn.execute(f"DROP INDEX IF EXISTS {name}")
+    _migrate_grid_sort(conn)
+
+
+def _migrate_lab_queue(conn: sqlite3.Connection) -> None:
+    _add_column(conn, "lab_orders", "claimed_by", "TEXT")
+    _add_column(conn, "lab_orders", "claimed_at", "TEXT")
+    # Both indexes cover only open orders, so they stay as small as the queue
+    # however many completed orders pile up. Queries have to repeat the WHERE
+    # clause literally for SQLite to use them.
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_lab_orders_queue ON lab_orders (order_date, id_lab_order)
+        WHERE status = 'Назначен' AND claimed_by IS NULL
+        """
+    )
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_lab_orders_claims ON lab_orders (claimed_by, claimed_at)
+        WHERE status = 'Назначен' AND claimed_by IS NOT NULL
+        """
+    )
+
+
+# A step is either an SQL script or a callable taking the connection; both run
+# inside one transaction together with the schema_version insert.
+MIGRATIONS: list[tuple[int, str, str | Callable[[sqlite3.Connection], None]]] = [
+    (
+        1,
+        "appointment query indexes",
+        """
+        CREATE INDEX IF NOT EXISTS idx_appointments_date_time
+            ON appointments (appointment_date, appointment_time);
+        CREATE INDEX IF NOT EXISTS idx_appointments_status_date
+            ON appointments (status, appointment_date, appointment_time);
+        CREATE INDEX IF NOT EXISTS idx_appointments_patient_date
+            ON appointments (id_patient, appointment_date, appointment_time);
+        CREATE INDEX IF NOT EXISTS idx_appointments_doctor_date
+            ON appointments (id_doctor, appointment_date, appointment_time);
+        """,
+    ),
+    (
+        2,
+        "foreign key indexes",
+        """
+        CREATE INDEX IF NOT EXISTS idx_medical_records_appointment ON medical_records (id_appointment);
+        CREATE INDEX IF NOT EXISTS idx_medical_records_patient ON medical_records (id_patient);
+        CREATE INDEX IF NOT EXISTS idx_medical_records_doctor ON medical_records (id_doctor);
+        CREATE INDEX IF NOT EXISTS idx_prescriptions_record ON prescriptions (id_record);
+        CREATE INDEX IF NOT EXISTS idx_prescriptions_patient ON prescriptions (id_patient);
+        CREATE INDEX IF NOT EXISTS idx_prescriptions_doctor ON prescriptions (id_doctor);
+        CREATE INDEX IF NOT EXISTS idx_lab_orders_record ON lab_orders (id_record);
+        CREATE INDEX IF NOT EXISTS idx_lab_orders_patient ON lab_orders (id_patient);
+        CREATE INDEX IF NOT EXISTS idx_lab_orders_doctor ON lab_orders (id_doctor);
+        CREATE INDEX IF NOT EXISTS idx_payments_appointment ON payments (id_appointment);
+        CREATE INDEX IF NOT EXISTS idx_payments_service ON payments (id_service);
+        CREATE INDEX IF NOT EXISTS idx_appointment_services_appointment ON appointment_services (id_appointment);
+        CREATE INDEX IF NOT EXISTS idx_appointment_services_service ON appointment_services (id_service);
+        CREATE INDEX IF NOT EXISTS idx_users_patient ON users (id_patient);
+        """,
+    ),
+    (
+        3,
+        "patient search index",
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts USING fts5(
+            fio, phone, medical_card_number, insurance_policy_number,
+            passport_series, passport_number,
+            content='patients', content_rowid='id_patient',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3 4'
+        );
+
+        CREATE TRIGGER IF NOT EXISTS patients_fts_ai AFTER INSERT ON patients BEGIN
+            INSERT INTO patients_fts (rowid, fio, phone, medical_card_number, insurance_policy_number,
+                                      passport_series, passport_number)
+            VALUES (new.id_patient, new.fio, new.phone, new.medical_card_number, new.insurance_policy_number,
+                    new.passport_series, new.passport_number);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS patients_fts_ad AFTER DELETE ON patients BEGIN
+            INSERT INTO patients_fts (patients_fts, rowid, fio, phone, medical_card_number,
+                                      insurance_policy_number, passport_series, passport_number)
+            VALUES ('delete', old.id_patient, old.fio, old.phone, old.medical_card_number,
+                    old.insurance_policy_number, old.passport_series, old.passport_number);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS patients_fts_au AFTER UPDATE ON patients BEGIN
+            INSERT INTO patients_fts (patients_fts, rowid, fio, phone, medical_card_number,
+                                      insurance_policy_number, passport_series, passport_number)
+            VALUES ('delete', old.id_patient, old.fio, old.phone, old.medical_card_number,
+                    old.insurance_policy_number, old.passport_series, old.passport_number);
+            INSERT INTO patients_fts (rowid, fio, phone, medical_card_number, insurance_policy_number,
+                                      passport_series, passport_number)
+            VALUES (new.id_patient, new.fio, new.phone, new.medical_card_number, new.insurance_policy_number,
+                    new.passport_series, new.passport_number);
+        END;
+
+        INSERT INTO patients_fts (patients_fts) VALUES ('rebuild');
+        """,
+    ),
+    (4, "doctor schedules and appointment end time", _migrate_scheduling),
+    (5, "daily statistics tables", _migrate_stats),
+    (
+        6,
+        "report indexes",
+        """
+        CREATE INDEX IF NOT EXISTS idx_payments_date ON payments (payment_date, payment_status);
+        """,
+    ),
+    (
+        7,
+        "appointment change feed index",
+        """
+        CREATE INDEX IF NOT EXISTS idx_appointments_updated ON appointments (updated_at, id_appointment);
+        """,
+    ),
+    (8, "archive catalog", _migrate_archive),
+    (
+        9,
+        "patient timeline indexes",
+        """
+        DROP INDEX IF EXISTS idx_medical_records_patient;
+        DROP INDEX IF EXISTS idx_prescriptions_patient;
+        DROP INDEX IF EXISTS idx_lab_orders_patient;
+        CREATE INDEX IF NOT EXISTS idx_medical_records_patient_date ON medical_records (id_patient, record_date);
+        CREATE INDEX IF NOT EXISTS idx_prescriptions_patient_date ON prescriptions (id_patient, prescription_date);
+        CREATE INDEX IF NOT EXISTS idx_lab_orders_patient_date ON lab_orders (id_patient, order_date);
+        """,
+    ),
+    (10, "medical record search", _migrate_record_search),
+    (11, "appointment grid sort indexes", _migrate_grid_sort),
+    (12, "lab work queue", _migrate_lab_queue),
+    (13, "appointment grid filter columns", _migrate_grid_filters),
+    (
+        14,
+        "appointment tombstones",
+        """
+        CREATE TABLE IF NOT EXISTS appointment_tombstones (
+            id_appointment INTEGER PRIMARY KEY,
+            removed_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_appointment_tombstones_removed
+            ON appointment_tombstones (removed_at, id_appointment);
+        """,
+    ),
+]
+
+
+SCHEMA_VERSION = max(version for version, _, _ in MIGRATIONS)
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT DEFAULT (CURRENT_TIMESTAMP)
+        )
+        """
+    )
+    row = conn.execute(f"SELECT MAX(version) FROM {SCHEMA_VERSION_TABLE}").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn: sqlite3.Connection) -> list[int]:
+    current = get_schema_version(conn)
+    applied = []
+    for version, name, step in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version <= current:
+            continue
+        if callable(step):
+            conn.commit()
+            conn.execute("BEGIN")
+            try:
+                step(conn)
+                conn.execute(f"INSERT INTO {SCHEMA_VERSION_TABLE} (version, name) VALUES (?, ?)", (version, name))
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+        else:
+            # executescript() commits any pending transaction first, so the
+            # explicit BEGIN/COMMIT keeps each step and its version row atomic.
+            conn.executescript(
+                f"""
+                BEGIN;
+                {step}
+                INSERT INTO {SCHEMA_VERSION_TABLE} (version, name) VALUES ({int(version)}, '{name}');
+                COMMIT;
+                """
+            )
+        applied.append(version)
+    # user_version lives in the file header, so setup_database() can tell that
+    # the schema is current without running any DDL.
+    conn.execute(f"PRAGMA user_version = {int(get_schema_version(conn))}")
+    conn.commit()
+    return applied
+
+
 def _table_has_rows(conn: sqlite3.Connection, table: str) -> bool:
     cur = conn.execute(f"SELECT 1 FROM {table} LIMIT 1")
     return cur.fetchone() is not None
@@ -258,13 +775,19 @@ def seed_data(conn: sqlite3.Connection) -> None:
         )
 
 
-def setup_database(db_path: Optional[str | Path] = None, *, seed: bool = True) -> Path:
+def setup_database(db_path: Optional[str | Path] = None, *, seed: bool = True,
+                   profile: str = DEFAULT_PROFILE) -> Path:
     path = Path(db_path) if db_path is not None else DEFAULT_DB_PATH
-    conn = get_connection(path)
+    conn = get_connection(path, profile)
     try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return path
         init_db(conn)
+        # The seed rows are written against the base schema, so they go in
+        # before the migrations that backfill derived columns and indexes.
         if seed:
             seed_data(conn)
+        migrate(conn)
     finally:
         conn.close()
     return path
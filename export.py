@@ -0,0 +1,67 @@
+import csv
+import gzip
+import io
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Callable, Optional
+
+EXPORT_CHUNK_SIZE = 5000
+FORMATS = ('csv', 'jsonl')
+
+def detect_format(path: str | Path) -> tuple[str, bool]:
+    suffixes = [s.lower() for s in Path(path).suffixes]
+    compress = bool(suffixes) and suffixes[-1] == '.gz'
+    if compress:
+        suffixes.pop()
+    fmt = suffixes[-1].lstrip('.') if suffixes else 'csv'
+    return (fmt if fmt in FORMATS else 'csv'), compress
+
+
+def _open(path: Path, compress: bool):
+    if compress:
+        return io.TextIOWrapper(gzip.open(path, 'wb', compresslevel=6), encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def write_rows(cur: sqlite3.Cursor, path: str | Path, fmt: Optional[str] = None,
+               compress: Optional[bool] = None, total: Optional[int] = None,
+               progress: Optional[Callable[[int, Optional[int]], None]] = None,
+               chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    # Rows are pulled from the cursor chunk by chunk and written straight out,
+    # so memory use does not depend on the size of the result.
+    path = Path(path)
+    detected_fmt, detected_compress = detect_format(path)
+    fmt = fmt or detected_fmt
+    compress = detected_compress if compress is None else compress
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат экспорта: {fmt}")
+    columns = [c[0] for c in cur.description]
+    written = 0
+    try:
+        with _open(path, compress) as out:
+            if fmt == 'csv':
+                writer = csv.writer(out)
+                writer.writerow(columns)
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                if fmt == 'csv':
+                    writer.writerows(rows)
+                else:
+                    out.writelines(
+                        json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows
+                    )
+                written += len(rows)
+                if progress is not None:
+                    progress(written, total)
+    except BaseException:
+        # A cancelled or failed export must not leave a truncated file behind.
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        raise
+    return written
@@ -0,0 +1,224 @@
+import argparse
+import bisect
+import functools
+import marshal
+import os
+import re
+import statistics
+import tempfile
+import time
+from array import array
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+CATALOG_PATH = Path(__file__).with_name("icd10.tsv")
+CACHE_SUFFIX = ".cache"
+# Bumped whenever the cached layout changes.
+CACHE_FORMAT = 1
+COMPLETE_LIMIT = 20
+
+# Cyrillic letters typed instead of their Latin look-alikes on a Russian layout.
+_HOMOGLYPHS = str.maketrans("АВЕКМНОРСТХ", "ABEKMHOPCTX")
+_CODE = re.compile(r"[A-Z][0-9][0-9A-Z](\.[0-9A-Z]+)?")
+_CODE_PREFIX = re.compile(r"[A-Z]([0-9]([0-9A-Z](\.[0-9A-Z]*)?)?)?")
+
+
+def normalize(code: str) -> str:
+    return code.strip().upper().translate(_HOMOGLYPHS)
+
+
+def _words(description: str) -> List[str]:
+    return re.findall(r"\w+", description.lower().replace("ё", "е"))
+
+
+class Catalog:
+    # Codes and descriptions are parallel lists sorted by code, so a code
+    # prefix is a bisect range. Description words are a second sorted list
+    # pointing back into them, for completion by name.
+    def __init__(self, codes: List[str], descriptions: List[str], words: List[str], owners: Sequence[int]):
+        self.codes = codes
+        self.descriptions = descriptions
+        self.words = words
+        self.owners = owners
+
+    @classmethod
+    def build(cls, entries: List[Tuple[str, str]]) -> "Catalog":
+        entries = sorted(dict(entries).items())
+        codes = [code for code, _ in entries]
+        descriptions = [description for _, description in entries]
+        pairs = sorted({(word, i) for i, description in enumerate(descriptions) for word in _words(description)})
+        return cls(codes, descriptions, [word for word, _ in pairs], array("i", [i for _, i in pairs]))
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def lookup(self, code: str) -> Optional[str]:
+        code = normalize(code)
+        i = bisect.bisect_left(self.codes, code)
+        if i < len(self.codes) and self.codes[i] == code:
+            return self.descriptions[i]
+        return None
+
+    def is_valid(self, code: str) -> bool:
+        return self.lookup(code) is not None
+
+    def validate(self, code: str) -> str:
+        normalized = normalize(code)
+        if not _CODE.fullmatch(normalized):
+            raise ValueError(f"Некорректный код МКБ-10: {code}")
+        if not self.is_valid(normalized):
+            raise ValueError(f"Код {normalized} отсутствует в справочнике МКБ-10")
+        return normalized
+
+    def _prefix_range(self, keys: List[str], prefix: str) -> range:
+        start = bisect.bisect_left(keys, prefix)
+        # Every key starting with prefix sorts before prefix + U+FFFF.
+        return range(start, bisect.bisect_left(keys, prefix + "\uffff", start))
+
+    def complete(self, text: str, limit: int = COMPLETE_LIMIT) -> List[Tuple[str, str]]:
+        # A code prefix ("J0", "к29") lists codes in order; anything else is
+        # matched against the starts of description words, every word typed
+        # narrowing the result.
+        code = normalize(text)
+        if _CODE_PREFIX.fullmatch(code):
+            found = self._prefix_range(self.codes, code)
+            if found:
+                return [(self.codes[i], self.descriptions[i]) for i in found[:limit]]
+        matched = None
+        for word in _words(text):
+            owners = {self.owners[i] for i in self._prefix_range(self.words, word)}
+            matched = owners if matched is None else matched & owners
+            if not matched:
+                return []
+        if not matched:
+            return []
+        return [(self.codes[i], self.descriptions[i]) for i in sorted(matched)[:limit]]
+
+
+def _read_tsv(path: Path) -> List[Tuple[str, str]]:
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line or line.startswith("#"):
+                continue
+            code, _, description = line.partition("\t")
+            entries.append((normalize(code), description.strip()))
+    return entries
+
+
+def load(path: Path = CATALOG_PATH, use_cache: bool = True) -> Catalog:
+    # The parsed catalogue is kept next to the TSV as a marshal file of a few
+    # large strings and one int array rather than ~100k small objects, so it
+    # loads without parsing or sorting. A cache written for another version
+    # of the TSV is ignored and replaced.
+    path = Path(path)
+    cache = path.with_name(path.name + CACHE_SUFFIX)
+    stat = path.stat()
+    stamp = (CACHE_FORMAT, stat.st_size, stat.st_mtime_ns)
+    if use_cache:
+        try:
+            with open(cache, "rb") as f:
+                cached_stamp, codes, descriptions, words, owners = marshal.load(f)
+            if cached_stamp == stamp:
+                return Catalog(codes.split("\n"), descriptions.split("\n"), words.split("\n"),
+                               array("i", owners))
+        except (OSError, EOFError, ValueError, TypeError, AttributeError):
+            pass
+    catalog = Catalog.build(_read_tsv(path))
+    if use_cache:
+        try:
+            with tempfile.NamedTemporaryFile("wb", dir=cache.parent, delete=False) as f:
+                marshal.dump((stamp, "\n".join(catalog.codes), "\n".join(catalog.descriptions),
+                              "\n".join(catalog.words), catalog.owners.tobytes()), f)
+            os.replace(f.name, cache)
+        except OSError:
+            # A read-only install still works, just without the cache.
+            pass
+    return catalog
+
+
+@functools.lru_cache(maxsize=None)
+def catalog() -> Catalog:
+    return load()
+
+
+def _synthetic(path: Path, size: int):
+    # Codes shaped like the real classifier (letter, two digits, optional
+    # subcode) with descriptions drawn from the bundled catalogue.
+    source = [description for _, description in _read_tsv(CATALOG_PATH)]
+    with open(path, "w", encoding="utf-8") as f:
+        n = 0
+        for letter in "ABCDEFGHIJKLMNOPQRSTUVWXYZ":
+            for number in range(100):
+                for sub in ["", *(f".{d}" for d in range(10))]:
+                    if n == size:
+                        return
+                    f.write(f"{letter}{number:02d}{sub}\t{source[n % len(source)]} {n}\n")
+                    n += 1
+
+
+def _timed(func, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def bench(path: Path, repeat: int):
+    cold = _timed(lambda: load(path, use_cache=False), repeat)
+    load(path)
+    warm = _timed(lambda: load(path), repeat)
+    current = load(path)
+    probes = [current.codes[i] for i in range(0, len(current), max(1, len(current) // 200))]
+    lookup = _timed(lambda: [current.lookup(code) for code in probes], repeat) / len(probes)
+    complete = _timed(lambda: [current.complete(code[:2]) for code in probes], repeat) / len(probes)
+    words = _timed(lambda: current.complete("острый бронх"), repeat)
+    print(f"codes: {len(current)}")
+    print(f"parse and build: {cold:.1f} ms")
+    print(f"load from cache: {warm:.1f} ms")
+    print(f"lookup: {lookup * 1000:.1f} µs")
+    print(f"complete by code: {complete * 1000:.1f} µs")
+    print(f"complete by words: {words * 1000:.1f} µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ICD-10 catalogue lookup and benchmark")
+    sub = parser.add_subparsers(dest="command", required=True)
+    complete = sub.add_parser("complete", help="list codes matching a code prefix or description words")
+    complete.add_argument("text")
+    check = sub.add_parser("check", help="list diagnosis codes in the database missing from the catalogue")
+    check.add_argument("--db", help="database path (default: the application database)")
+    bench_parser = sub.add_parser("bench", help="time loading, lookup and completion")
+    bench_parser.add_argument("--synthetic", type=int, metavar="N",
+                              help="benchmark a generated catalogue of N codes instead of the bundled one")
+    bench_parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "complete":
+        for code, description in catalog().complete(args.text):
+            print(f"{code}\t{description}")
+    elif args.command == "check":
+        import db
+        conn = db.get_connection(args.db)
+        try:
+            rows = conn.execute("SELECT diagnosis_icd10, COUNT(*) FROM medical_records "
+                                "GROUP BY diagnosis_icd10 ORDER BY diagnosis_icd10").fetchall()
+        finally:
+            conn.close()
+        for code, count in rows:
+            if code is None or not catalog().is_valid(code):
+                print(f"{code}\t{count}")
+    elif args.synthetic:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "icd10.tsv"
+            _synthetic(path, args.synthetic)
+            bench(path, args.repeat)
+    else:
+        bench(CATALOG_PATH, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import atexit
+import bisect
+import functools
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Optional, TextIO
+
+ENV_ENABLE = "MEDICAL_INSTRUMENT"
+ENV_SLOW_MS = "MEDICAL_SLOW_QUERY_MS"
+DEFAULT_SLOW_MS = 100.0
+# Upper bounds of the latency buckets in milliseconds; the last bucket is open.
+BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+# The progress handler fires every PROGRESS_STEPS virtual machine instructions.
+PROGRESS_STEPS = 1000
+# Methods that do not query the database or only manage instances.
+SKIPPED_METHODS = {'worker_copy', 'interrupt', 'cache_stats', 'instrumentation'}
+EXPLAINABLE = ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT")
+
+_env_instance = None
+
+
+class _MethodStats:
+    __slots__ = ('calls', 'errors', 'total_ms', 'max_ms', 'rows', 'statements', 'vm_steps', 'buckets')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.statements = 0
+        self.vm_steps = 0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def percentile(self, fraction: float) -> float:
+        # Estimated as the upper bound of the bucket holding the percentile.
+        target = self.calls * fraction
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= target:
+                return min(BUCKETS_MS[i], round(self.max_ms, 3)) if i < len(BUCKETS_MS) else round(self.max_ms, 3)
+        return 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'total_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'max_ms': round(self.max_ms, 3),
+            'rows': self.rows,
+            'statements': self.statements,
+            'vm_steps': self.vm_steps,
+            'histogram': dict(zip([f"<={b}" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"], self.buckets)),
+        }
+
+
+class _Call:
+    __slots__ = ('method', 'statements', 'steps')
+
+    def __init__(self, method: str):
+        self.method = method
+        self.statements = []
+        self.steps = 0
+
+
+def _row_count(result) -> int:
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        result = result[0]
+    if isinstance(result, list):
+        return len(result)
+    return 0 if result is None else 1
+
+
+# Nothing is hooked until attach() is called, so a Database without
+# instrumentation runs its methods and connection untouched.
+class Instrumentation:
+    def __init__(self, slow_ms: float = DEFAULT_SLOW_MS, explain: bool = True,
+                 dump_on_exit: bool = False, stream: Optional[TextIO] = None):
+        self.slow_ms = slow_ms
+        self.explain = explain
+        self.stream = stream
+        self.methods = {}
+        self.slow_queries = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if dump_on_exit:
+            atexit.register(self.dump)
+
+    @classmethod
+    def from_env(cls) -> Optional["Instrumentation"]:
+        global _env_instance
+        if os.environ.get(ENV_ENABLE, "") in ("", "0"):
+            return None
+        # Every Database in the process reports into one summary printed at exit.
+        if _env_instance is None:
+            _env_instance = cls(float(os.environ.get(ENV_SLOW_MS, DEFAULT_SLOW_MS)), dump_on_exit=True)
+        return _env_instance
+
+    def attach(self, database) -> None:
+        self.attach_connection(database.conn)
+        for name in dir(type(database)):
+            if name.startswith("_") or name in SKIPPED_METHODS:
+                continue
+            if callable(getattr(type(database), name, None)):
+                setattr(database, name, self._wrap(database, name, getattr(database, name)))
+
+    def attach_connection(self, conn: sqlite3.Connection) -> None:
+        conn.set_trace_callback(self._on_statement)
+        conn.set_progress_handler(self._on_progress, PROGRESS_STEPS)
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _on_statement(self, sql: str):
+        # Statements run by triggers and FTS5 come through as "-- ..." or with
+        # a quoted schema name; only statements issued by Database are kept.
+        if sql.startswith("--") or "'main'." in sql:
+            return
+        stack = self._stack()
+        if stack and not getattr(self._local, 'explaining', False):
+            stack[-1].statements.append((sql, time.perf_counter()))
+
+    def _on_progress(self) -> int:
+        stack = self._stack()
+        if stack:
+            stack[-1].steps += PROGRESS_STEPS
+        return 0
+
+    def _wrap(self, database, name: str, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            stack = self._stack()
+            call = _Call(name)
+            stack.append(call)
+            started = time.perf_counter()
+            failed = True
+            result = None
+            try:
+                result = method(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                finished = time.perf_counter()
+                stack.pop()
+                self._record(call, (finished - started) * 1000, finished, result, failed)
+                self._log_slow(database, call, finished)
+        return wrapper
+
+    def _record(self, call: _Call, elapsed_ms: float, finished: float, result, failed: bool):
+        with self._lock:
+            stats = self.methods.get(call.method)
+            if stats is None:
+                stats = self.methods[call.method] = _MethodStats()
+            stats.calls += 1
+            stats.errors += failed
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            stats.rows += _row_count(result)
+            stats.statements += len(call.statements)
+            stats.vm_steps += call.steps
+            stats.buckets[bisect.bisect_left(BUCKETS_MS, elapsed_ms)] += 1
+
+    def _log_slow(self, database, call: _Call, finished: float):
+        # The trace callback only reports when a statement starts, so each
+        # statement is timed until the next one starts or the method returns.
+        ends = [started for _, started in call.statements[1:]] + [finished]
+        for (sql, started), end in zip(call.statements, ends):
+            elapsed_ms = (end - started) * 1000
+            if elapsed_ms < self.slow_ms:
+                continue
+            entry = {'method': call.method, 'ms': round(elapsed_ms, 3), 'sql': " ".join(sql.split()),
+                     'plan': self._plan(database, sql)}
+            with self._lock:
+                self.slow_queries.append(entry)
+            # Imported here so that startup does not pay for logging unless a query is slow.
+            import logging
+            logging.getLogger("medical.sql").warning(
+                "slow query in %s (%.1f ms): %s\n%s", call.method, elapsed_ms, entry['sql'], "\n".join(entry['plan']))
+
+    def _plan(self, database, sql: str) -> list:
+        if not self.explain or not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return []
+        self._local.explaining = True
+        try:
+            # A pooled Database has released its connection by now, so the
+            # plan is taken on another reader from the same pool.
+            if getattr(database, 'pool', None) is not None:
+                with database.pool.connection() as conn:
+                    return self._explain(conn, sql)
+            return self._explain(database.conn, sql)
+        finally:
+            self._local.explaining = False
+
+    @staticmethod
+    def _explain(conn: sqlite3.Connection, sql: str) -> list:
+        try:
+            return [f"{row[1]}:{row[3]}" for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+        except sqlite3.Error as exc:
+            return [f"plan unavailable: {exc}"]
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                'methods': {name: stats.as_dict() for name, stats in sorted(self.methods.items())},
+                'slow_queries': list(self.slow_queries),
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.methods.clear()
+            self.slow_queries.clear()
+
+    def report(self) -> str:
+        summary = self.summary()
+        lines = [f"{'method':<36} {'calls':>7} {'mean ms':>9} {'p95 ms':>8} {'max ms':>9} {'rows':>9} {'stmts':>7}"]
+        for name, s in sorted(summary['methods'].items(), key=lambda item: -item[1]['total_ms']):
+            lines.append(f"{name:<36} {s['calls']:>7} {s['mean_ms']:>9.2f} {s['p95_ms']:>8} "
+                         f"{s['max_ms']:>9.2f} {s['rows']:>9} {s['statements']:>7}")
+        if summary['slow_queries']:
+            lines.append(f"slow queries (>= {self.slow_ms} ms): {len(summary['slow_queries'])}")
+            for entry in summary['slow_queries'][-20:]:
+                lines.append(f"  {entry['ms']:>9.1f} ms  {entry['method']}: {entry['sql'][:160]}")
+                lines.extend(f"      {step}" for step in entry['plan'])
+        return "\n".join(lines)
+
+    def dump(self, stream: Optional[TextIO] = None) -> None:
+        print(self.report(), file=stream or self.stream or sys.stderr)
@@ -0,0 +1,254 @@
+import argparse
+import collections
+import json
+import statistics
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable, List, Sequence, Tuple
+
+import db
+import queries
+import records
+
+DEFAULT_CLAIM_SIZE = 50
+MAX_CLAIM_SIZE = 1000
+# A claim that is neither completed nor released within the lease goes back
+# to the queue, so orders held by a workstation that crashed or was closed
+# are picked up by someone else.
+DEFAULT_LEASE_SECONDS = 15 * 60
+# QueueMetrics reports rates over this many most recent seconds.
+RATE_WINDOW_SECONDS = 60
+DEFAULT_RESULT = 'В пределах нормы'
+
+
+def _timestamp(moment: datetime) -> str:
+    # The text format of database.CHANGE_TIMESTAMP, in UTC like it.
+    return moment.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+
+def _check_worker(worker: str):
+    if not worker or not str(worker).strip():
+        raise ValueError("Не указан сотрудник лаборатории")
+
+
+# The functions below run inside the caller's transaction. Database opens it
+# with BEGIN IMMEDIATE, so two workers never see the same order as free.
+def claim(conn, worker: str, limit: int = DEFAULT_CLAIM_SIZE,
+          lease_seconds: int = DEFAULT_LEASE_SECONDS) -> Tuple[List[records.LabWorkItem], int]:
+    # Hands the `limit` oldest unclaimed orders to `worker`, after putting
+    # expired claims back into the queue. Returns the orders, oldest first,
+    # and the number of expired claims.
+    _check_worker(worker)
+    if not 1 <= limit <= MAX_CLAIM_SIZE:
+        raise ValueError(f"Размер пачки должен быть от 1 до {MAX_CLAIM_SIZE}")
+    now = datetime.now(timezone.utc)
+    expired = conn.execute(queries.LAB_QUEUE_EXPIRE, (_timestamp(now - timedelta(seconds=lease_seconds)),)).rowcount
+    items = records.fetch_all(conn, records.LabWorkItem, queries.LAB_QUEUE_CLAIM, (worker, _timestamp(now), limit))
+    # RETURNING yields rows in no particular order.
+    items.sort(key=lambda item: (item.order_date or '', item.id_lab_order))
+    return items, expired
+
+
+def post_results(conn, worker: str, results: Iterable[Sequence]) -> Tuple[int, List[int]]:
+    # results: (id_lab_order, result_text) or (id_lab_order, result_text,
+    # result_date); the date defaults to today. Only orders `worker` still
+    # holds are completed. Returns their number and the ids of the others:
+    # orders whose lease expired and went to someone else, or that are no
+    # longer open.
+    _check_worker(worker)
+    today = date.today().isoformat()
+    posted = {}
+    for id_lab_order, result_text, *rest in results:
+        if not result_text or not str(result_text).strip():
+            raise ValueError(f"Пустой результат анализа #{id_lab_order}")
+        posted[int(id_lab_order)] = (result_text, rest[0] if rest and rest[0] else today)
+    held = {row[0] for row in conn.execute(queries.LAB_QUEUE_HELD, (worker,))}
+    accepted = [(result_text, result_date, id_lab_order)
+                for id_lab_order, (result_text, result_date) in posted.items() if id_lab_order in held]
+    if accepted:
+        conn.executemany(queries.LAB_QUEUE_POST, accepted)
+    return len(accepted), sorted(set(posted) - held)
+
+
+def release(conn, worker: str, ids: Iterable[int]) -> int:
+    # Puts orders `worker` holds back into the queue unchanged.
+    _check_worker(worker)
+    return conn.executemany(queries.LAB_QUEUE_RELEASE, [(int(i), worker) for i in ids]).rowcount
+
+
+def queue_status(conn) -> dict:
+    return dict(conn.execute(queries.LAB_QUEUE_STATUS).fetchone())
+
+
+class QueueMetrics:
+    # Shared by every worker of one Database: totals since start, mean time
+    # per call and claim/post rates over the last RATE_WINDOW_SECONDS.
+    COUNTERS = ('claims', 'claimed', 'expired', 'posts', 'posted', 'rejected', 'released')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._totals = dict.fromkeys(self.COUNTERS, 0)
+        self._calls = collections.Counter()
+        self._seconds = collections.Counter()
+        # (monotonic time, orders claimed, results posted) per call.
+        self._recent = collections.deque()
+
+    def record(self, operation: str, seconds: float, **counts):
+        now = time.monotonic()
+        with self._lock:
+            self._calls[operation] += 1
+            self._seconds[operation] += seconds
+            for name, value in counts.items():
+                self._totals[name] += value
+            self._recent.append((now, counts.get('claimed', 0), counts.get('posted', 0)))
+            self._trim(now)
+
+    def _trim(self, now: float):
+        while self._recent and self._recent[0][0] < now - RATE_WINDOW_SECONDS:
+            self._recent.popleft()
+
+    def as_dict(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            window = max(min(RATE_WINDOW_SECONDS, now - self._started), 1e-3)
+            return {
+                **self._totals,
+                'mean_ms': {operation: round(self._seconds[operation] / calls * 1000, 3)
+                            for operation, calls in self._calls.items()},
+                'claimed_per_second': round(sum(claimed for _, claimed, _ in self._recent) / window, 1),
+                'posted_per_second': round(sum(posted for _, _, posted in self._recent) / window, 1),
+            }
+
+
+def build(path: Path, orders: int, pending: int):
+    # An empty clinic database holding `orders` lab orders over ten years,
+    # the newest `pending` of them still open. The foreign keys are left
+    # NULL: the queue never joins other tables.
+    db.setup_database(path, seed=False, profile='bulk-load')
+    conn = db.get_connection(path, 'bulk-load')
+    try:
+        with conn:
+            conn.execute(
+                f"""
+                INSERT INTO lab_orders (order_date, test_name, status, result_date, result_text)
+                WITH RECURSIVE n (i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :orders)
+                SELECT date('2016-01-01', '+' || (i * 3650 / :orders) || ' days'), 'Общий анализ крови',
+                       CASE WHEN i > :orders - :pending THEN 'Назначен' ELSE 'Выполнен' END,
+                       CASE WHEN i > :orders - :pending THEN NULL
+                            ELSE date('2016-01-01', '+' || (i * 3650 / :orders + 1) || ' days') END,
+                       CASE WHEN i > :orders - :pending THEN NULL ELSE '{DEFAULT_RESULT}' END
+                FROM n
+                """,
+                {'orders': orders, 'pending': pending},
+            )
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+
+def run(path: Path, workers: int, batch: int) -> dict:
+    # `workers` threads, each with its own connection, claim `batch` orders
+    # at a time and post results for all of them until the queue is empty.
+    from database import Database
+    metrics = QueueMetrics()
+    latencies = {'claim': [], 'post': []}
+    lock = threading.Lock()
+    barrier = threading.Barrier(workers + 1)
+
+    def work(index: int):
+        # sqlite3 connections belong to the thread that opened them.
+        database = Database(path, 'server', setup=False)
+        database.lab_metrics = metrics
+        worker = f"bench-{index}"
+        local = {'claim': [], 'post': []}
+        barrier.wait()
+        while True:
+            started = time.perf_counter()
+            items = database.claim_lab_orders(worker, batch)
+            local['claim'].append((time.perf_counter() - started) * 1000)
+            if not items:
+                break
+            started = time.perf_counter()
+            database.post_lab_results(worker, [(item.id_lab_order, DEFAULT_RESULT) for item in items])
+            local['post'].append((time.perf_counter() - started) * 1000)
+        database.close()
+        with lock:
+            for operation, values in local.items():
+                latencies[operation].extend(values)
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    conn = db.get_connection(path)
+    try:
+        status = queue_status(conn)
+    finally:
+        conn.close()
+
+    def summary(values):
+        values = sorted(values)
+        return {
+            'calls': len(values),
+            'p50_ms': round(statistics.median(values), 3),
+            'p99_ms': round(values[min(len(values) - 1, int(len(values) * 0.99))], 3),
+        }
+
+    totals = metrics.as_dict()
+    return {
+        'workers': workers,
+        'batch': batch,
+        'seconds': round(elapsed, 2),
+        'posted': totals['posted'],
+        'rejected': totals['rejected'],
+        'posted_per_second': round(totals['posted'] / elapsed, 1),
+        'left_pending': status['pending'],
+        'left_claimed': status['claimed'],
+        'claim': summary(latencies['claim']),
+        'post': summary(latencies['post']),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lab order work queue")
+    sub = parser.add_subparsers(dest="command", required=True)
+    status = sub.add_parser("status", help="show the size of the queue")
+    status.add_argument("--db", help="database path (default: the application database)")
+    bench_parser = sub.add_parser("bench", help="drain a generated queue with concurrent workers")
+    bench_parser.add_argument("--orders", type=int, default=2_000_000, help="lab orders in the table")
+    bench_parser.add_argument("--pending", type=int, default=50_000, help="open orders among them")
+    bench_parser.add_argument("--workers", type=int, nargs="+", default=[1, 4],
+                              help="concurrent workers; several values compare scaling")
+    bench_parser.add_argument("--batch", type=int, default=200, help="orders per claim")
+    bench_parser.add_argument("--data-dir", type=Path, default=Path(tempfile.gettempdir()) / "medical_bench")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        conn = db.get_connection(args.db)
+        try:
+            db.migrate(conn)
+            print(json.dumps(queue_status(conn), ensure_ascii=False))
+        finally:
+            conn.close()
+        return
+    import bench
+    args.data_dir.mkdir(parents=True, exist_ok=True)
+    source = args.data_dir / f"labqueue_{args.orders}_{args.pending}.sqlite3"
+    if not source.exists():
+        build(source, args.orders, args.pending)
+    for workers in args.workers:
+        result = run(bench.working_copy(source), workers, args.batch)
+        print(json.dumps({'orders': args.orders, 'pending': args.pending, **result}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
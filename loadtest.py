@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import bench
+from database import Database
+from service import DatabaseService, RemoteDatabase
+
+WRITE_SHARE = 0.2
+# Writes book hourly slots for doctor 1 on days no generated booking uses.
+WRITE_DAY = date(2100, 1, 4)
+
+
+def start_service(db_path: Path, readers: int) -> tuple[str, DatabaseService]:
+    service = DatabaseService(db_path, readers)
+    started = threading.Event()
+    address = []
+
+    def on_started(sockname):
+        address.append(f"{sockname[0]}:{sockname[1]}")
+        started.set()
+
+    thread = threading.Thread(target=lambda: asyncio.run(service.serve(port=0, started=on_started)), daemon=True)
+    thread.start()
+    started.wait()
+    return address[0], service
+
+
+def _operations(database, rng: random.Random, n_patients: int, slots):
+    def create():
+        k = next(slots)
+        day = (WRITE_DAY + timedelta(days=k // 9)).isoformat()
+        return database.create_appointment_with_services(
+            rng.randrange(1, n_patients + 1), 1, day, f"{9 + k % 9:02d}:00:00", 'Первичный', '', 1800,
+            [{'id_service': 1, 'price': 1800}],
+        )
+
+    reads = [
+        ('get_appointments_page', lambda: database.get_appointments_page(status=rng.choice([None, 'Завершен']))),
+        ('search_patients', lambda: database.search_patients(rng.choice(['Ива', 'Пет', 'Смир', 'Кузн']))),
+        ('get_patient_appointments', lambda: database.get_patient_appointments(rng.randrange(1, n_patients + 1))),
+        ('get_doctors', lambda: database.get_doctors()),
+        ('find_free_slots', lambda: database.find_free_slots(5, after=bench.BENCH_TODAY.isoformat())),
+        ('get_report', lambda: database.get_report('attendance', '2025-01-01', bench.BENCH_TODAY.isoformat())),
+    ]
+    return reads, ('create_appointment_with_services', create)
+
+
+def run(db_path: Path, mode: str, clients: int, duration: float, readers: int, seed: int) -> dict:
+    service = None
+    shared = None
+    if mode == 'service':
+        address, service = start_service(db_path, readers)
+        connect = lambda: RemoteDatabase(address)
+    elif mode == 'pool':
+        shared = Database(db_path, 'server', setup=False, readers=readers)
+        connect = shared.worker_copy
+    else:
+        connect = lambda: Database(db_path, 'server', setup=False)
+
+    probe = Database(db_path, setup=False)
+    n_patients = probe.conn.execute("SELECT MAX(id_patient) FROM patients").fetchone()[0]
+    probe.conn.close()
+
+    slots = itertools.count()
+    lock = threading.Lock()
+    latencies = {}
+    errors = {}
+    barrier = threading.Barrier(clients + 1)
+    deadline = []
+
+    def client(index):
+        rng = random.Random(seed + index)
+        database = connect()
+        reads, write = _operations(database, rng, n_patients, slots)
+        local = {}
+        local_errors = {}
+        barrier.wait()
+        while time.perf_counter() < deadline[0]:
+            name, op = write if rng.random() < WRITE_SHARE else rng.choice(reads)
+            started = time.perf_counter()
+            try:
+                op()
+            except Exception as exc:
+                key = f"{name}: {type(exc).__name__}: {exc}"[:120]
+                local_errors[key] = local_errors.get(key, 0) + 1
+                continue
+            local.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+        with lock:
+            for name, values in local.items():
+                latencies.setdefault(name, []).extend(values)
+            for key, count in local_errors.items():
+                errors[key] = errors.get(key, 0) + count
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    deadline.append(time.perf_counter() + duration)
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if service is not None:
+        service.close()
+    if shared is not None:
+        shared.close()
+
+    def summary(values):
+        values = sorted(values)
+        return {
+            'requests': len(values),
+            'p50_ms': round(statistics.median(values), 3),
+            'p99_ms': round(values[min(len(values) - 1, int(len(values) * 0.99))], 3),
+        }
+
+    everything = [v for values in latencies.values() for v in values]
+    return {
+        'mode': mode,
+        'clients': clients,
+        'readers': readers if mode != 'direct' else None,
+        'seconds': round(elapsed, 2),
+        'throughput_rps': round(len(everything) / elapsed, 1),
+        'errors': sum(errors.values()),
+        **(summary(everything) if everything else {}),
+        'operations': {name: summary(values) for name, values in sorted(latencies.items())},
+        'error_kinds': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the database service with simulated desks")
+    parser.add_argument("--mode", choices=["service", "pool", "direct"], nargs="+",
+                        default=["service", "pool", "direct"],
+                        help="service: clients talk to service.py; pool: clients share one pooled "
+                             "Database; direct: each client opens the file itself")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per mode")
+    parser.add_argument("--readers", type=int, nargs="+", default=[4],
+                        help="reader threads/connections; several values compare scaling")
+    parser.add_argument("--scale", type=int, default=10_000, help="appointments in the generated database")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", type=Path, default=Path(tempfile.gettempdir()) / "medical_bench")
+    args = parser.parse_args()
+
+    args.data_dir.mkdir(parents=True, exist_ok=True)
+    source = bench.prepare(args.scale, args.seed, args.data_dir)
+    for mode in args.mode:
+        for readers in (args.readers if mode != 'direct' else args.readers[:1]):
+            result = run(bench.working_copy(source), mode, args.clients, args.duration, readers, args.seed)
+            print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
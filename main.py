@@ -1,153 +1,184 @@
+import time
+
+_STARTED = time.perf_counter()
+
+import json
+import os
 import sys
 from datetime import datetime, date
 from typing import Optional, List
 
-from PyQt5.QtWidgets import *
-from PyQt5.QtCore import Qt, QDate, QTime
-from PyQt5.QtGui import QFont
-import db
+from PyQt5.QtWidgets import (
+    QAbstractItemView, QApplication, QCheckBox, QComboBox, QCompleter, QDateEdit, QDialog,
+    QDialogButtonBox, QFileDialog, QFormLayout, QGroupBox, QHBoxLayout, QHeaderView, QLabel, QLineEdit,
+    QListWidget, QListWidgetItem, QMainWindow, QMenu, QMessageBox, QProgressDialog, QPushButton,
+    QTabWidget, QTableView, QTableWidget, QTableWidgetItem, QTextEdit, QTimeEdit, QVBoxLayout, QWidget,
+)
+from PyQt5.QtCore import Qt, QDate, QTime, QTimer, QAbstractTableModel, QModelIndex, pyqtSignal
+from PyQt5.QtGui import QFont, QStandardItem, QStandardItemModel
+from database import APPOINTMENT_SORT_KEYS, Database
+from workers import QueryRunner, BusyIndicator
 
 
 STATUSES = ['Запланирован', 'На приеме', 'Завершен', 'Не явился', 'Отменен']
 APPOINTMENT_TYPES = ['Первичный', 'Повторный', 'Профилактический']
 
 
-class Database:
-    def __init__(self):
-        db.setup_database(seed=True)
-        self.conn = db.get_connection()
-
-    def get_appointments(self, status: Optional[str] = None,
-                         date_from: Optional[str] = None,
-                         date_to: Optional[str] = None) -> List[dict]:
-        query = """
-            SELECT a.id_appointment, a.appointment_date, a.appointment_time,
-                   a.appointment_type, a.status, a.price, a.notes,
-                   p.fio as patient_fio, p.phone as patient_phone,
-                   d.fio as doctor_fio, d.specialization
-            FROM appointments a
-            JOIN patients p ON a.id_patient = p.id_patient
-            JOIN doctors d ON a.id_doctor = d.id_doctor
-            WHERE 1=1
-        """
-        params = []
-        if status and status != 'Все':
-            query += " AND a.status = ?"
-            params.append(status)
-        if date_from:
-            query += " AND a.appointment_date >= ?"
-            params.append(date_from)
-        if date_to:
-            query += " AND a.appointment_date <= ?"
-            params.append(date_to)
-        query += " ORDER BY a.appointment_date DESC, a.appointment_time DESC"
-        cur = self.conn.execute(query, params)
-        return [dict(row) for row in cur.fetchall()]
-
-    def get_patients(self) -> List[dict]:
-        cur = self.conn.execute("SELECT * FROM patients ORDER BY fio")
-        return [dict(row) for row in cur.fetchall()]
-
-    def get_doctors(self, active_only: bool = True) -> List[dict]:
-        query = "SELECT * FROM doctors"
-        if active_only:
-            query += " WHERE is_active = 1"
-        query += " ORDER BY fio"
-        cur = self.conn.execute(query)
-        return [dict(row) for row in cur.fetchall()]
-
-    def get_services(self, active_only: bool = True) -> List[dict]:
-        query = "SELECT * FROM service_pricelist"
-        if active_only:
-            query += " WHERE is_active = 1"
-        query += " ORDER BY service_category, service_name"
-        cur = self.conn.execute(query)
-        return [dict(row) for row in cur.fetchall()]
-
-    def get_appointment_services(self, id_appointment: int) -> List[dict]:
-        cur = self.conn.execute("""
-            SELECT aps.*, sp.service_name, sp.service_category
-            FROM appointment_services aps
-            JOIN service_pricelist sp ON aps.id_service = sp.id_service
-            WHERE aps.id_appointment = ?
-        """, (id_appointment,))
-        return [dict(row) for row in cur.fetchall()]
-
-    def create_patient(self, fio: str, phone: str, email: str) -> int:
-        cur = self.conn.execute("""
-            INSERT INTO patients (fio, phone, email, registration_date, created_at, updated_at)
-            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-        """, (fio, phone, email, date.today().isoformat()))
-        self.conn.commit()
-        return cur.lastrowid
-
-    def create_appointment(self, id_patient: int, id_doctor: int,
-                           appointment_date: str, appointment_time: str,
-                           appointment_type: str, notes: str, price: float) -> int:
-        cur = self.conn.execute("""
-            INSERT INTO appointments (id_patient, id_doctor, appointment_date, appointment_time,
-                                       appointment_type, status, price, notes, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, 'Запланирован', ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-        """, (id_patient, id_doctor, appointment_date, appointment_time, appointment_type, price, notes))
-        self.conn.commit()
-        return cur.lastrowid
-
-    def add_appointment_service(self, id_appointment: int, id_service: int, price: float, quantity: int = 1):
-        self.conn.execute("""
-            INSERT INTO appointment_services (id_appointment, id_service, price, quantity)
-            VALUES (?, ?, ?, ?)
-        """, (id_appointment, id_service, price, quantity))
-        self.conn.commit()
-
-    def update_appointment(self, id_appointment: int, id_doctor: int, status: str, notes: str, price: float):
-        self.conn.execute("""
-            UPDATE appointments SET id_doctor = ?, status = ?, notes = ?, price = ?,
-                                    updated_at = CURRENT_TIMESTAMP
-            WHERE id_appointment = ?
-        """, (id_doctor, status, notes, price, id_appointment))
-        self.conn.commit()
-
-    def clear_appointment_services(self, id_appointment: int):
-        self.conn.execute("DELETE FROM appointment_services WHERE id_appointment = ?", (id_appointment,))
-        self.conn.commit()
-
-    def get_patient_appointments(self, id_patient: int) -> List[dict]:
-        cur = self.conn.execute("""
-            SELECT a.*, d.fio as doctor_fio, d.specialization
-            FROM appointments a
-            JOIN doctors d ON a.id_doctor = d.id_doctor
-            WHERE a.id_patient = ?
-            ORDER BY a.appointment_date DESC, a.appointment_time DESC
-        """, (id_patient,))
-        return [dict(row) for row in cur.fetchall()]
-
-    def get_appointment_by_id(self, id_appointment: int) -> Optional[dict]:
-        cur = self.conn.execute("""
-            SELECT a.*, p.fio as patient_fio, p.phone as patient_phone,
-                   d.fio as doctor_fio, d.specialization
-            FROM appointments a
-            JOIN patients p ON a.id_patient = p.id_patient
-            JOIN doctors d ON a.id_doctor = d.id_doctor
-            WHERE a.id_appointment = ?
-        """, (id_appointment,))
-        row = cur.fetchone()
-        return dict(row) if row else None
-
-    def authenticate(self, login: str, password: str) -> Optional[dict]:
-        cur = self.conn.execute("""
-            SELECT u.*, p.fio as patient_fio
-            FROM users u
-            LEFT JOIN patients p ON u.id_patient = p.id_patient
-            WHERE u.login = ? AND u.password = ?
-        """, (login, password))
-        row = cur.fetchone()
-        return dict(row) if row else None
+def service_lines(services: List[dict]) -> List[dict]:
+    return [{'id_service': s['id_service'], 'price': s['price_paid']} for s in services]
+
+
+class PatientSearchEdit(QLineEdit):
+    patient_selected = pyqtSignal(object)
+
+    MIN_QUERY_LENGTH = 2
+
+    def __init__(self, runner: QueryRunner, parent=None):
+        super().__init__(parent)
+        self.runner = runner
+        self.patient_id = None
+        self.setPlaceholderText("ФИО, телефон, номер карты, полиса или паспорта")
+
+        self.results = QStandardItemModel(self)
+        self.search_completer = QCompleter(self.results, self)
+        self.search_completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.search_completer.activated[QModelIndex].connect(self.on_activated)
+        self.setCompleter(self.search_completer)
+
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(self.search)
+        self.textEdited.connect(self.on_text_edited)
+
+    def on_text_edited(self, text):
+        if self.patient_id is not None:
+            self.patient_id = None
+            self.patient_selected.emit(None)
+        self.search_timer.start()
+
+    def search(self):
+        text = self.text().strip()
+        if len(text) < self.MIN_QUERY_LENGTH:
+            self.runner.cancel_channel(self)
+            self.results.clear()
+            return
+        self.runner.submit('search_patients', text, on_result=self.show_results, channel=self)
+
+    def show_results(self, patients):
+        self.results.clear()
+        for p in patients:
+            item = QStandardItem(f"{p['fio']} ({p['phone']})")
+            item.setData(p['id_patient'], Qt.UserRole)
+            self.results.appendRow(item)
+        if patients and self.hasFocus():
+            self.search_completer.complete()
+
+    def on_activated(self, index):
+        self.patient_id = index.data(Qt.UserRole)
+        self.patient_selected.emit(self.patient_id)
+
+
+class IcdCodeEdit(QLineEdit):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.results = QStandardItemModel(self)
+        self.code_completer = QCompleter(self.results, self)
+        self.code_completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        # The popup shows code and description; choosing a line inserts the code.
+        self.code_completer.setCompletionRole(Qt.UserRole)
+        self.setCompleter(self.code_completer)
+        self.textEdited.connect(self.complete_code)
+
+    def complete_code(self, text):
+        import icd10
+        self.results.clear()
+        if not text.strip():
+            return
+        for code, description in icd10.catalog().complete(text):
+            item = QStandardItem(f"{code} — {description}")
+            item.setData(code, Qt.UserRole)
+            self.results.appendRow(item)
+        if self.results.rowCount():
+            self.code_completer.complete()
+
+
+class PatientTimeline(QWidget):
+    COLUMNS = ["Дата", "Время", "Событие", "Описание", "Статус", "Сумма"]
+    KINDS = {
+        'appointment': "Приём",
+        'record': "Заключение",
+        'prescription': "Назначение",
+        'lab': "Анализ",
+        'payment': "Оплата",
+    }
+    PAGE_SIZE = 100
+
+    def __init__(self, runner: QueryRunner, parent=None):
+        super().__init__(parent)
+        self.runner = runner
+        self.patient_id = None
+        self.cursor = None
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.table = QTableWidget()
+        self.table.setColumnCount(len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setSectionResizeMode(3, QHeaderView.Stretch)
+        layout.addWidget(self.table)
+
+        self.more_btn = QPushButton("Показать ещё")
+        self.more_btn.clicked.connect(self.load_more)
+        self.more_btn.hide()
+        layout.addWidget(self.more_btn)
+
+    def set_patient(self, patient_id):
+        self.patient_id = patient_id
+        self.reload()
+
+    def reload(self):
+        self.table.setRowCount(0)
+        self.cursor = None
+        self.more_btn.hide()
+        if not self.patient_id:
+            self.runner.cancel_channel(self)
+            return
+        self.load_more()
+
+    def load_more(self):
+        self.more_btn.setEnabled(False)
+        self.runner.submit('get_patient_timeline', self.patient_id, since=self.cursor, limit=self.PAGE_SIZE,
+                           on_result=self.show_page, channel=self)
+
+    def show_page(self, page):
+        events, self.cursor = page
+        bold = QFont()
+        bold.setBold(True)
+        row = self.table.rowCount()
+        self.table.setRowCount(row + len(events))
+        for i, e in enumerate(events, start=row):
+            amount = f"{e['amount']:.2f}" if e['amount'] is not None else ""
+            values = [e['event_date'], e['event_time'][:5], self.KINDS.get(e['kind'], e['kind']),
+                      e['description'], e['status'], amount]
+            for column, value in enumerate(values):
+                # Records may lack a date or a diagnosis text.
+                item = QTableWidgetItem(value or "")
+                if e['kind'] == 'appointment':
+                    item.setFont(bold)
+                self.table.setItem(i, column, item)
+        self.more_btn.setEnabled(True)
+        self.more_btn.setVisible(self.cursor is not None)
 
 
 class NewAppointmentDialog(QDialog):
-    def __init__(self, database: Database, parent=None):
+    def __init__(self, database: Database, runner: QueryRunner, parent=None):
         super().__init__(parent)
         self.database = database
+        self.runner = runner
         self.selected_services = []
         self.setWindowTitle("Новый приём")
         self.setMinimumWidth(600)
@@ -158,12 +189,9 @@ class NewAppointmentDialog(QDialog):
 
         patient_group = QGroupBox("Пациент")
         patient_layout = QFormLayout()
-        self.patient_combo = QComboBox()
-        self.patient_combo.addItem("-- Новый пациент --", None)
-        for p in self.database.get_patients():
-            self.patient_combo.addItem(f"{p['fio']} ({p['phone']})", p['id_patient'])
-        self.patient_combo.currentIndexChanged.connect(self.on_patient_changed)
-        patient_layout.addRow("Выбрать:", self.patient_combo)
+        self.patient_search = PatientSearchEdit(self.runner)
+        self.patient_search.patient_selected.connect(self.on_patient_changed)
+        patient_layout.addRow("Найти:", self.patient_search)
 
         self.fio_edit = QLineEdit()
         self.phone_edit = QLineEdit()
@@ -177,8 +205,6 @@ class NewAppointmentDialog(QDialog):
         appt_group = QGroupBox("Приём")
         appt_layout = QFormLayout()
         self.doctor_combo = QComboBox()
-        for d in self.database.get_doctors():
-            self.doctor_combo.addItem(f"{d['fio']} ({d['specialization']})", d['id_doctor'])
         appt_layout.addRow("Врач:", self.doctor_combo)
 
         self.date_edit = QDateEdit(QDate.currentDate())
@@ -202,10 +228,6 @@ class NewAppointmentDialog(QDialog):
         services_layout = QVBoxLayout()
         self.services_list = QListWidget()
         self.services_list.setSelectionMode(QAbstractItemView.MultiSelection)
-        for s in self.database.get_services():
-            item = QListWidgetItem(f"{s['service_name']} — {s['price_paid']} руб.")
-            item.setData(Qt.UserRole, s)
-            self.services_list.addItem(item)
         self.services_list.itemSelectionChanged.connect(self.update_total)
         services_layout.addWidget(self.services_list)
 
@@ -215,13 +237,33 @@ class NewAppointmentDialog(QDialog):
         services_group.setLayout(services_layout)
         layout.addWidget(services_group)
 
-        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
-        buttons.accepted.connect(self.accept)
-        buttons.rejected.connect(self.reject)
-        layout.addWidget(buttons)
+        self.buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        self.buttons.accepted.connect(self.accept)
+        self.buttons.rejected.connect(self.reject)
+        self.buttons.button(QDialogButtonBox.Ok).setEnabled(False)
+        layout.addWidget(self.buttons)
+
+        self.runner.submit('get_doctors', on_result=self.fill_doctors, channel=(self, 'doctors'))
+        self.runner.submit('get_services', on_result=self.fill_services, channel=(self, 'services'))
+
+    def fill_doctors(self, doctors):
+        for d in doctors:
+            self.doctor_combo.addItem(f"{d['fio']} ({d['specialization']})", d['id_doctor'])
+        self.buttons.button(QDialogButtonBox.Ok).setEnabled(True)
+
+    def fill_services(self, services):
+        for s in services:
+            item = QListWidgetItem(f"{s['service_name']} — {s['price_paid']} руб.")
+            item.setData(Qt.UserRole, s)
+            self.services_list.addItem(item)
 
-    def on_patient_changed(self, index):
-        patient_id = self.patient_combo.currentData()
+    def done(self, result):
+        self.runner.cancel_channel(self.patient_search)
+        for name in ('doctors', 'services'):
+            self.runner.cancel_channel((self, name))
+        super().done(result)
+
+    def on_patient_changed(self, patient_id):
         is_new = patient_id is None
         self.fio_edit.setEnabled(is_new)
         self.phone_edit.setEnabled(is_new)
@@ -239,7 +281,7 @@ class NewAppointmentDialog(QDialog):
         selected_services = [item.data(Qt.UserRole) for item in self.services_list.selectedItems()]
         total = sum(s['price_paid'] for s in selected_services)
         return {
-            'patient_id': self.patient_combo.currentData(),
+            'patient_id': self.patient_search.patient_id,
             'fio': self.fio_edit.text().strip(),
             'phone': self.phone_edit.text().strip(),
             'email': self.email_edit.text().strip(),
@@ -254,9 +296,10 @@ class NewAppointmentDialog(QDialog):
 
 
 class EditAppointmentDialog(QDialog):
-    def __init__(self, database: Database, appointment: dict, parent=None):
+    def __init__(self, database: Database, runner: QueryRunner, appointment: dict, parent=None):
         super().__init__(parent)
         self.database = database
+        self.runner = runner
         self.appointment = appointment
         self.setWindowTitle(f"Редактирование приёма #{appointment['id_appointment']}")
         self.setMinimumWidth(600)
@@ -278,11 +321,6 @@ class EditAppointmentDialog(QDialog):
         edit_layout = QFormLayout()
 
         self.doctor_combo = QComboBox()
-        doctors = self.database.get_doctors()
-        for i, d in enumerate(doctors):
-            self.doctor_combo.addItem(f"{d['fio']} ({d['specialization']})", d['id_doctor'])
-            if d['id_doctor'] == self.appointment['id_doctor']:
-                self.doctor_combo.setCurrentIndex(i)
         edit_layout.addRow("Врач:", self.doctor_combo)
 
         self.status_combo = QComboBox()
@@ -301,18 +339,6 @@ class EditAppointmentDialog(QDialog):
         services_layout = QVBoxLayout()
         self.services_list = QListWidget()
         self.services_list.setSelectionMode(QAbstractItemView.MultiSelection)
-
-        current_service_ids = set()
-        for s in self.database.get_appointment_services(self.appointment['id_appointment']):
-            current_service_ids.add(s['id_service'])
-
-        for s in self.database.get_services():
-            item = QListWidgetItem(f"{s['service_name']} — {s['price_paid']} руб.")
-            item.setData(Qt.UserRole, s)
-            self.services_list.addItem(item)
-            if s['id_service'] in current_service_ids:
-                item.setSelected(True)
-
         self.services_list.itemSelectionChanged.connect(self.update_total)
         services_layout.addWidget(self.services_list)
 
@@ -323,10 +349,40 @@ class EditAppointmentDialog(QDialog):
         services_group.setLayout(services_layout)
         layout.addWidget(services_group)
 
-        buttons = QDialogButtonBox(QDialogButtonBox.Save | QDialogButtonBox.Cancel)
-        buttons.accepted.connect(self.accept)
-        buttons.rejected.connect(self.reject)
-        layout.addWidget(buttons)
+        self.buttons = QDialogButtonBox(QDialogButtonBox.Save | QDialogButtonBox.Cancel)
+        self.buttons.accepted.connect(self.accept)
+        self.buttons.rejected.connect(self.reject)
+        self.buttons.button(QDialogButtonBox.Save).setEnabled(False)
+        layout.addWidget(self.buttons)
+
+        self.runner.submit('get_doctors', on_result=self.fill_doctors, channel=(self, 'doctors'))
+        self.runner.submit('get_appointment_services', self.appointment['id_appointment'],
+                           on_result=self.load_services, channel=(self, 'services'))
+
+    def fill_doctors(self, doctors):
+        for i, d in enumerate(doctors):
+            self.doctor_combo.addItem(f"{d['fio']} ({d['specialization']})", d['id_doctor'])
+            if d['id_doctor'] == self.appointment['id_doctor']:
+                self.doctor_combo.setCurrentIndex(i)
+        self.buttons.button(QDialogButtonBox.Save).setEnabled(True)
+
+    def load_services(self, current_services):
+        current_service_ids = {s['id_service'] for s in current_services}
+        self.runner.submit('get_services', on_result=lambda services: self.fill_services(services, current_service_ids),
+                           channel=(self, 'services'))
+
+    def fill_services(self, services, current_service_ids):
+        for s in services:
+            item = QListWidgetItem(f"{s['service_name']} — {s['price_paid']} руб.")
+            item.setData(Qt.UserRole, s)
+            self.services_list.addItem(item)
+            if s['id_service'] in current_service_ids:
+                item.setSelected(True)
+
+    def done(self, result):
+        for name in ('doctors', 'services'):
+            self.runner.cancel_channel((self, name))
+        super().done(result)
 
     def update_total(self):
         total = sum(item.data(Qt.UserRole)['price_paid'] for item in self.services_list.selectedItems())
@@ -344,12 +400,197 @@ class EditAppointmentDialog(QDialog):
         }
 
 
+class AppointmentTableModel(QAbstractTableModel):
+    COLUMNS = [
+        ("ID", 'id_appointment', 'id'),
+        ("Дата", 'appointment_date', 'date'),
+        ("Время", 'appointment_time', 'time'),
+        ("Пациент", 'patient_fio', 'patient'),
+        ("Врач", 'doctor_fio', 'doctor'),
+        ("Тип", 'appointment_type', 'type'),
+        ("Статус", 'status', 'status'),
+        ("Стоимость", 'price', 'price'),
+    ]
+    PAGE_SIZE = 200
+
+    def __init__(self, runner: QueryRunner, parent=None):
+        super().__init__(parent)
+        self.runner = runner
+        self.rows = []
+        self.cursor = None
+        self.exhausted = True
+        self.loading = False
+        self.filters = (None, None, None)
+        self.order_by = 'date'
+        self.descending = True
+        self.watermark = None
+        self.polling = False
+        self.poll_again = False
+
+    def set_filters(self, status=None, date_from=None, date_to=None):
+        self.filters = (status, date_from, date_to)
+        self.reload()
+
+    def reload(self):
+        self.runner.cancel_channel(self)
+        self.beginResetModel()
+        self.rows = []
+        self.cursor = None
+        self.exhausted = False
+        self.loading = False
+        self.endResetModel()
+        if self.watermark is None:
+            # The watermark is taken before the first page, so any change the
+            # pages miss is picked up by the next poll.
+            self.loading = True
+            self.runner.submit('get_appointment_changes', on_result=self.on_watermark, channel=self)
+        else:
+            self.fetchMore()
+
+    def on_watermark(self, result):
+        self.watermark = result[1]
+        self.loading = False
+        self.fetchMore()
+
+    def poll_changes(self):
+        if self.watermark is None:
+            return
+        if self.polling:
+            self.poll_again = True
+            return
+        self.polling = True
+        self.poll_again = False
+        self.runner.submit('get_appointment_changes', self.watermark,
+                           on_result=self.on_changes, on_error=self.on_poll_failed)
+
+    def on_poll_failed(self, exc):
+        # A missed poll is retried by the next one; no need to interrupt the user.
+        self.polling = False
+
+    def on_changes(self, result):
+        rows, self.watermark = result
+        self.polling = False
+        for row in rows:
+            self.apply_change(row)
+        if self.poll_again or len(rows) == Database.CHANGES_LIMIT:
+            self.poll_changes()
+
+    def matches(self, row: dict) -> bool:
+        status, date_from, date_to = self.filters
+        if status and status != 'Все' and row['status'] != status:
+            return False
+        # A NULL date fails any date bound, as it does in SQL.
+        if date_from and (row['appointment_date'] is None or row['appointment_date'] < date_from):
+            return False
+        if date_to and (row['appointment_date'] is None or row['appointment_date'] > date_to):
+            return False
+        return True
+
+    def sort_key(self, row: dict) -> tuple:
+        # Mirrors the ORDER BY of get_appointments_page: COALESCE'd columns
+        # compare their default, bare ones sort NULL before any value.
+        return tuple((row[key] is not None or expression.startswith("COALESCE"),
+                      row[key] if row[key] is not None else default)
+                     for expression, key, default in APPOINTMENT_SORT_KEYS[self.order_by])
+
+    def apply_change(self, row: dict):
+        # Changed rows are updated in place, moved to their new sort position
+        # or dropped when they no longer match the filters or were archived.
+        # Rows that sort past the loaded pages are left for fetchMore to bring
+        # in.
+        current = next((i for i, r in enumerate(self.rows) if r['id_appointment'] == row['id_appointment']), None)
+        position = len(self.rows)
+        if not row.get('removed') and self.matches(row):
+            key = self.sort_key(row)
+            for i, other in enumerate(self.rows):
+                other_key = self.sort_key(other)
+                if i != current and (other_key < key if self.descending else other_key > key):
+                    position = i
+                    break
+            if current is not None and position == current + 1:
+                self.rows[current] = row
+                self.dataChanged.emit(self.index(current, 0), self.index(current, len(self.COLUMNS) - 1))
+                return
+        else:
+            position = None
+        if current is not None:
+            self.beginRemoveRows(QModelIndex(), current, current)
+            del self.rows[current]
+            self.endRemoveRows()
+            if position is not None and position > current:
+                position -= 1
+        if position is None or (position == len(self.rows) and not self.exhausted):
+            return
+        self.beginInsertRows(QModelIndex(), position, position)
+        self.rows.insert(position, row)
+        self.endInsertRows()
+
+    def appointment_at(self, row: int) -> dict:
+        return self.rows[row]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        key = self.COLUMNS[index.column()][1]
+        value = self.rows[index.row()][key]
+        if key == 'price':
+            return f"{value:.2f}" if value else "0.00"
+        if key == 'id_appointment':
+            return str(value)
+        return value
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section][0]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted and not self.loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        self.loading = True
+        self.runner.submit(
+            'get_appointments_page', *self.filters, page_size=self.PAGE_SIZE, cursor=self.cursor,
+            order_by=self.order_by, descending=self.descending,
+            on_result=self.on_page_loaded, channel=self
+        )
+
+    def on_page_loaded(self, page):
+        rows, self.cursor = page
+        self.loading = False
+        self.exhausted = self.cursor is None
+        if rows:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(rows) - 1)
+            self.rows.extend(rows)
+            self.endInsertRows()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.order_by = self.COLUMNS[column][2]
+        self.descending = order == Qt.DescendingOrder
+        self.reload()
+
+
 class AdminTab(QWidget):
-    def __init__(self, database: Database):
+    POLL_INTERVAL_MS = 5000
+
+    def __init__(self, database: Database, runner: QueryRunner):
         super().__init__()
         self.database = database
+        self.runner = runner
         self.setup_ui()
         self.load_appointments()
+        # Changes from other desks are pulled in periodically without reloading.
+        self.poll_timer = QTimer(self)
+        self.poll_timer.timeout.connect(self.model.poll_changes)
+        self.poll_timer.start(self.POLL_INTERVAL_MS)
 
     def setup_ui(self):
         layout = QVBoxLayout(self)
@@ -396,14 +637,21 @@ class AdminTab(QWidget):
         self.edit_btn.clicked.connect(self.edit_appointment)
         btn_layout.addWidget(self.edit_btn)
 
+        self.export_btn = QPushButton("Экспорт")
+        export_menu = QMenu(self.export_btn)
+        export_menu.addAction("Приёмы…", lambda: self.export('export_appointments'))
+        export_menu.addAction("Медицинские записи…", lambda: self.export('export_medical_records'))
+        self.export_btn.setMenu(export_menu)
+        btn_layout.addWidget(self.export_btn)
+
         btn_layout.addStretch()
         layout.addLayout(btn_layout)
 
-        self.table = QTableWidget()
-        self.table.setColumnCount(8)
-        self.table.setHorizontalHeaderLabels([
-            "ID", "Дата", "Время", "Пациент", "Врач", "Тип", "Статус", "Стоимость"
-        ])
+        self.model = AppointmentTableModel(self.runner, self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.horizontalHeader().setSortIndicator(1, Qt.DescendingOrder)
+        self.table.setSortingEnabled(True)
         self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.table.setSelectionMode(QAbstractItemView.SingleSelection)
         self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
@@ -412,17 +660,7 @@ class AdminTab(QWidget):
         layout.addWidget(self.table)
 
     def load_appointments(self, status=None, date_from=None, date_to=None):
-        appointments = self.database.get_appointments(status, date_from, date_to)
-        self.table.setRowCount(len(appointments))
-        for i, a in enumerate(appointments):
-            self.table.setItem(i, 0, QTableWidgetItem(str(a['id_appointment'])))
-            self.table.setItem(i, 1, QTableWidgetItem(a['appointment_date']))
-            self.table.setItem(i, 2, QTableWidgetItem(a['appointment_time']))
-            self.table.setItem(i, 3, QTableWidgetItem(a['patient_fio']))
-            self.table.setItem(i, 4, QTableWidgetItem(a['doctor_fio']))
-            self.table.setItem(i, 5, QTableWidgetItem(a['appointment_type']))
-            self.table.setItem(i, 6, QTableWidgetItem(a['status']))
-            self.table.setItem(i, 7, QTableWidgetItem(f"{a['price']:.2f}" if a['price'] else "0.00"))
+        self.model.set_filters(status, date_from, date_to)
 
     def apply_filter(self):
         status = self.status_filter.currentText()
@@ -435,85 +673,262 @@ class AdminTab(QWidget):
         self.load_appointments()
 
     def get_selected_id(self) -> Optional[int]:
-        row = self.table.currentRow()
-        if row < 0:
+        index = self.table.currentIndex()
+        if not index.isValid():
             return None
-        return int(self.table.item(row, 0).text())
+        return self.model.appointment_at(index.row())['id_appointment']
 
     def new_appointment(self):
-        dialog = NewAppointmentDialog(self.database, self)
+        dialog = NewAppointmentDialog(self.database, self.runner, self)
         if dialog.exec_() == QDialog.Accepted:
             data = dialog.get_data()
-            if data['patient_id'] is None:
-                if not data['fio']:
-                    QMessageBox.warning(self, "Ошибка", "Введите ФИО пациента")
-                    return
-                patient_id = self.database.create_patient(data['fio'], data['phone'], data['email'])
-            else:
-                patient_id = data['patient_id']
-
-            appt_id = self.database.create_appointment(
-                patient_id, data['doctor_id'], data['date'], data['time'],
-                data['type'], data['notes'], data['total']
+            if data['patient_id'] is None and not data['fio']:
+                QMessageBox.warning(self, "Ошибка", "Введите ФИО пациента")
+                return
+
+            self.runner.submit(
+                'create_appointment_with_services',
+                data['patient_id'], data['doctor_id'], data['date'], data['time'],
+                data['type'], data['notes'], data['total'], service_lines(data['services']),
+                patient={'fio': data['fio'], 'phone': data['phone'], 'email': data['email']},
+                on_result=self.on_appointment_created
             )
-            for s in data['services']:
-                self.database.add_appointment_service(appt_id, s['id_service'], s['price_paid'])
 
-            self.load_appointments()
-            QMessageBox.information(self, "Успех", f"Приём #{appt_id} создан")
+    def on_appointment_created(self, appt_id):
+        self.model.poll_changes()
+        QMessageBox.information(self, "Успех", f"Приём #{appt_id} создан")
 
     def edit_appointment(self):
         appt_id = self.get_selected_id()
         if not appt_id:
             QMessageBox.warning(self, "Ошибка", "Выберите приём")
             return
+        self.runner.submit('get_appointment_by_id', appt_id, on_result=self.open_edit_dialog,
+                           channel=(self, 'edit'))
 
-        appointment = self.database.get_appointment_by_id(appt_id)
+    def open_edit_dialog(self, appointment):
         if not appointment:
             return
 
-        dialog = EditAppointmentDialog(self.database, appointment, self)
+        appt_id = appointment['id_appointment']
+        dialog = EditAppointmentDialog(self.database, self.runner, appointment, self)
         if dialog.exec_() == QDialog.Accepted:
             data = dialog.get_data()
-            self.database.update_appointment(
-                appt_id, data['doctor_id'], data['status'], data['notes'], data['total']
+
+            self.runner.submit(
+                'update_appointment_with_services',
+                appt_id, data['doctor_id'], data['status'], data['notes'], data['total'],
+                service_lines(data['services']),
+                on_result=self.on_appointment_updated
             )
-            self.database.clear_appointment_services(appt_id)
-            for s in data['services']:
-                self.database.add_appointment_service(appt_id, s['id_service'], s['price_paid'])
 
-            self.load_appointments()
-            QMessageBox.information(self, "Успех", "Приём обновлён")
+    def on_appointment_updated(self, _):
+        self.model.poll_changes()
+        QMessageBox.information(self, "Успех", "Приём обновлён")
 
+    EXPORT_FILTERS = {
+        "CSV (*.csv)": ".csv",
+        "CSV, gzip (*.csv.gz)": ".csv.gz",
+        "JSON Lines (*.jsonl)": ".jsonl",
+        "JSON Lines, gzip (*.jsonl.gz)": ".jsonl.gz",
+    }
 
-class ClientTab(QWidget):
-    def __init__(self, database: Database):
+    def export(self, method: str):
+        path, selected = QFileDialog.getSaveFileName(self, "Экспорт", "", ";;".join(self.EXPORT_FILTERS))
+        if not path:
+            return
+        suffix = self.EXPORT_FILTERS.get(selected, ".csv")
+        if not path.lower().endswith(tuple(self.EXPORT_FILTERS.values())):
+            path += suffix
+
+        progress = QProgressDialog("Экспорт…", "Отмена", 0, 0, self)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(500)
+
+        def on_progress(written, total):
+            progress.setMaximum(total or 0)
+            progress.setValue(written)
+
+        def on_done(count):
+            progress.reset()
+            QMessageBox.information(self, "Успех", f"Экспортировано записей: {count}")
+
+        def on_error(exc):
+            progress.reset()
+            QMessageBox.warning(self, "Ошибка", f"Не удалось выполнить экспорт: {exc}")
+
+        status, date_from, date_to = self.model.filters
+        ticket = self.runner.submit(method, path, status, date_from, date_to,
+                                    on_result=on_done, on_error=on_error, on_progress=on_progress)
+        progress.canceled.connect(lambda: self.runner.cancel(ticket))
+
+
+class ReportsTab(QWidget):
+    def __init__(self, runner: QueryRunner):
         super().__init__()
-        self.database = database
-        self.current_patient_id = None
+        from reports import REPORTS
+        self.reports = REPORTS
+        self.runner = runner
         self.setup_ui()
 
     def setup_ui(self):
         layout = QVBoxLayout(self)
 
-        patient_group = QGroupBox("Выбор пациента")
-        patient_layout = QHBoxLayout()
-        self.patient_combo = QComboBox()
-        self.patient_combo.addItem("-- Выберите --", None)
-        for p in self.database.get_patients():
-            self.patient_combo.addItem(f"{p['fio']} ({p['phone']})", p['id_patient'])
-        self.patient_combo.currentIndexChanged.connect(self.on_patient_selected)
-        patient_layout.addWidget(self.patient_combo)
-        patient_layout.addStretch()
-        patient_group.setLayout(patient_layout)
-        layout.addWidget(patient_group)
+        params_layout = QHBoxLayout()
+        params_layout.addWidget(QLabel("Отчёт:"))
+        self.report_combo = QComboBox()
+        for name, report in self.reports.items():
+            self.report_combo.addItem(report.title, name)
+        params_layout.addWidget(self.report_combo)
+
+        params_layout.addWidget(QLabel("Дата с:"))
+        self.date_from = QDateEdit()
+        self.date_from.setCalendarPopup(True)
+        self.date_from.setDate(QDate.currentDate().addMonths(-1))
+        params_layout.addWidget(self.date_from)
+
+        params_layout.addWidget(QLabel("по:"))
+        self.date_to = QDateEdit()
+        self.date_to.setCalendarPopup(True)
+        self.date_to.setDate(QDate.currentDate())
+        params_layout.addWidget(self.date_to)
+
+        self.build_btn = QPushButton("Сформировать")
+        self.build_btn.clicked.connect(self.build_report)
+        params_layout.addWidget(self.build_btn)
+        params_layout.addStretch()
+        layout.addLayout(params_layout)
+
+        self.table = QTableWidget()
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(self.table)
 
-        book_group = QGroupBox("Запись на приём")
-        book_layout = QFormLayout()
+    def build_report(self):
+        if self.date_from.date() > self.date_to.date():
+            QMessageBox.warning(self, "Ошибка", "Начальная дата позже конечной")
+            return
+        name = self.report_combo.currentData()
+        date_from = self.date_from.date().toString("yyyy-MM-dd")
+        date_to = self.date_to.date().toString("yyyy-MM-dd")
+        self.runner.submit('get_report', name, date_from, date_to,
+                           on_result=lambda rows: self.show_report(name, rows), channel=self)
+
+    def show_report(self, name: str, rows: List[dict]):
+        columns = self.reports[name].columns
+        self.table.clear()
+        self.table.setColumnCount(len(columns))
+        self.table.setHorizontalHeaderLabels([title for title, _ in columns])
+        self.table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            for j, (_, key) in enumerate(columns):
+                value = row[key]
+                if value is None:
+                    text = ""
+                elif isinstance(value, float):
+                    text = f"{value:.2f}"
+                else:
+                    text = str(value)
+                item = QTableWidgetItem(text)
+                if isinstance(value, (int, float)):
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(i, j, item)
+
+
+class RecordSearchTab(QWidget):
+    COLUMNS = ["Дата", "Пациент", "Врач", "МКБ-10", "Диагноз", "Фрагмент"]
+
+    def __init__(self, runner: QueryRunner):
+        super().__init__()
+        self.runner = runner
+        self.cursor = None
+        self.request = None
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+
+        params_layout = QHBoxLayout()
+        params_layout.addWidget(QLabel("Текст:"))
+        self.query_edit = QLineEdit()
+        self.query_edit.setPlaceholderText("Жалобы, осмотр, диагноз, план лечения")
+        self.query_edit.returnPressed.connect(self.search)
+        params_layout.addWidget(self.query_edit, 1)
+
+        params_layout.addWidget(QLabel("МКБ-10:"))
+        self.icd_edit = IcdCodeEdit()
+        self.icd_edit.setPlaceholderText("код или название")
+        self.icd_edit.setMaximumWidth(160)
+        self.icd_edit.returnPressed.connect(self.search)
+        params_layout.addWidget(self.icd_edit)
+
+        self.search_btn = QPushButton("Найти")
+        self.search_btn.clicked.connect(self.search)
+        params_layout.addWidget(self.search_btn)
+        layout.addLayout(params_layout)
+
+        self.table = QTableWidget()
+        self.table.setColumnCount(len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setSectionResizeMode(5, QHeaderView.Stretch)
+        layout.addWidget(self.table)
+
+        self.more_btn = QPushButton("Показать ещё")
+        self.more_btn.clicked.connect(self.load_more)
+        self.more_btn.hide()
+        layout.addWidget(self.more_btn)
+
+    def search(self):
+        query = self.query_edit.text().strip()
+        icd = self.icd_edit.text().strip() or None
+        self.table.setRowCount(0)
+        self.cursor = None
+        self.more_btn.hide()
+        if not query and not icd:
+            self.runner.cancel_channel(self)
+            self.request = None
+            return
+        self.request = (query, icd)
+        self.load_more()
+
+    def load_more(self):
+        query, icd = self.request
+        self.more_btn.setEnabled(False)
+        self.runner.submit('search_medical_records', query, icd, cursor=self.cursor,
+                           on_result=self.show_page, channel=self)
+
+    def show_page(self, page):
+        matches, self.cursor = page
+        row = self.table.rowCount()
+        self.table.setRowCount(row + len(matches))
+        for i, m in enumerate(matches, start=row):
+            values = [m['record_date'], m['patient_fio'], m['doctor_fio'], m['diagnosis_icd10'],
+                      m['diagnosis_description'], m['snippet']]
+            for column, value in enumerate(values):
+                self.table.setItem(i, column, QTableWidgetItem(value or ""))
+        self.more_btn.setEnabled(True)
+        self.more_btn.setVisible(self.cursor is not None)
+
+
+class BookingForm(QGroupBox):
+    # Booking with free-slot search, shared by the registrar's client tab and
+    # the client's own window. The owner sets patient_id and reloads the
+    # history on `booked`.
+    booked = pyqtSignal(int)
+
+    def __init__(self, runner: QueryRunner, missing_patient: str, parent=None):
+        super().__init__("Запись на приём", parent)
+        self.runner = runner
+        self.missing_patient = missing_patient
+        self.patient_id = None
+        self.doctor_specializations = {}
+
+        book_layout = QFormLayout(self)
 
         self.book_doctor = QComboBox()
-        for d in self.database.get_doctors():
-            self.book_doctor.addItem(f"{d['fio']} ({d['specialization']})", d['id_doctor'])
         book_layout.addRow("Врач:", self.book_doctor)
 
         self.book_date = QDateEdit(QDate.currentDate().addDays(1))
@@ -529,78 +944,147 @@ class ClientTab(QWidget):
         book_layout.addRow("Тип приёма:", self.book_type)
 
         self.book_service = QComboBox()
-        for s in self.database.get_services():
-            self.book_service.addItem(f"{s['service_name']} — {s['price_paid']} руб.", s)
         book_layout.addRow("Услуга:", self.book_service)
 
+        slots_layout = QHBoxLayout()
+        self.slots_btn = QPushButton("Свободное время")
+        self.slots_btn.clicked.connect(self.find_slots)
+        slots_layout.addWidget(self.slots_btn)
+        self.any_doctor_check = QCheckBox("Любой врач этой специализации")
+        slots_layout.addWidget(self.any_doctor_check)
+        slots_layout.addStretch()
+        book_layout.addRow("", slots_layout)
+
+        self.slots_list = QListWidget()
+        self.slots_list.setMaximumHeight(100)
+        self.slots_list.itemClicked.connect(self.on_slot_chosen)
+        book_layout.addRow("", self.slots_list)
+
         self.book_btn = QPushButton("Записаться")
         self.book_btn.clicked.connect(self.book_appointment)
         book_layout.addRow("", self.book_btn)
-        book_group.setLayout(book_layout)
-        layout.addWidget(book_group)
 
-        history_group = QGroupBox("История обслуживания")
-        history_layout = QVBoxLayout()
+    def load_reference_data(self):
+        self.runner.submit('get_doctors', on_result=self.fill_doctors)
+        self.runner.submit('get_services', on_result=self.fill_services)
 
-        self.history_table = QTableWidget()
-        self.history_table.setColumnCount(6)
-        self.history_table.setHorizontalHeaderLabels([
-            "ID", "Дата", "Время", "Врач", "Статус", "Стоимость"
-        ])
-        self.history_table.setSelectionBehavior(QAbstractItemView.SelectRows)
-        self.history_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
-        self.history_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        history_layout.addWidget(self.history_table)
-        history_group.setLayout(history_layout)
-        layout.addWidget(history_group)
+    def fill_doctors(self, doctors):
+        for d in doctors:
+            self.book_doctor.addItem(f"{d['fio']} ({d['specialization']})", d['id_doctor'])
+            self.doctor_specializations[d['id_doctor']] = d['specialization']
 
-    def on_patient_selected(self, index):
-        self.current_patient_id = self.patient_combo.currentData()
-        self.load_history()
+    def fill_services(self, services):
+        for s in services:
+            self.book_service.addItem(f"{s['service_name']} — {s['price_paid']} руб.", s)
 
-    def load_history(self):
-        self.history_table.setRowCount(0)
-        if not self.current_patient_id:
+    def find_slots(self):
+        id_doctor = self.book_doctor.currentData()
+        if id_doctor is None:
             return
-
-        appointments = self.database.get_patient_appointments(self.current_patient_id)
-        self.history_table.setRowCount(len(appointments))
-        for i, a in enumerate(appointments):
-            self.history_table.setItem(i, 0, QTableWidgetItem(str(a['id_appointment'])))
-            self.history_table.setItem(i, 1, QTableWidgetItem(a['appointment_date']))
-            self.history_table.setItem(i, 2, QTableWidgetItem(a['appointment_time']))
-            self.history_table.setItem(i, 3, QTableWidgetItem(a['doctor_fio']))
-            self.history_table.setItem(i, 4, QTableWidgetItem(a['status']))
-            self.history_table.setItem(i, 5, QTableWidgetItem(f"{a['price']:.2f}" if a['price'] else "0.00"))
+        service = self.book_service.currentData()
+        after = max(datetime.now(), datetime.combine(self.book_date.date().toPyDate(), datetime.min.time()))
+        filters = {'specialization': self.doctor_specializations.get(id_doctor)} \
+            if self.any_doctor_check.isChecked() else {'id_doctor': id_doctor}
+        self.runner.submit('find_free_slots', 10, after=after.isoformat(timespec='minutes'),
+                           services=service_lines([service] if service else []),
+                           on_result=self.show_slots, channel=(self, 'slots'), **filters)
+
+    def show_slots(self, slots):
+        self.slots_list.clear()
+        for slot in slots:
+            item = QListWidgetItem(f"{slot['date']} {slot['time'][:5]} — {slot['doctor_fio']}")
+            item.setData(Qt.UserRole, slot)
+            self.slots_list.addItem(item)
+        if not slots:
+            self.slots_list.addItem("Свободного времени не найдено")
+
+    def on_slot_chosen(self, item):
+        slot = item.data(Qt.UserRole)
+        if not slot:
+            return
+        self.book_doctor.setCurrentIndex(self.book_doctor.findData(slot['id_doctor']))
+        self.book_date.setDate(QDate.fromString(slot['date'], "yyyy-MM-dd"))
+        self.book_time.setTime(QTime.fromString(slot['time'], "HH:mm:ss"))
 
     def book_appointment(self):
-        if not self.current_patient_id:
-            QMessageBox.warning(self, "Ошибка", "Выберите пациента")
+        if not self.patient_id:
+            QMessageBox.warning(self, "Ошибка", self.missing_patient)
             return
 
         service = self.book_service.currentData()
         price = service['price_paid'] if service else 0
 
-        appt_id = self.database.create_appointment(
-            self.current_patient_id,
+        self.book_btn.setEnabled(False)
+        self.runner.submit(
+            'create_appointment_with_services',
+            self.patient_id,
             self.book_doctor.currentData(),
             self.book_date.date().toString("yyyy-MM-dd"),
             self.book_time.time().toString("HH:mm:ss"),
             self.book_type.currentText(),
             "",
-            price
+            price,
+            service_lines([service] if service else []),
+            on_result=self.on_booked, on_error=self.on_book_failed
         )
-        if service:
-            self.database.add_appointment_service(appt_id, service['id_service'], price)
 
-        self.load_history()
+    def on_booked(self, appt_id):
+        self.book_btn.setEnabled(True)
+        self.booked.emit(appt_id)
         QMessageBox.information(self, "Успех", f"Вы записаны на приём #{appt_id}")
 
+    def on_book_failed(self, exc):
+        self.book_btn.setEnabled(True)
+        QMessageBox.warning(self, "Ошибка", str(exc))
+
+
+class ClientTab(QWidget):
+    def __init__(self, database: Database, runner: QueryRunner):
+        super().__init__()
+        self.database = database
+        self.runner = runner
+        self.current_patient_id = None
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+
+        patient_group = QGroupBox("Выбор пациента")
+        patient_layout = QHBoxLayout()
+        self.patient_search = PatientSearchEdit(self.runner)
+        self.patient_search.patient_selected.connect(self.on_patient_selected)
+        patient_layout.addWidget(self.patient_search)
+        patient_group.setLayout(patient_layout)
+        layout.addWidget(patient_group)
+
+        self.booking = BookingForm(self.runner, "Выберите пациента")
+        self.booking.booked.connect(self.load_history)
+        layout.addWidget(self.booking)
+
+        history_group = QGroupBox("История обслуживания")
+        history_layout = QVBoxLayout()
+
+        self.history = PatientTimeline(self.runner)
+        history_layout.addWidget(self.history)
+        history_group.setLayout(history_layout)
+        layout.addWidget(history_group)
+
+        self.booking.load_reference_data()
+
+    def on_patient_selected(self, patient_id):
+        self.current_patient_id = patient_id
+        self.booking.patient_id = patient_id
+        self.load_history()
+
+    def load_history(self):
+        self.history.set_patient(self.current_patient_id)
+
 
 class LoginDialog(QDialog):
-    def __init__(self, database: Database, parent=None):
+    def __init__(self, database: Database, runner: QueryRunner, parent=None):
         super().__init__(parent)
         self.database = database
+        self.runner = runner
         self.user = None
         self.setWindowTitle("Авторизация")
         self.setFixedSize(300, 150)
@@ -635,7 +1119,16 @@ class LoginDialog(QDialog):
         login = self.login_edit.text().strip()
         password = self.password_edit.text()
 
-        user = self.database.authenticate(login, password)
+        self.login_btn.setEnabled(False)
+        self.runner.submit('authenticate', login, password, on_result=self.on_authenticated,
+                           on_error=self.on_login_failed, channel=self)
+
+    def on_login_failed(self, exc):
+        self.login_btn.setEnabled(True)
+        self.error_label.setText(str(exc))
+
+    def on_authenticated(self, user):
+        self.login_btn.setEnabled(True)
         if user:
             self.user = user
             self.accept()
@@ -649,23 +1142,49 @@ class LoginDialog(QDialog):
 
 
 class AdminWindow(QMainWindow):
-    def __init__(self, database: Database, user: dict):
+    def __init__(self, database: Database, runner: QueryRunner, user: dict):
         super().__init__()
         self.database = database
+        self.runner = runner
         self.user = user
         self.setWindowTitle("Медицинская клиника — Администратор")
         self.setMinimumSize(1000, 700)
 
-        central = QWidget()
-        layout = QVBoxLayout(central)
-        layout.addWidget(AdminTab(self.database))
-        self.setCentralWidget(central)
+        self.tabs = QTabWidget()
+        self.tabs.addTab(AdminTab(self.database, self.runner), "Приёмы")
+        # The other tabs are built the first time they are opened.
+        self.lazy_tabs = {
+            1: ("Отчёты", lambda: ReportsTab(self.runner)),
+            2: ("Медицинские записи", lambda: RecordSearchTab(self.runner)),
+        }
+        for title, _ in self.lazy_tabs.values():
+            self.tabs.addTab(QWidget(), title)
+        self.tabs.currentChanged.connect(self.on_tab_changed)
+        self.setCentralWidget(self.tabs)
+        self.statusBar().addPermanentWidget(BusyIndicator(self.runner))
+        self.runner.failed.connect(self.show_error)
+
+    def show_error(self, message: str):
+        QMessageBox.warning(self, "Ошибка", message)
+
+    def on_tab_changed(self, index: int):
+        if index not in self.lazy_tabs:
+            return
+        title, build = self.lazy_tabs.pop(index)
+        placeholder = self.tabs.widget(index)
+        self.tabs.blockSignals(True)
+        self.tabs.removeTab(index)
+        self.tabs.insertTab(index, build(), title)
+        self.tabs.setCurrentIndex(index)
+        self.tabs.blockSignals(False)
+        placeholder.deleteLater()
 
 
 class ClientWindow(QMainWindow):
-    def __init__(self, database: Database, user: dict):
+    def __init__(self, database: Database, runner: QueryRunner, user: dict):
         super().__init__()
         self.database = database
+        self.runner = runner
         self.user = user
         self.patient_id = user.get('id_patient')
         patient_name = user.get('patient_fio', user['login'])
@@ -676,111 +1195,111 @@ class ClientWindow(QMainWindow):
         layout = QVBoxLayout(central)
         self.setup_ui(layout)
         self.setCentralWidget(central)
+        self.statusBar().addPermanentWidget(BusyIndicator(self.runner))
+        self.runner.failed.connect(self.show_error)
+        # Reference data is requested once the window is on screen, so the
+        # first paint does not wait behind it.
+        QTimer.singleShot(0, self.load_reference_data)
+
+    def load_reference_data(self):
+        self.booking.load_reference_data()
         self.load_history()
 
-    def setup_ui(self, layout):
-        book_group = QGroupBox("Запись на приём")
-        book_layout = QFormLayout()
+    def show_error(self, message: str):
+        QMessageBox.warning(self, "Ошибка", message)
 
-        self.book_doctor = QComboBox()
-        for d in self.database.get_doctors():
-            self.book_doctor.addItem(f"{d['fio']} ({d['specialization']})", d['id_doctor'])
-        book_layout.addRow("Врач:", self.book_doctor)
-
-        self.book_date = QDateEdit(QDate.currentDate().addDays(1))
-        self.book_date.setCalendarPopup(True)
-        self.book_date.setMinimumDate(QDate.currentDate())
-        book_layout.addRow("Дата:", self.book_date)
-
-        self.book_time = QTimeEdit(QTime(9, 0))
-        book_layout.addRow("Время:", self.book_time)
-
-        self.book_type = QComboBox()
-        self.book_type.addItems(APPOINTMENT_TYPES)
-        book_layout.addRow("Тип приёма:", self.book_type)
-
-        self.book_service = QComboBox()
-        for s in self.database.get_services():
-            self.book_service.addItem(f"{s['service_name']} — {s['price_paid']} руб.", s)
-        book_layout.addRow("Услуга:", self.book_service)
-
-        self.book_btn = QPushButton("Записаться")
-        self.book_btn.clicked.connect(self.book_appointment)
-        book_layout.addRow("", self.book_btn)
-        book_group.setLayout(book_layout)
-        layout.addWidget(book_group)
+    def setup_ui(self, layout):
+        self.booking = BookingForm(self.runner, "Пациент не привязан к аккаунту")
+        self.booking.patient_id = self.patient_id
+        self.booking.booked.connect(self.load_history)
+        layout.addWidget(self.booking)
 
         history_group = QGroupBox("История обслуживания")
         history_layout = QVBoxLayout()
 
-        self.history_table = QTableWidget()
-        self.history_table.setColumnCount(6)
-        self.history_table.setHorizontalHeaderLabels([
-            "ID", "Дата", "Время", "Врач", "Статус", "Стоимость"
-        ])
-        self.history_table.setSelectionBehavior(QAbstractItemView.SelectRows)
-        self.history_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
-        self.history_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        history_layout.addWidget(self.history_table)
+        self.history = PatientTimeline(self.runner)
+        history_layout.addWidget(self.history)
         history_group.setLayout(history_layout)
         layout.addWidget(history_group)
 
     def load_history(self):
-        self.history_table.setRowCount(0)
-        if not self.patient_id:
+        self.history.set_patient(self.patient_id)
+
+
+class StartupTimer:
+    # Set MEDICAL_STARTUP_REPORT to "-" to print the stages to stderr, or to a
+    # file path to append one JSON line per launch.
+    def __init__(self, started: float):
+        self.started = started
+        self.marks = {}
+
+    def mark(self, stage: str):
+        self.marks[stage] = round((time.perf_counter() - self.started) * 1000, 1)
+
+    def mark_when_idle(self, stage: str, then=None):
+        # Runs once the event loop has processed pending paint events.
+        def done():
+            self.mark(stage)
+            if then is not None:
+                then()
+        QTimer.singleShot(0, done)
+
+    def report(self):
+        target = os.environ.get("MEDICAL_STARTUP_REPORT")
+        if not target:
             return
-
-        appointments = self.database.get_patient_appointments(self.patient_id)
-        self.history_table.setRowCount(len(appointments))
-        for i, a in enumerate(appointments):
-            self.history_table.setItem(i, 0, QTableWidgetItem(str(a['id_appointment'])))
-            self.history_table.setItem(i, 1, QTableWidgetItem(a['appointment_date']))
-            self.history_table.setItem(i, 2, QTableWidgetItem(a['appointment_time']))
-            self.history_table.setItem(i, 3, QTableWidgetItem(a['doctor_fio']))
-            self.history_table.setItem(i, 4, QTableWidgetItem(a['status']))
-            self.history_table.setItem(i, 5, QTableWidgetItem(f"{a['price']:.2f}" if a['price'] else "0.00"))
-
-    def book_appointment(self):
-        if not self.patient_id:
-            QMessageBox.warning(self, "Ошибка", "Пациент не привязан к аккаунту")
-            return
-
-        service = self.book_service.currentData()
-        price = service['price_paid'] if service else 0
-
-        appt_id = self.database.create_appointment(
-            self.patient_id,
-            self.book_doctor.currentData(),
-            self.book_date.date().toString("yyyy-MM-dd"),
-            self.book_time.time().toString("HH:mm:ss"),
-            self.book_type.currentText(),
-            "",
-            price
-        )
-        if service:
-            self.database.add_appointment_service(appt_id, service['id_service'], price)
-
-        self.load_history()
-        QMessageBox.information(self, "Успех", f"Вы записаны на приём #{appt_id}")
+        marks = dict(self.marks)
+        if 'login_accepted' in marks and 'window_ready' in marks:
+            # Time-to-interactive without the time spent typing the password.
+            marks['interactive'] = round(marks['login_shown'] + marks['window_ready'] - marks['login_accepted'], 1)
+        if target == "-":
+            for stage, ms in marks.items():
+                print(f"{stage:<16} {ms:>9.1f} ms", file=sys.stderr)
+        else:
+            with open(target, "a", encoding="utf-8") as out:
+                out.write(json.dumps({'time': datetime.now().isoformat(timespec='seconds'), **marks}) + "\n")
+
+
+def open_database(argv: List[str]):
+    # --server HOST:PORT (or MEDICAL_SERVER) talks to a shared service.py
+    # instead of opening the database file directly; the service's token is
+    # read from MEDICAL_SERVICE_TOKEN.
+    server = os.environ.get("MEDICAL_SERVER")
+    for i, arg in enumerate(argv):
+        if arg == "--server" and i + 1 < len(argv):
+            server = argv[i + 1]
+        elif arg.startswith("--server="):
+            server = arg.split("=", 1)[1]
+    if server:
+        from service import RemoteDatabase
+        return RemoteDatabase(server)
+    return Database()
 
 
 def main():
+    timer = StartupTimer(_STARTED)
+    timer.mark('imports')
     app = QApplication(sys.argv)
 
-    database = Database()
+    database = open_database(sys.argv)
+    runner = QueryRunner(database)
+    timer.mark('database')
 
-    login_dialog = LoginDialog(database)
+    login_dialog = LoginDialog(database, runner)
+    timer.mark_when_idle('login_shown')
     if login_dialog.exec_() != QDialog.Accepted:
         sys.exit(0)
+    timer.mark('login_accepted')
 
     user = login_dialog.get_user()
 
     if user['role'] == 'admin':
-        window = AdminWindow(database, user)
+        window = AdminWindow(database, runner, user)
     else:
-        window = ClientWindow(database, user)
+        window = ClientWindow(database, runner, user)
 
     window.show()
+    timer.mark_when_idle('window_ready', timer.report)
     sys.exit(app.exec_())
 
 
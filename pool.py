@@ -0,0 +1,165 @@
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable
+
+import db
+
+# Thread safety
+# -------------
+# ReaderPool hands out read-only connections, each to one thread at a time:
+# a connection is checked out for one operation and returned afterwards, so
+# any number of threads may share the pool. WriterQueue owns a single
+# read-write connection that only its own thread touches; other threads submit
+# callables and wait on the returned Future.
+#
+# Back-pressure
+# -------------
+# Both sides are bounded. When all readers are checked out, connection()
+# blocks until one is returned, up to `timeout` seconds, and then raises
+# PoolTimeout. The writer queue holds at most `max_pending` operations; submit()
+# blocks while it is full, again up to `timeout`. Callers therefore slow down
+# to the database's pace instead of piling up unbounded work.
+#
+# Group commit
+# ------------
+# The writer takes whatever is queued (up to `batch_size` operations), runs
+# each inside its own SAVEPOINT within one BEGIN IMMEDIATE transaction and
+# commits once. A failing operation is rolled back to its savepoint without
+# affecting the rest of the batch. Futures are resolved only after COMMIT, so
+# a caller never sees a result that is not yet durable.
+
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_MAX_PENDING = 256
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ReaderPool:
+    def __init__(self, db_path, size: int, profile: str = db.DEFAULT_PROFILE,
+                 timeout: float = DEFAULT_TIMEOUT, instrumentation=None):
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._all = []
+        for _ in range(size):
+            conn = db.get_connection(db_path, profile, instrumentation, read_only=True)
+            self._all.append(conn)
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"Все {self.size} соединений для чтения заняты") from None
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def close(self):
+        for conn in self._all:
+            conn.close()
+
+
+class WriterQueue:
+    def __init__(self, db_path, profile: str = db.DEFAULT_PROFILE, batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_pending: int = DEFAULT_MAX_PENDING, timeout: float = DEFAULT_TIMEOUT,
+                 instrumentation=None):
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.batches = 0
+        self.operations = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._ready = threading.Event()
+        self._startup_error = None
+        self._thread = threading.Thread(
+            target=self._run, args=(db_path, profile, instrumentation),
+            name="database-writer", daemon=True,
+        )
+        self._thread.start()
+        self._ready.wait()
+        if self._startup_error is not None:
+            raise self._startup_error
+
+    @property
+    def is_writer_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def submit(self, operation: Callable[[sqlite3.Connection], object]) -> Future:
+        future = Future()
+        try:
+            self._queue.put((operation, future), timeout=self.timeout)
+        except queue.Full:
+            raise PoolTimeout("Очередь записи переполнена") from None
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self, db_path, profile, instrumentation):
+        try:
+            conn = db.get_connection(db_path, profile, instrumentation)
+            conn.isolation_level = None
+        except Exception as exc:
+            self._startup_error = exc
+            return
+        finally:
+            self._ready.set()
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stopping = True
+                batch = [item for item in batch if item is not None]
+            if batch:
+                self._commit_batch(conn, batch)
+        conn.close()
+
+    def _commit_batch(self, conn: sqlite3.Connection, batch: list):
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for operation, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT operation")
+                try:
+                    result = operation(conn)
+                except BaseException as exc:
+                    conn.execute("ROLLBACK TO operation")
+                    conn.execute("RELEASE operation")
+                    outcomes.append((future, None, exc))
+                else:
+                    conn.execute("RELEASE operation")
+                    outcomes.append((future, result, None))
+            conn.execute("COMMIT")
+        except BaseException as exc:
+            if conn.in_transaction:
+                conn.rollback()
+            # The whole batch is lost, including operations that had succeeded.
+            outcomes = [
+                (future, None, exc) for _, future in batch
+                if future.running() or future.set_running_or_notify_cancel()
+            ]
+        self.batches += 1
+        self.operations += len(batch)
+        for future, result, exc in outcomes:
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
@@ -0,0 +1,549 @@
+import argparse
+import itertools
+import re
+import sqlite3
+import sys
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Every statement the Database issues with variable filters or ordering is
+# generated here once, from a fixed set of combinations, and kept in
+# STATEMENTS under a stable name. A given combination therefore always maps
+# to the same SQL text, which is what sqlite3's per-connection statement
+# cache keys on (sized by db.STATEMENT_CACHE_SIZE), and check_query_plans()
+# can inspect every variant.
+
+# Tables large enough that a full scan is a bug rather than a shortcut.
+LARGE_TABLES = {
+    'appointments', 'appointment_services', 'payments', 'medical_records', 'prescriptions', 'lab_orders',
+    'patients',
+}
+
+
+class Statement(NamedTuple):
+    name: str
+    sql: str
+    # The statement returns the whole table by design (an unfiltered export
+    # or count), or its scan is accepted as it stands (a page whose filter
+    # no sort index covers), so check_query_plans() accepts a scan.
+    full_scan: bool
+
+
+STATEMENTS: Dict[str, Statement] = {}
+
+
+def register(name: str, sql: str, full_scan: bool = False) -> str:
+    # Whitespace is collapsed so that the text does not depend on how the
+    # builder indented it.
+    sql = " ".join(sql.split())
+    existing = STATEMENTS.get(name)
+    if existing is not None and existing.sql != sql:
+        raise ValueError(f"Statement {name} is already registered with different SQL")
+    STATEMENTS[name] = Statement(name, sql, full_scan)
+    return sql
+
+
+def statement(name: str) -> str:
+    return STATEMENTS[name].sql
+
+
+# Each sort key ends with the primary key so keyset seeks are unambiguous.
+# Nullable columns are wrapped in COALESCE because row-value comparisons
+# against NULL never match; the third item is the matching Python default.
+# Date, time and status stay bare so that their sort indexes apply; their
+# default stands in for NULL in cursors, and SQLite sorts NULL first.
+# A new sort key needs a matching entry in db.GRID_SORT_INDEXES.
+APPOINTMENT_SORT_KEYS = {
+    'id': [("a.id_appointment", 'id_appointment', 0)],
+    'date': [("a.appointment_date", 'appointment_date', ''),
+             ("a.appointment_time", 'appointment_time', ''),
+             ("a.id_appointment", 'id_appointment', 0)],
+    'time': [("a.appointment_time", 'appointment_time', ''),
+             ("a.id_appointment", 'id_appointment', 0)],
+    'patient': [("COALESCE(p.fio, '')", 'patient_fio', ''),
+                ("a.id_appointment", 'id_appointment', 0)],
+    'doctor': [("COALESCE(d.fio, '')", 'doctor_fio', ''),
+               ("a.id_appointment", 'id_appointment', 0)],
+    'type': [("COALESCE(a.appointment_type, '')", 'appointment_type', ''),
+             ("a.id_appointment", 'id_appointment', 0)],
+    'status': [("a.status", 'status', ''),
+               ("a.id_appointment", 'id_appointment', 0)],
+    'price': [("COALESCE(a.price, 0)", 'price', 0),
+              ("a.id_appointment", 'id_appointment', 0)],
+}
+
+# Appointment filters in their canonical order: (name, condition).
+APPOINTMENT_FILTERS = [
+    ('status', "a.status = ?"),
+    ('date_from', "a.appointment_date >= ?"),
+    ('date_to', "a.appointment_date <= ?"),
+]
+
+APPOINTMENT_COLUMNS = """
+    SELECT a.id_appointment, a.appointment_date, a.appointment_time,
+           a.appointment_type, a.status, a.price, a.notes,
+           p.fio as patient_fio, p.phone as patient_phone,
+           d.fio as doctor_fio, d.specialization
+    FROM appointments a
+    JOIN patients p ON a.id_patient = p.id_patient
+    JOIN doctors d ON a.id_doctor = d.id_doctor
+"""
+
+MEDICAL_RECORD_COLUMNS = """
+    SELECT r.id_record, r.id_appointment, r.record_date,
+           p.fio AS patient_fio, p.medical_card_number,
+           d.fio AS doctor_fio, d.specialization,
+           r.complaints, r.examination, r.diagnosis_icd10, r.diagnosis_description, r.treatment_plan
+    FROM medical_records r
+    JOIN appointments a ON a.id_appointment = r.id_appointment
+    LEFT JOIN patients p ON p.id_patient = r.id_patient
+    LEFT JOIN doctors d ON d.id_doctor = r.id_doctor
+"""
+
+
+def appointment_filters(status: Optional[str], date_from: Optional[str],
+                        date_to: Optional[str]) -> Tuple[Tuple[str, ...], list]:
+    # Returns the names of the filters in use, in canonical order, and their
+    # parameters in the same order.
+    values = {
+        'status': status if status and status != 'Все' else None,
+        'date_from': date_from or None,
+        'date_to': date_to or None,
+    }
+    active = tuple(name for name, _ in APPOINTMENT_FILTERS if values[name] is not None)
+    return active, [values[name] for name in active]
+
+
+def _where(conditions: List[str]) -> str:
+    return " WHERE " + " AND ".join(conditions) if conditions else ""
+
+
+def _filter_conditions(active: Tuple[str, ...]) -> List[str]:
+    return [condition for name, condition in APPOINTMENT_FILTERS if name in active]
+
+
+def _name(family: str, active: Tuple[str, ...], *variant: str) -> str:
+    return f"{family}[{','.join(active)}]" + "".join(f":{part}" for part in variant)
+
+
+def appointment_list(active: Tuple[str, ...]) -> str:
+    return statement(_name("appointments.list", active))
+
+
+def _bounds_first_key(order_by: str) -> bool:
+    # A row value over a patient or doctor column and the appointment id
+    # spans two tables, so SQLite cannot start the sort index scan at it; a
+    # separate bound on the first column alone lets it.
+    return not APPOINTMENT_SORT_KEYS[order_by][0][0].replace("COALESCE(", "").startswith("a.")
+
+
+def appointment_seek_params(order_by: str, values: list) -> list:
+    # Parameters for the seek conditions of appointment_page(), from the
+    # sort key values of the last row shown.
+    return [values[0], *values] if _bounds_first_key(order_by) else list(values)
+
+
+def appointment_page(active: Tuple[str, ...], order_by: str, descending: bool, seek: bool) -> str:
+    return statement(_name("appointments.page", active, order_by,
+                           "desc" if descending else "asc", "seek" if seek else "first"))
+
+
+def appointment_export(active: Tuple[str, ...]) -> Tuple[str, str]:
+    return statement(_name("appointments.export", active)), statement(_name("appointments.count", active))
+
+
+def medical_record_export(active: Tuple[str, ...]) -> Tuple[str, str]:
+    return statement(_name("medical_records.export", active)), statement(_name("medical_records.count", active))
+
+
+def _register_appointments(active: Tuple[str, ...]):
+    conditions = _filter_conditions(active)
+    unfiltered = not active
+    register(_name("appointments.list", active),
+             APPOINTMENT_COLUMNS + _where(conditions) + " ORDER BY a.appointment_date DESC, a.appointment_time DESC",
+             full_scan=unfiltered)
+    for order_by, sort_key in APPOINTMENT_SORT_KEYS.items():
+        expressions = ", ".join(expr for expr, _, _ in sort_key)
+        placeholders = ", ".join("?" for _ in sort_key)
+        for descending, seek in itertools.product((True, False), (False, True)):
+            page_conditions = list(conditions)
+            if seek:
+                if _bounds_first_key(order_by):
+                    page_conditions.append(f"{sort_key[0][0]} {'<=' if descending else '>='} ?")
+                page_conditions.append(f"({expressions}) {'<' if descending else '>'} ({placeholders})")
+            direction = " DESC" if descending else ""
+            # Neither the primary key nor the patient name index carries the
+            # appointment date, so a date filter alone is tested row by row
+            # along the sort order: an empty window reads every appointment.
+            dated_only = 'status' not in active and not unfiltered
+            register(_name("appointments.page", active, order_by, "desc" if descending else "asc",
+                           "seek" if seek else "first"),
+                     APPOINTMENT_COLUMNS + _where(page_conditions)
+                     + " ORDER BY " + ", ".join(expr + direction for expr, _, _ in sort_key) + " LIMIT ?",
+                     full_scan=dated_only and order_by in ('id', 'patient'))
+    register(_name("appointments.export", active),
+             APPOINTMENT_COLUMNS + _where(conditions)
+             + " ORDER BY a.appointment_date, a.appointment_time, a.id_appointment",
+             full_scan=unfiltered)
+    register(_name("appointments.count", active),
+             "SELECT COUNT(*) FROM appointments a" + _where(conditions), full_scan=unfiltered)
+    # Chronological like the appointment export, so a date range is read
+    # through the appointment date index.
+    register(_name("medical_records.export", active),
+             MEDICAL_RECORD_COLUMNS + _where(conditions)
+             + " ORDER BY a.appointment_date, a.appointment_time, r.id_record",
+             full_scan=unfiltered)
+    register(_name("medical_records.count", active),
+             "SELECT COUNT(*) FROM medical_records r JOIN appointments a ON a.id_appointment = r.id_appointment"
+             + _where(conditions), full_scan=unfiltered)
+
+
+for _size in range(len(APPOINTMENT_FILTERS) + 1):
+    for _active in itertools.combinations([name for name, _ in APPOINTMENT_FILTERS], _size):
+        _register_appointments(_active)
+
+
+# Appointments moved out by archive.py leave a tombstone, sent as a removed
+# row stamped with the time it was archived.
+APPOINTMENT_CHANGES = register("appointments.changes", """
+    SELECT a.id_appointment AS id_appointment, a.appointment_date, a.appointment_time,
+           a.appointment_type, a.status, a.price, a.notes,
+           p.fio as patient_fio, p.phone as patient_phone,
+           d.fio as doctor_fio, d.specialization, a.updated_at AS updated_at, 0 AS removed
+    FROM appointments a
+    JOIN patients p ON a.id_patient = p.id_patient
+    JOIN doctors d ON a.id_doctor = d.id_doctor
+    WHERE (a.updated_at, a.id_appointment) > (:changed_at, :id_appointment)
+    UNION ALL
+    SELECT t.id_appointment, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, t.removed_at, 1
+    FROM appointment_tombstones t
+    WHERE (t.removed_at, t.id_appointment) > (:changed_at, :id_appointment)
+    ORDER BY updated_at, id_appointment
+    LIMIT :limit
+""")
+
+APPOINTMENT_WATERMARK = register("appointments.watermark", "SELECT MAX(updated_at) FROM appointments")
+
+APPOINTMENT_BY_ID = register("appointments.by_id", """
+    SELECT a.id_appointment, a.id_patient, a.id_doctor, a.appointment_date, a.appointment_time,
+           a.end_time, a.appointment_type, a.status, a.price, a.notes,
+           p.fio as patient_fio, p.phone as patient_phone,
+           d.fio as doctor_fio, d.specialization
+    FROM appointments a
+    JOIN patients p ON a.id_patient = p.id_patient
+    JOIN doctors d ON a.id_doctor = d.id_doctor
+    WHERE a.id_appointment = ?
+""")
+
+PATIENT_SEARCH = register("patients.search", """
+    WITH hits AS (
+        SELECT rowid, rank FROM patients_fts WHERE patients_fts MATCH ? LIMIT ?
+    )
+    SELECT p.id_patient, p.fio, p.phone, p.birth_date, p.medical_card_number,
+           p.insurance_policy_number
+    FROM hits
+    JOIN patients p ON p.id_patient = hits.rowid
+    ORDER BY hits.rank
+    LIMIT ?
+""")
+
+# Schema-qualified statements run against main and against attached
+# archives; the main variant is registered.
+_PATIENT_APPOINTMENTS = """
+    SELECT a.id_appointment, a.id_patient, a.id_doctor, a.appointment_date, a.appointment_time,
+           a.end_time, a.appointment_type, a.status, a.price, a.notes,
+           d.fio as doctor_fio, d.specialization
+    FROM {schema}.appointments a
+    JOIN main.doctors d ON a.id_doctor = d.id_doctor
+    WHERE a.id_patient = ?
+      AND a.appointment_date >= COALESCE(?, '') AND a.appointment_date <= COALESCE(?, '9999-12-31')
+    ORDER BY a.appointment_date DESC, a.appointment_time DESC
+"""
+
+
+def patient_appointments(schema: str) -> str:
+    return " ".join(_PATIENT_APPOINTMENTS.format(schema=schema).split())
+
+
+register("patients.appointments", patient_appointments("main"))
+
+# One branch per event kind, each reading its newest `limit` rows before
+# the cursor through a (id_patient, date) index. Only appointments carry a
+# time; rank orders the kinds within a day, appointment first. Undated
+# events read as '' so they come last and the cursor can move past them.
+_TIMELINE_BRANCHES = [
+    """
+    SELECT 'appointment' AS kind, COALESCE(a.appointment_date, '') AS event_date,
+           COALESCE(a.appointment_time, '') AS event_time, 4 AS rank, a.id_appointment AS id,
+           a.id_appointment, COALESCE(a.appointment_type, '') || ' — ' || COALESCE(d.fio, '') AS description,
+           a.status, a.price AS amount
+    FROM {schema}.appointments a
+    LEFT JOIN main.doctors d ON a.id_doctor = d.id_doctor
+    WHERE a.id_patient = :patient
+      AND (COALESCE(a.appointment_date, ''), COALESCE(a.appointment_time, ''), 4, a.id_appointment)
+          < (:date, :time, :rank, :id)
+    """,
+    """
+    SELECT 'record' AS kind, COALESCE(r.record_date, '') AS event_date, '' AS event_time, 3 AS rank,
+           r.id_record AS id, r.id_appointment,
+           TRIM(COALESCE(r.diagnosis_icd10, '') || ' ' || COALESCE(r.diagnosis_description, '')) AS description,
+           NULL AS status, NULL AS amount
+    FROM {schema}.medical_records r
+    WHERE r.id_patient = :patient
+      AND (COALESCE(r.record_date, ''), '', 3, r.id_record) < (:date, :time, :rank, :id)
+    """,
+    """
+    SELECT 'prescription' AS kind, COALESCE(pr.prescription_date, '') AS event_date, '' AS event_time,
+           2 AS rank, pr.id_prescription AS id, r.id_appointment,
+           COALESCE(pr.medication_name, '') || COALESCE(', ' || pr.dosage, '')
+               || COALESCE(', ' || pr.duration_days || ' дн.', '') AS description,
+           CASE pr.is_active WHEN 1 THEN 'Активно' ELSE 'Завершено' END AS status, NULL AS amount
+    FROM {schema}.prescriptions pr
+    LEFT JOIN {schema}.medical_records r ON pr.id_record = r.id_record
+    WHERE pr.id_patient = :patient
+      AND (COALESCE(pr.prescription_date, ''), '', 2, pr.id_prescription) < (:date, :time, :rank, :id)
+    """,
+    """
+    SELECT 'lab' AS kind, COALESCE(lo.order_date, '') AS event_date, '' AS event_time, 1 AS rank,
+           lo.id_lab_order AS id, r.id_appointment,
+           COALESCE(lo.test_name, '') || COALESCE(': ' || lo.result_text, '') AS description,
+           lo.status, NULL AS amount
+    FROM {schema}.lab_orders lo
+    LEFT JOIN {schema}.medical_records r ON lo.id_record = r.id_record
+    WHERE lo.id_patient = :patient
+      AND (COALESCE(lo.order_date, ''), '', 1, lo.id_lab_order) < (:date, :time, :rank, :id)
+    """,
+    """
+    SELECT 'payment' AS kind, COALESCE(pay.payment_date, '') AS event_date, '' AS event_time,
+           0 AS rank, pay.id_payment AS id, pay.id_appointment, pay.payment_method AS description,
+           pay.payment_status AS status, pay.amount
+    FROM {schema}.appointments a
+    JOIN {schema}.payments pay ON pay.id_appointment = a.id_appointment
+    WHERE a.id_patient = :patient
+      AND (COALESCE(pay.payment_date, ''), '', 0, pay.id_payment) < (:date, :time, :rank, :id)
+    """,
+]
+
+
+def patient_timeline(schema: str) -> str:
+    branches = [
+        "SELECT * FROM (" + branch.format(schema=schema)
+        + " ORDER BY event_date DESC, event_time DESC, id DESC LIMIT :limit)"
+        for branch in _TIMELINE_BRANCHES
+    ]
+    return " ".join((" UNION ALL ".join(branches)
+                     + " ORDER BY event_date DESC, event_time DESC, rank DESC, id DESC LIMIT :limit").split())
+
+
+register("patients.timeline", patient_timeline("main"))
+
+
+def _record_search_name(text: bool, icd: bool, seek: bool) -> str:
+    return "medical_records.search" + "".join(
+        f":{part}" for part, used in (("text", text), ("icd", icd), ("seek", seek)) if used)
+
+
+def record_search(text: bool, icd: bool, seek: bool) -> str:
+    return statement(_record_search_name(text, icd, seek))
+
+
+def _register_record_search(text: bool, icd: bool, seek: bool):
+    conditions = []
+    if icd:
+        conditions.append("r.diagnosis_icd10 >= :icd_from AND r.diagnosis_icd10 < :icd_to")
+    if text:
+        # Text queries are ranked by bm25; the cursor is (rank, rowid).
+        if seek:
+            conditions.append("(f.rank, f.rowid) > (:after_score, :after_id)")
+        sql = """
+            SELECT r.id_record, r.id_appointment, r.id_patient, r.record_date,
+                   p.fio AS patient_fio, d.fio AS doctor_fio, r.diagnosis_icd10, r.diagnosis_description,
+                   snippet(medical_records_fts, -1, '[', ']', '…', 12) AS snippet, f.rank AS score
+            FROM medical_records_fts f
+            JOIN medical_records r ON r.id_record = f.rowid
+            LEFT JOIN patients p ON p.id_patient = r.id_patient
+            LEFT JOIN doctors d ON d.id_doctor = r.id_doctor
+        """ + _where(["medical_records_fts MATCH :match"] + conditions) + """
+            ORDER BY f.rank, f.rowid
+            LIMIT :limit
+        """
+    else:
+        # An ICD prefix alone lists records newest first, undated ones last;
+        # the cursor is (record_date or '', id_record).
+        if seek:
+            conditions.append("(COALESCE(r.record_date, ''), r.id_record) < (:after_date, :after_id)")
+        sql = """
+            SELECT r.id_record, r.id_appointment, r.id_patient, r.record_date,
+                   p.fio AS patient_fio, d.fio AS doctor_fio, r.diagnosis_icd10, r.diagnosis_description,
+                   COALESCE(r.complaints, '') AS snippet, NULL AS score
+            FROM medical_records r
+            LEFT JOIN patients p ON p.id_patient = r.id_patient
+            LEFT JOIN doctors d ON d.id_doctor = r.id_doctor
+        """ + _where(conditions) + """
+            ORDER BY COALESCE(r.record_date, '') DESC, r.id_record DESC
+            LIMIT :limit
+        """
+    register(_record_search_name(text, icd, seek), sql)
+
+
+for _text, _icd, _seek in itertools.product((True, False), repeat=3):
+    if _text or _icd:
+        _register_record_search(_text, _icd, _seek)
+
+
+# Lab work queue (labqueue.py). The status and claimed_by conditions repeat
+# the WHERE clauses of the partial queue indexes, see db._migrate_lab_queue.
+LAB_QUEUE_EXPIRE = register("lab_orders.expire", """
+    UPDATE lab_orders SET claimed_by = NULL, claimed_at = NULL
+    WHERE status = 'Назначен' AND claimed_by IS NOT NULL AND claimed_at < ?
+""")
+
+LAB_QUEUE_CLAIM = register("lab_orders.claim", """
+    UPDATE lab_orders SET claimed_by = ?, claimed_at = ?
+    WHERE id_lab_order IN (
+        SELECT id_lab_order FROM lab_orders
+        WHERE status = 'Назначен' AND claimed_by IS NULL
+        ORDER BY order_date, id_lab_order
+        LIMIT ?
+    )
+    RETURNING id_lab_order, id_record, id_patient, id_doctor, order_date, test_name, claimed_at
+""")
+
+LAB_QUEUE_HELD = register("lab_orders.held", """
+    SELECT id_lab_order FROM lab_orders WHERE status = 'Назначен' AND claimed_by = ?
+""")
+
+LAB_QUEUE_POST = register("lab_orders.post", """
+    UPDATE lab_orders SET status = 'Выполнен', result_text = ?, result_date = ?, updated_at = CURRENT_TIMESTAMP
+    WHERE id_lab_order = ?
+""")
+
+LAB_QUEUE_RELEASE = register("lab_orders.release", """
+    UPDATE lab_orders SET claimed_by = NULL, claimed_at = NULL
+    WHERE id_lab_order = ? AND status = 'Назначен' AND claimed_by = ?
+""")
+
+LAB_QUEUE_STATUS = register("lab_orders.queue_status", """
+    SELECT (SELECT COUNT(*) FROM lab_orders WHERE status = 'Назначен' AND claimed_by IS NULL) AS pending,
+           (SELECT MIN(order_date) FROM lab_orders WHERE status = 'Назначен' AND claimed_by IS NULL) AS oldest,
+           (SELECT COUNT(*) FROM lab_orders WHERE status = 'Назначен' AND claimed_by IS NOT NULL) AS claimed,
+           (SELECT MIN(claimed_at) FROM lab_orders
+            WHERE status = 'Назначен' AND claimed_by IS NOT NULL) AS oldest_claim
+""")
+
+
+_SCAN = re.compile(r"^SCAN (\w+)")
+# A lookup constrained only by the join key: driven by a scan of the outer
+# table, it visits every row.
+_JOIN_LOOKUP = re.compile(r"^SEARCH (\w+) .*\(\w+=\?\)$")
+# Lower-case identifiers, optionally alias-qualified, outside parameters and
+# string literals; the statements spell keywords and functions in capitals.
+_COLUMN = re.compile(r"(?<![:\w.'])(?:(\w+)\.)?([a-z_][a-z0-9_]*)\b")
+_WHERE = re.compile(r" WHERE (.*?)(?= ORDER BY | GROUP BY | LIMIT |\)|$)", re.S)
+
+
+def _null_params(sql: str):
+    # EXPLAIN QUERY PLAN still needs every parameter bound; NULL will do.
+    names = re.findall(r":(\w+)", sql)
+    if names:
+        return {name: None for name in names}
+    return [None] * sql.count("?")
+
+
+def _aliases(sql: str) -> Dict[str, str]:
+    # Maps "a" to "appointments" for every "FROM/JOIN [schema.]table alias".
+    found = {}
+    for table, alias in re.findall(r"(?:FROM|JOIN) (?:\w+\.)?(\w+) (?:AS )?(\w+)", sql):
+        found[alias] = table
+        found[table] = table
+    return found
+
+
+def _covered(conn: sqlite3.Connection, sql: str, aliases: Dict[str, str], table: str, index: str) -> bool:
+    # Whether every column the WHERE clauses test belongs to the scanned
+    # table and is held by the scanned index (or is its primary key), so
+    # rows that fail the filter are skipped without reading the table.
+    held = {row[1] for row in conn.execute(f"PRAGMA table_info('{table}')") if row[5]} | {"rowid"}
+    if index:
+        definition = conn.execute("SELECT sql FROM sqlite_master WHERE name = ?", (index,)).fetchone()[0]
+        held |= set(re.findall(r"[a-z_][a-z0-9_]*", definition[definition.index("(") + 1:]))
+    for condition in _WHERE.findall(" ".join(sql.split())):
+        for alias, column in _COLUMN.findall(condition):
+            if (aliases.get(alias, alias) if alias else table) != table or column not in held:
+                return False
+    return True
+
+
+def check_query_plans(conn: sqlite3.Connection) -> List[Tuple[str, str]]:
+    # Runs EXPLAIN QUERY PLAN over every registered statement and returns
+    # (statement name, plan line) for each full scan of a large table, by
+    # rowid or by index, that the statement does not declare as intended. A
+    # scan that already yields rows in the requested order under a LIMIT (no
+    # temp B-tree for ORDER BY) is accepted when the scanned index covers the
+    # WHERE clause: it stops after one page, and rows that fail the filter
+    # cost an index entry each. Otherwise a filter that matches nothing
+    # walks the whole table, and the statement must declare it. A full
+    # ORDER BY sort is also reported when the loop starts from a small table
+    # and reaches a large one by its join key alone, since scanning doctors
+    # and looking up each one's appointments reads them all just the same.
+    problems = []
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND sql NOT LIKE "
+                                             "'CREATE VIRTUAL TABLE%'")}
+    # A partial index holds only the rows matching its WHERE clause, such as
+    # the open lab orders, so scanning one is not a full scan.
+    partial = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql LIKE "
+                                              "'% WHERE %'")}
+    for entry in STATEMENTS.values():
+        if entry.full_scan:
+            continue
+        aliases = _aliases(entry.sql)
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + entry.sql, _null_params(entry.sql))]
+        sorted_fully = "USE TEMP B-TREE FOR ORDER BY" in plan
+        paged = " LIMIT " in entry.sql and not sorted_fully
+        for detail, inner in zip(plan, plan[1:] + [""]):
+            match = _SCAN.match(detail)
+            index = detail.rpartition(" INDEX ")[2] if " INDEX " in detail else ""
+            if match is None or index in partial:
+                continue
+            table = aliases.get(match.group(1), match.group(1))
+            if paged:
+                if table in LARGE_TABLES and not _covered(conn, entry.sql, aliases, table, index):
+                    problems.append((entry.name, detail))
+                continue
+            lookup = _JOIN_LOOKUP.match(inner)
+            joined_fully = lookup is not None and aliases.get(lookup.group(1), lookup.group(1)) in LARGE_TABLES
+            if table in LARGE_TABLES or (sorted_fully and joined_fully and table in tables):
+                problems.append((entry.name, detail))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Registered SQL statements and their query plans")
+    parser.add_argument("command", choices=["list", "check"])
+    parser.add_argument("--db", help="database path (default: the application database)")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for entry in STATEMENTS.values():
+            print(f"{entry.name}\t{entry.sql}")
+        return
+    import db
+    # Read-only: the plans are those of the database as it stands, and a
+    # database behind the current schema is reported rather than migrated.
+    conn = db.get_connection(args.db, read_only=True)
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < db.SCHEMA_VERSION:
+            # Statements may refer to tables and indexes it does not have yet.
+            print(f"schema version {version} is behind {db.SCHEMA_VERSION}: run the application or db.migrate() first")
+            sys.exit(1)
+        problems = check_query_plans(conn)
+    finally:
+        conn.close()
+    for name, detail in problems:
+        print(f"{name}: {detail}")
+    print(f"{len(STATEMENTS)} statements checked, {len(problems)} full scans")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+import sqlite3
+from typing import NamedTuple, Optional
+
+
+# Query results are tuples with named fields instead of one dict per row.
+# Rows still read like the dicts they replace: record['fio'], record.get('fio')
+# and dict(record) all work, as does attribute access (record.fio). Unlike a
+# dict, iterating a record yields its values.
+def _getitem(self, key):
+    if isinstance(key, str):
+        try:
+            key = self._index[key]
+        except KeyError:
+            raise KeyError(key) from None
+    return tuple.__getitem__(self, key)
+
+
+def _get(self, key: str, default=None):
+    index = self._index.get(key)
+    return default if index is None else tuple.__getitem__(self, index)
+
+
+def _keys(self):
+    return self._fields
+
+
+def _items(self):
+    return zip(self._fields, self)
+
+
+def record(cls):
+    cls._index = {name: i for i, name in enumerate(cls._fields)}
+    cls.__getitem__ = _getitem
+    cls.get = _get
+    cls.keys = _keys
+    cls.items = _items
+    # Used as a cursor row_factory, so rows go straight from SQLite into the
+    # record without an intermediate sqlite3.Row.
+    cls.from_row = classmethod(lambda cls, cursor, row: tuple.__new__(cls, row))
+    return cls
+
+
+def is_record(value) -> bool:
+    return isinstance(value, tuple) and hasattr(type(value), '_index')
+
+
+def to_builtin(value):
+    # Records become dicts again for JSON; containers are converted in place.
+    if is_record(value):
+        return dict(value.items())
+    if isinstance(value, list):
+        return [to_builtin(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(to_builtin(item) for item in value)
+    return value
+
+
+def execute(conn: sqlite3.Connection, cls, query: str, params=()) -> sqlite3.Cursor:
+    cur = conn.cursor()
+    cur.row_factory = cls.from_row
+    cur.execute(query, params)
+    columns = tuple(c[0] for c in cur.description)
+    if columns != cls._fields:
+        raise sqlite3.ProgrammingError(f"{cls.__name__} does not match the query columns {columns}")
+    return cur
+
+
+def fetch_all(conn: sqlite3.Connection, cls, query: str, params=()) -> list:
+    return execute(conn, cls, query, params).fetchall()
+
+
+def fetch_one(conn: sqlite3.Connection, cls, query: str, params=()):
+    return execute(conn, cls, query, params).fetchone()
+
+
+def columns(cls, alias: str = "") -> str:
+    prefix = f"{alias}." if alias else ""
+    return ", ".join(prefix + name for name in cls._fields)
+
+
+@record
+class Patient(NamedTuple):
+    id_patient: int
+    medical_card_number: Optional[str]
+    fio: Optional[str]
+    birth_date: Optional[str]
+    gender: Optional[str]
+    address: Optional[str]
+    phone: Optional[str]
+    email: Optional[str]
+    passport_series: Optional[str]
+    passport_number: Optional[str]
+    insurance_policy_number: Optional[str]
+    insurance_type: Optional[str]
+    insurance_company: Optional[str]
+    registration_date: Optional[str]
+
+
+@record
+class PatientMatch(NamedTuple):
+    id_patient: int
+    fio: Optional[str]
+    phone: Optional[str]
+    birth_date: Optional[str]
+    medical_card_number: Optional[str]
+    insurance_policy_number: Optional[str]
+
+
+@record
+class Doctor(NamedTuple):
+    id_doctor: int
+    fio: Optional[str]
+    specialization: Optional[str]
+    license_number: Optional[str]
+    phone: Optional[str]
+    email: Optional[str]
+    office_number: Optional[str]
+    hire_date: Optional[str]
+    consultation_price: Optional[float]
+    is_active: Optional[int]
+
+
+@record
+class Service(NamedTuple):
+    id_service: int
+    service_name: Optional[str]
+    service_category: Optional[str]
+    price_oms: Optional[float]
+    price_dms: Optional[float]
+    price_paid: Optional[float]
+    duration_minutes: Optional[int]
+    is_active: Optional[int]
+
+
+@record
+class AppointmentService(NamedTuple):
+    id: int
+    id_appointment: int
+    id_service: int
+    quantity: Optional[int]
+    price: Optional[float]
+    service_name: Optional[str]
+    service_category: Optional[str]
+
+
+@record
+class AppointmentRow(NamedTuple):
+    id_appointment: int
+    appointment_date: Optional[str]
+    appointment_time: Optional[str]
+    appointment_type: Optional[str]
+    status: Optional[str]
+    price: Optional[float]
+    notes: Optional[str]
+    patient_fio: Optional[str]
+    patient_phone: Optional[str]
+    doctor_fio: Optional[str]
+    specialization: Optional[str]
+
+
+@record
+class AppointmentChange(NamedTuple):
+    id_appointment: int
+    appointment_date: Optional[str]
+    appointment_time: Optional[str]
+    appointment_type: Optional[str]
+    status: Optional[str]
+    price: Optional[float]
+    notes: Optional[str]
+    patient_fio: Optional[str]
+    patient_phone: Optional[str]
+    doctor_fio: Optional[str]
+    specialization: Optional[str]
+    updated_at: Optional[str]
+    removed: int
+
+
+@record
+class PatientAppointment(NamedTuple):
+    id_appointment: int
+    id_patient: Optional[int]
+    id_doctor: Optional[int]
+    appointment_date: Optional[str]
+    appointment_time: Optional[str]
+    end_time: Optional[str]
+    appointment_type: Optional[str]
+    status: Optional[str]
+    price: Optional[float]
+    notes: Optional[str]
+    doctor_fio: Optional[str]
+    specialization: Optional[str]
+
+
+@record
+class AppointmentDetail(NamedTuple):
+    id_appointment: int
+    id_patient: Optional[int]
+    id_doctor: Optional[int]
+    appointment_date: Optional[str]
+    appointment_time: Optional[str]
+    end_time: Optional[str]
+    appointment_type: Optional[str]
+    status: Optional[str]
+    price: Optional[float]
+    notes: Optional[str]
+    patient_fio: Optional[str]
+    patient_phone: Optional[str]
+    doctor_fio: Optional[str]
+    specialization: Optional[str]
+
+
+@record
+class TimelineEvent(NamedTuple):
+    kind: str
+    event_date: str
+    event_time: str
+    rank: int
+    id: int
+    id_appointment: Optional[int]
+    description: Optional[str]
+    status: Optional[str]
+    amount: Optional[float]
+
+
+@record
+class RecordMatch(NamedTuple):
+    id_record: int
+    id_appointment: Optional[int]
+    id_patient: Optional[int]
+    record_date: Optional[str]
+    patient_fio: Optional[str]
+    doctor_fio: Optional[str]
+    diagnosis_icd10: Optional[str]
+    diagnosis_description: Optional[str]
+    snippet: Optional[str]
+    score: Optional[float]
+
+
+@record
+class LabWorkItem(NamedTuple):
+    id_lab_order: int
+    id_record: Optional[int]
+    id_patient: Optional[int]
+    id_doctor: Optional[int]
+    order_date: Optional[str]
+    test_name: Optional[str]
+    claimed_at: str
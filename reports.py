@@ -0,0 +1,214 @@
+import sqlite3
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import archive
+import scheduling
+
+
+def _placeholders(values) -> str:
+    return ", ".join("?" for _ in values)
+
+
+def _add(a, b):
+    return a if b is None else b if a is None else a + b
+
+
+def _summed(conn: sqlite3.Connection, years: List[int], select: str, params, keys: int) -> List[tuple]:
+    # Rows archive.py moved out of the hot tables still belong in the totals.
+    # `select` groups by its first `keys` columns and sums the rest; it runs
+    # over the hot tables and each archive in turn (an appointment is archived
+    # together with its services and payments), and the sums are added up.
+    totals = {}
+    for schema in archive.schemas(conn, years):
+        for row in conn.execute(select.format(schema=schema), params).fetchall():
+            key = tuple(row[:keys])
+            current = totals.get(key)
+            totals[key] = tuple(row[keys:]) if current is None else tuple(map(_add, current, row[keys:]))
+    return [key + values for key, values in totals.items()]
+
+
+def _values(rows: List[tuple], width: int) -> Tuple[str, list]:
+    # Rows computed in Python as a table the report query can join.
+    if not rows:
+        return "SELECT " + ", ".join("NULL" for _ in range(width)) + " WHERE 0", []
+    row = "(" + ", ".join("?" for _ in range(width)) + ")"
+    return "VALUES " + ", ".join(row for _ in rows), [value for row in rows for value in row]
+
+
+def _default_hours() -> Tuple[str, list]:
+    rows = [
+        (weekday, scheduling.to_minutes(end) - scheduling.to_minutes(start))
+        for weekday, windows in scheduling.DEFAULT_WORKING_HOURS.items()
+        for start, end in windows
+    ]
+    return ", ".join("(?, ?)" for _ in rows), [value for row in rows for value in row]
+
+
+def doctor_utilisation(conn: sqlite3.Connection, date_from: str, date_to: str) -> List[dict]:
+    default_values, default_params = _default_hours()
+    # Available minutes come from doctor_schedules (or the default working
+    # week) multiplied out over the calendar; booked minutes are summed from
+    # the covering idx_appointments_doctor_slot index.
+    booked = _summed(conn, archive.archived_years(conn, date_from, date_to), f"""
+        SELECT id_doctor, COUNT(*), SUM((strftime('%s', end_time) - strftime('%s', appointment_time)) / 60)
+        FROM {{schema}}.appointments
+        WHERE appointment_date BETWEEN ? AND ?
+          AND status NOT IN ({_placeholders(scheduling.FREE_STATUSES)})
+        GROUP BY id_doctor
+    """, (date_from, date_to, *scheduling.FREE_STATUSES), 1)
+    booked_values, booked_params = _values(booked, 3)
+    cur = conn.execute(
+        f"""
+        WITH RECURSIVE days (day) AS (
+            SELECT date(?)
+            UNION ALL
+            SELECT date(day, '+1 day') FROM days WHERE day < date(?)
+        ),
+        weekdays (weekday, days) AS (
+            SELECT (CAST(strftime('%w', day) AS INTEGER) + 6) % 7, COUNT(*) FROM days GROUP BY 1
+        ),
+        default_hours (weekday, minutes) AS (VALUES {default_values}),
+        schedule (id_doctor, weekday, minutes) AS (
+            SELECT id_doctor, weekday, SUM((strftime('%s', end_time) - strftime('%s', start_time)) / 60)
+            FROM doctor_schedules
+            GROUP BY id_doctor, weekday
+            UNION ALL
+            SELECT d.id_doctor, h.weekday, h.minutes
+            FROM doctors d, default_hours h
+            WHERE NOT EXISTS (SELECT 1 FROM doctor_schedules s WHERE s.id_doctor = d.id_doctor)
+        ),
+        available (id_doctor, minutes) AS (
+            SELECT s.id_doctor, SUM(s.minutes * w.days)
+            FROM schedule s JOIN weekdays w ON w.weekday = s.weekday
+            GROUP BY s.id_doctor
+        ),
+        booked (id_doctor, visits, minutes) AS ({booked_values})
+        SELECT d.id_doctor, d.fio AS doctor_fio, d.specialization,
+               COALESCE(b.visits, 0) AS visits,
+               COALESCE(b.minutes, 0) AS booked_minutes,
+               COALESCE(a.minutes, 0) AS available_minutes,
+               ROUND(100.0 * COALESCE(b.minutes, 0) / NULLIF(a.minutes, 0), 1) AS utilisation
+        FROM doctors d
+        LEFT JOIN available a ON a.id_doctor = d.id_doctor
+        LEFT JOIN booked b ON b.id_doctor = d.id_doctor
+        WHERE d.is_active = 1 OR b.visits > 0
+        ORDER BY utilisation DESC, d.fio
+        """,
+        (date_from, date_to, *default_params, *booked_params),
+    )
+    return [dict(row) for row in cur.fetchall()]
+
+
+def revenue_split(conn: sqlite3.Connection, date_from: str, date_to: str) -> List[dict]:
+    # Archives are split by appointment date, and a payment may come after
+    # its appointment's year, so every archive up to date_to is read.
+    totals = _summed(conn, archive.archived_years(conn, None, date_to), """
+        SELECT COALESCE(p.insurance_type, '—'), COALESCE(pay.payment_method, '—'), COUNT(*), SUM(pay.amount)
+        FROM {schema}.payments pay
+        JOIN {schema}.appointments a ON a.id_appointment = pay.id_appointment
+        JOIN main.patients p ON p.id_patient = a.id_patient
+        WHERE pay.payment_date BETWEEN ? AND ?
+          AND pay.payment_status != 'Возврат'
+        GROUP BY 1, 2
+    """, (date_from, date_to), 2)
+    values, params = _values(totals, 4)
+    cur = conn.execute(
+        f"""
+        WITH totals (insurance_type, payment_method, payments, amount) AS ({values})
+        SELECT insurance_type, payment_method, payments, amount,
+               ROUND(100.0 * amount / SUM(amount) OVER (), 1) AS share
+        FROM totals
+        ORDER BY amount DESC
+        """,
+        params,
+    )
+    return [dict(row) for row in cur.fetchall()]
+
+
+def attendance(conn: sqlite3.Connection, date_from: str, date_to: str) -> List[dict]:
+    # Read from the trigger-maintained daily_doctor_stats, so the cost grows
+    # with the number of days rather than the number of appointments.
+    cur = conn.execute(
+        """
+        WITH totals AS (
+            SELECT id_doctor,
+                   SUM(visits) AS total,
+                   SUM(visits) FILTER (WHERE status = 'Не явился') AS no_shows,
+                   SUM(visits) FILTER (WHERE status = 'Отменен') AS cancellations
+            FROM daily_doctor_stats
+            WHERE stat_date BETWEEN ? AND ?
+            GROUP BY id_doctor
+        ),
+        rows AS (
+            SELECT 0 AS position, d.fio AS doctor_fio, t.total, t.no_shows, t.cancellations
+            FROM totals t LEFT JOIN doctors d ON d.id_doctor = t.id_doctor
+            UNION ALL
+            SELECT 1, 'Вся клиника', SUM(total), SUM(no_shows), SUM(cancellations) FROM totals
+        )
+        SELECT doctor_fio, total,
+               COALESCE(no_shows, 0) AS no_shows,
+               ROUND(100.0 * COALESCE(no_shows, 0) / NULLIF(total, 0), 1) AS no_show_rate,
+               COALESCE(cancellations, 0) AS cancellations,
+               ROUND(100.0 * COALESCE(cancellations, 0) / NULLIF(total, 0), 1) AS cancellation_rate
+        FROM rows
+        WHERE total > 0
+        ORDER BY position, no_show_rate DESC, doctor_fio
+        """,
+        (date_from, date_to),
+    )
+    return [dict(row) for row in cur.fetchall()]
+
+
+def category_bills(conn: sqlite3.Connection, date_from: str, date_to: str) -> List[dict]:
+    totals = _summed(conn, archive.archived_years(conn, date_from, date_to), """
+        WITH bills AS (
+            SELECT aps.id_appointment, sp.service_category,
+                   SUM(aps.price * COALESCE(aps.quantity, 1)) AS amount
+            FROM {schema}.appointments a
+            JOIN {schema}.appointment_services aps ON aps.id_appointment = a.id_appointment
+            JOIN main.service_pricelist sp ON sp.id_service = aps.id_service
+            WHERE a.appointment_date BETWEEN ? AND ? AND a.status = 'Завершен'
+            GROUP BY aps.id_appointment, sp.service_category
+        )
+        SELECT COALESCE(service_category, '—'), COUNT(*), SUM(amount)
+        FROM bills
+        GROUP BY 1
+    """, (date_from, date_to), 1)
+    values, params = _values(totals, 3)
+    cur = conn.execute(
+        f"""
+        WITH totals (service_category, appointments, revenue) AS ({values})
+        SELECT service_category, appointments, revenue,
+               ROUND(1.0 * revenue / appointments, 2) AS average_bill
+        FROM totals
+        ORDER BY revenue DESC
+        """,
+        params,
+    )
+    return [dict(row) for row in cur.fetchall()]
+
+
+class Report(NamedTuple):
+    title: str
+    build: Callable[[sqlite3.Connection, str, str], List[dict]]
+    columns: List[Tuple[str, str]]
+
+
+REPORTS: Dict[str, Report] = {
+    'utilisation': Report("Загрузка врачей", doctor_utilisation, [
+        ("Врач", 'doctor_fio'), ("Специализация", 'specialization'), ("Приёмов", 'visits'),
+        ("Занято, мин", 'booked_minutes'), ("Доступно, мин", 'available_minutes'), ("Загрузка, %", 'utilisation'),
+    ]),
+    'revenue': Report("Выручка по страховке и оплате", revenue_split, [
+        ("Тип страховки", 'insurance_type'), ("Способ оплаты", 'payment_method'), ("Платежей", 'payments'),
+        ("Сумма", 'amount'), ("Доля, %", 'share'),
+    ]),
+    'attendance': Report("Неявки и отмены", attendance, [
+        ("Врач", 'doctor_fio'), ("Всего", 'total'), ("Неявки", 'no_shows'), ("Неявки, %", 'no_show_rate'),
+        ("Отмены", 'cancellations'), ("Отмены, %", 'cancellation_rate'),
+    ]),
+    'bills': Report("Средний чек по категориям", category_bills, [
+        ("Категория", 'service_category'), ("Приёмов", 'appointments'), ("Выручка", 'revenue'),
+        ("Средний чек", 'average_bill'),
+    ]),
+}
@@ -0,0 +1,95 @@
+import argparse
+import gc
+import json
+import sqlite3
+import time
+import tracemalloc
+
+import records
+
+DEFAULT_ROWS = 1_000_000
+
+
+def build(rows: int) -> sqlite3.Connection:
+    # An in-memory table shaped like the appointment grid rows, so the
+    # comparison measures row materialisation rather than disk reads.
+    conn = sqlite3.connect(":memory:")
+    conn.execute(
+        """
+        CREATE TABLE appointments AS
+        WITH RECURSIVE n (i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+        SELECT i AS id_appointment,
+               date('2025-01-01', '+' || (i % 365) || ' days') AS appointment_date,
+               time('09:00', '+' || (i % 18 * 30) || ' minutes') AS appointment_time,
+               'Первичный' AS appointment_type, 'Завершен' AS status, 1000 + i % 2500 AS price,
+               CASE WHEN i % 7 = 0 THEN 'Повторный визит' END AS notes,
+               'Пациент ' || (i % 50000) AS patient_fio, '7900' || (1000000 + i % 50000) AS patient_phone,
+               'Врач ' || (i % 40) AS doctor_fio, 'Терапевт' AS specialization
+        FROM n
+        """,
+        (rows,),
+    )
+    return conn
+
+
+QUERY = f"SELECT {records.columns(records.AppointmentRow)} FROM appointments"
+
+
+def load_dicts(conn):
+    conn.row_factory = sqlite3.Row
+    try:
+        return [dict(row) for row in conn.execute(QUERY).fetchall()]
+    finally:
+        conn.row_factory = None
+
+
+def load_records(conn):
+    return records.fetch_all(conn, records.AppointmentRow, QUERY)
+
+
+def scan_records(conn):
+    # Lazy path: each record is dropped before the next is read.
+    total = 0
+    for row in records.execute(conn, records.AppointmentRow, QUERY):
+        total += row.price
+    return total
+
+
+VARIANTS = {'dict': load_dicts, 'record': load_records, 'record-lazy': scan_records}
+
+
+def measure(conn, name: str) -> dict:
+    func = VARIANTS[name]
+    gc.collect()
+    started = time.perf_counter()
+    result = func(conn)
+    seconds = time.perf_counter() - started
+    del result
+    gc.collect()
+    # Memory is measured in a second pass; tracemalloc slows allocation down.
+    tracemalloc.start()
+    result = func(conn)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {
+        'variant': name,
+        'seconds': round(seconds, 3),
+        'retained_mb': round(retained / 1024 / 1024, 1),
+        'peak_mb': round(peak / 1024 / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare dict rows with record rows")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS)
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS))
+    args = parser.parse_args()
+
+    conn = build(args.rows)
+    for name in args.variants:
+        print(json.dumps({'rows': args.rows, **measure(conn, name)}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+SLOT_STEP_MINUTES = 15
+DEFAULT_DURATION_MINUTES = 30
+SEARCH_HORIZON_DAYS = 31
+MINUTES_PER_DAY = 24 * 60
+# Used for doctors without rows in doctor_schedules: Monday to Friday, 9 to 18.
+DEFAULT_WORKING_HOURS = {weekday: [("09:00:00", "18:00:00")] for weekday in range(5)}
+# Appointments in these statuses do not occupy the doctor's time.
+FREE_STATUSES = ('Отменен', 'Не явился')
+
+
+class ScheduleConflict(Exception):
+    def __init__(self, id_appointment: int, start: str, end: str):
+        super().__init__(f"Врач занят: пересечение с приёмом #{id_appointment} ({start[:5]}–{end[:5]})")
+        self.id_appointment = id_appointment
+        self.start = start
+        self.end = end
+
+
+def to_minutes(value: str) -> int:
+    hours, minutes = value.split(":")[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def from_minutes(value: int) -> str:
+    return f"{value // 60:02d}:{value % 60:02d}:00"
+
+
+def add_minutes(value: str, minutes: int) -> str:
+    # Times are TEXT compared as strings, so an appointment may not run past
+    # midnight into the next day.
+    total = to_minutes(value) + minutes
+    if total >= MINUTES_PER_DAY:
+        raise ValueError(f"Приём с {value[:5]} на {minutes} мин. не заканчивается до полуночи")
+    return from_minutes(total)
+
+
+def services_duration(conn: sqlite3.Connection, services: Iterable[dict]) -> int:
+    quantities = {}
+    for s in services:
+        quantities[s['id_service']] = quantities.get(s['id_service'], 0) + s.get('quantity', 1)
+    if not quantities:
+        return DEFAULT_DURATION_MINUTES
+    placeholders = ", ".join("?" for _ in quantities)
+    cur = conn.execute(
+        f"SELECT id_service, duration_minutes FROM service_pricelist WHERE id_service IN ({placeholders})",
+        list(quantities),
+    )
+    total = sum((row[1] or 0) * quantities[row[0]] for row in cur)
+    return total or DEFAULT_DURATION_MINUTES
+
+
+def find_conflict(conn: sqlite3.Connection, id_doctor: int, appointment_date: str,
+                  start: str, end: str, exclude_id: Optional[int] = None) -> Optional[sqlite3.Row]:
+    cur = conn.execute(
+        f"""
+        SELECT id_appointment, appointment_time, end_time
+        FROM appointments
+        WHERE id_doctor = ? AND appointment_date = ?
+          AND appointment_time < ? AND end_time > ?
+          AND status NOT IN ({", ".join("?" for _ in FREE_STATUSES)})
+          AND id_appointment != ?
+        LIMIT 1
+        """,
+        (id_doctor, appointment_date, end, start, *FREE_STATUSES, exclude_id or 0),
+    )
+    return cur.fetchone()
+
+
+def check_slot(conn: sqlite3.Connection, id_doctor: int, appointment_date: str,
+               start: str, end: str, exclude_id: Optional[int] = None) -> None:
+    conflict = find_conflict(conn, id_doctor, appointment_date, start, end, exclude_id)
+    if conflict is not None:
+        raise ScheduleConflict(conflict['id_appointment'], conflict['appointment_time'], conflict['end_time'])
+
+
+def working_hours(conn: sqlite3.Connection, doctor_ids: List[int]) -> Dict[int, Dict[int, List[Tuple[int, int]]]]:
+    hours = {id_doctor: {} for id_doctor in doctor_ids}
+    if doctor_ids:
+        placeholders = ", ".join("?" for _ in doctor_ids)
+        cur = conn.execute(
+            f"""
+            SELECT id_doctor, weekday, start_time, end_time FROM doctor_schedules
+            WHERE id_doctor IN ({placeholders})
+            ORDER BY id_doctor, weekday, start_time
+            """,
+            doctor_ids,
+        )
+        for id_doctor, weekday, start, end in cur:
+            hours[id_doctor].setdefault(weekday, []).append((to_minutes(start), to_minutes(end)))
+    default = {
+        weekday: [(to_minutes(start), to_minutes(end)) for start, end in windows]
+        for weekday, windows in DEFAULT_WORKING_HOURS.items()
+    }
+    return {id_doctor: days or default for id_doctor, days in hours.items()}
+
+
+def _day_slots(windows: List[Tuple[int, int]], booked: List[Tuple[int, int]],
+               earliest: int, duration: int) -> List[int]:
+    slots = []
+    for window_start, window_end in windows:
+        t = max(window_start, earliest)
+        t += -t % SLOT_STEP_MINUTES
+        i = 0
+        while t + duration <= window_end:
+            while i < len(booked) and booked[i][1] <= t:
+                i += 1
+            if i < len(booked) and booked[i][0] < t + duration:
+                t = max(t + SLOT_STEP_MINUTES, booked[i][1])
+                t += -t % SLOT_STEP_MINUTES
+                continue
+            slots.append(t)
+            t += SLOT_STEP_MINUTES
+    return slots
+
+
+def free_slots(conn: sqlite3.Connection, count: int = 5, id_doctor: Optional[int] = None,
+               specialization: Optional[str] = None, after: Optional[datetime] = None,
+               duration_minutes: int = DEFAULT_DURATION_MINUTES,
+               horizon_days: int = SEARCH_HORIZON_DAYS) -> List[dict]:
+    query = "SELECT id_doctor, fio, specialization FROM doctors WHERE is_active = 1"
+    params = []
+    if id_doctor is not None:
+        query += " AND id_doctor = ?"
+        params.append(id_doctor)
+    if specialization:
+        query += " AND specialization = ?"
+        params.append(specialization)
+    doctors = {row[0]: row for row in conn.execute(query, params)}
+    if not doctors or count <= 0:
+        return []
+
+    hours = working_hours(conn, list(doctors))
+    after = after or datetime.now()
+    placeholders = ", ".join("?" for _ in doctors)
+    status_placeholders = ", ".join("?" for _ in FREE_STATUSES)
+    results = []
+    # Days are scanned in order and the search stops as soon as enough slots
+    # are found, so a typical query reads only one or two days of bookings.
+    for offset in range(horizon_days):
+        day = after.date() + timedelta(days=offset)
+        working = [d for d in doctors if hours[d].get(day.weekday())]
+        if not working:
+            continue
+        booked = {d: [] for d in working}
+        cur = conn.execute(
+            f"""
+            SELECT id_doctor, appointment_time, end_time FROM appointments
+            WHERE id_doctor IN ({placeholders}) AND appointment_date = ?
+              AND status NOT IN ({status_placeholders})
+            ORDER BY id_doctor, appointment_time
+            """,
+            [*doctors, day.isoformat(), *FREE_STATUSES],
+        )
+        for d, start, end in cur:
+            if d in booked and start and end:
+                booked[d].append((to_minutes(start), to_minutes(end)))
+        earliest = after.hour * 60 + after.minute if offset == 0 else 0
+        day_results = []
+        for d in working:
+            for t in _day_slots(hours[d][day.weekday()], booked[d], earliest, duration_minutes):
+                day_results.append((t, doctors[d][1] or '', d))
+        day_results.sort()
+        for t, _, d in day_results[:count - len(results)]:
+            results.append({
+                'id_doctor': d,
+                'doctor_fio': doctors[d][1],
+                'specialization': doctors[d][2],
+                'date': day.isoformat(),
+                'time': from_minutes(t),
+                'end_time': from_minutes(t + duration_minutes),
+            })
+        if len(results) >= count:
+            break
+    return results
@@ -0,0 +1,338 @@
+import argparse
+import asyncio
+import functools
+import hmac
+import ipaddress
+import json
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import db
+import export
+import records
+from database import Database
+
+# Trust model
+# -----------
+# The service has no accounts of its own: a connected client can call every
+# method below, reads of patient data and writes alike. Access is therefore
+# decided per connection. Each connection opens with a hello line carrying
+# the shared token from MEDICAL_SERVICE_TOKEN, and the server closes the
+# connection if the token does not match. Without a token the server only
+# binds to a loopback address, where everyone able to log in to the machine
+# is trusted. The token and all traffic travel unencrypted, so across an
+# untrusted network the service belongs behind a TLS tunnel or VPN.
+ENV_TOKEN = "MEDICAL_SERVICE_TOKEN"
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_READERS = 4
+# Requests and responses are single JSON lines; this caps one line.
+MAX_LINE_BYTES = 16 * 1024 * 1024
+
+READ_METHODS = {
+    'get_appointments', 'get_appointments_page', 'get_appointment_changes', 'get_patients', 'search_patients',
+    'search_medical_records',
+    'get_doctors', 'get_services', 'get_appointment_services', 'find_free_slots', 'get_report',
+    'get_patient_appointments', 'get_patient_timeline', 'get_appointment_by_id', 'authenticate', 'cache_stats',
+    'get_lab_queue_status',
+}
+WRITE_METHODS = {
+    'create_patient', 'create_appointment', 'add_appointment_service', 'update_appointment',
+    'clear_appointment_services', 'create_appointment_with_services', 'update_appointment_with_services',
+    'claim_lab_orders', 'post_lab_results', 'release_lab_orders',
+}
+# Results that Database returns as tuples; JSON turns them into lists.
+TUPLE_RESULTS = {
+    'get_appointments_page', 'get_appointment_changes', 'get_patient_timeline', 'search_medical_records',
+    'post_lab_results',
+}
+
+
+class RemoteError(Exception):
+    def __init__(self, kind: str, message: str):
+        super().__init__(message)
+        self.kind = kind
+
+
+def _encode(message: dict) -> bytes:
+    return json.dumps(message, ensure_ascii=False, default=str).encode() + b"\n"
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class DatabaseService:
+    # Reads run concurrently on a pool of threads, one connection each. All
+    # writes go through a single writer thread, so desks never compete for the
+    # SQLite write lock and "database is locked" cannot happen between them.
+    def __init__(self, db_path=None, readers: int = DEFAULT_READERS, profile: str = "server",
+                 token: Optional[str] = None):
+        self.token = token or os.environ.get(ENV_TOKEN) or None
+        self.database = Database(db_path, profile)
+        self.readers = ThreadPoolExecutor(readers, thread_name_prefix="reader")
+        self.writer = ThreadPoolExecutor(1, thread_name_prefix="writer")
+        self._local = threading.local()
+
+    def _thread_database(self) -> Database:
+        database = getattr(self._local, 'database', None)
+        if database is None:
+            database = self._local.database = self.database.worker_copy()
+        return database
+
+    def _call(self, method: str, args: list, kwargs: dict):
+        # Records are tuples, which JSON would turn into bare lists.
+        return records.to_builtin(getattr(self._thread_database(), method)(*args, **kwargs))
+
+    def _stream_export(self, kind: str, args: list, send) -> int:
+        database = self._thread_database()
+        query, count_query, params = database.export_query(kind, *args)
+        total = database.conn.execute(count_query, params).fetchone()[0]
+        cur = database.conn.execute(query, params)
+        send({'columns': [c[0] for c in cur.description], 'total': total})
+        written = 0
+        while True:
+            rows = cur.fetchmany(export.EXPORT_CHUNK_SIZE)
+            if not rows:
+                return written
+            send({'rows': [list(row) for row in rows]})
+            written += len(rows)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        loop = asyncio.get_running_loop()
+
+        def send_from_thread(request_id, message):
+            # Blocks the reader thread until the chunk is flushed, which keeps
+            # a slow client from making the server buffer a whole export.
+            message['id'] = request_id
+            asyncio.run_coroutine_threadsafe(self._send(writer, message), loop).result()
+
+        try:
+            if not await self._accept(reader, writer):
+                return
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # The line is longer than MAX_LINE_BYTES; what is left of
+                    # it cannot be told apart from the next request.
+                    await self._send(writer, {'id': None, 'error': {
+                        'type': 'ValueError', 'message': f"Запрос длиннее {MAX_LINE_BYTES} байт"}})
+                    break
+                if not line:
+                    break
+                response = {}
+                try:
+                    request = json.loads(line)
+                    response['id'] = request.get('id')
+                    method = request['method']
+                    args = request.get('args', [])
+                    kwargs = request.get('kwargs', {})
+                    if method == 'export_rows':
+                        send = functools.partial(send_from_thread, response['id'])
+                        response['result'] = await loop.run_in_executor(
+                            self.readers, self._stream_export, args[0], args[1:], send)
+                    elif method in READ_METHODS:
+                        response['result'] = await loop.run_in_executor(
+                            self.readers, self._call, method, args, kwargs)
+                    elif method in WRITE_METHODS:
+                        response['result'] = await loop.run_in_executor(
+                            self.writer, self._call, method, args, kwargs)
+                    else:
+                        raise ValueError(f"Неизвестный метод: {method}")
+                except Exception as exc:
+                    response['error'] = {'type': type(exc).__name__, 'message': str(exc)}
+                await self._send(writer, response)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        # The first line of a connection is {"hello": 1, "token": ...}.
+        try:
+            hello = json.loads(await reader.readline())
+            token = hello.get('token') if isinstance(hello, dict) and 'hello' in hello else None
+        except ValueError:
+            token = None
+        if self.token is not None and not hmac.compare_digest(str(token or ""), self.token):
+            await self._send(writer, {'error': {'type': 'PermissionError', 'message': "Неверный токен доступа"}})
+            return False
+        await self._send(writer, {'hello': 'ok'})
+        return True
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, message: dict):
+        writer.write(_encode(message))
+        await writer.drain()
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, started=None):
+        if self.token is None and not is_loopback(host):
+            raise ValueError(f"Для адреса {host} нужен токен доступа в переменной {ENV_TOKEN}")
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_LINE_BYTES)
+        if started is not None:
+            started(server.sockets[0].getsockname()[:2])
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.readers.shutdown(wait=False, cancel_futures=True)
+        self.writer.shutdown(wait=True)
+
+
+class _RemoteCursor:
+    def __init__(self, client: "RemoteDatabase", header: dict):
+        self.client = client
+        self.description = [(name, None, None, None, None, None, None) for name in header['columns']]
+        self.done = False
+
+    def fetchmany(self, size: int = 0) -> list:
+        if self.done:
+            return []
+        message = self.client._receive()
+        if 'rows' in message:
+            return message['rows']
+        self.done = True
+        return []
+
+
+class RemoteDatabase:
+    # Drop-in stand-in for Database that forwards calls to a DatabaseService.
+    # Each instance owns one connection; the GUI's QueryRunner gets one per
+    # pool thread through worker_copy(), as with local connections.
+    def __init__(self, address: str, token: Optional[str] = None):
+        host, _, port = address.rpartition(":")
+        self.address = address
+        self.token = token or os.environ.get(ENV_TOKEN) or None
+        self.host = host or DEFAULT_HOST
+        self.port = int(port or DEFAULT_PORT)
+        self._sock = None
+        self._file = None
+        self._ids = 0
+
+    def _connect(self):
+        if self._sock is None:
+            self._sock = socket.create_connection((self.host, self.port))
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._file = self._sock.makefile("rwb")
+            self._file.write(_encode({'hello': 1, 'token': self.token}))
+            self._file.flush()
+            try:
+                self._receive()
+            except RemoteError:
+                self.close()
+                raise
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._file.close()
+                self._sock.close()
+            finally:
+                self._sock = None
+                self._file = None
+
+    def _send(self, method: str, args, kwargs) -> None:
+        self._connect()
+        self._ids += 1
+        self._file.write(_encode({'id': self._ids, 'method': method, 'args': list(args), 'kwargs': kwargs}))
+        self._file.flush()
+
+    def _receive(self) -> dict:
+        line = self._file.readline()
+        if not line:
+            self.close()
+            raise ConnectionError("Сервер закрыл соединение")
+        message = json.loads(line)
+        if 'error' in message:
+            raise RemoteError(message['error']['type'], message['error']['message'])
+        return message
+
+    def call(self, method: str, *args, **kwargs):
+        try:
+            self._send(method, args, kwargs)
+            result = self._receive()['result']
+        except (OSError, ValueError) as exc:
+            # A broken or desynchronised connection is dropped and reopened on the next call.
+            self.close()
+            if isinstance(exc, ConnectionError):
+                raise
+            raise ConnectionError(f"Нет связи с сервером {self.address}: {exc}") from exc
+        return tuple(result) if method in TUPLE_RESULTS else result
+
+    def __getattr__(self, name: str):
+        if name in READ_METHODS or name in WRITE_METHODS:
+            return functools.partial(self.call, name)
+        raise AttributeError(name)
+
+    def worker_copy(self) -> "RemoteDatabase":
+        return RemoteDatabase(self.address, self.token)
+
+    def interrupt(self):
+        # Closing the socket makes the blocked call fail; the server finishes
+        # the request on its own and the next call reconnects.
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _export(self, kind: str, path, status, date_from, date_to, fmt, compress, progress) -> int:
+        self._send('export_rows', [kind, status, date_from, date_to], {})
+        try:
+            header = self._receive()
+            if progress is not None:
+                progress(0, header['total'])
+            cursor = _RemoteCursor(self, header)
+            written = export.write_rows(cursor, path, fmt, compress, header['total'], progress)
+            if not cursor.done:
+                cursor.fetchmany()
+        except BaseException:
+            self.close()
+            raise
+        return written
+
+    def export_appointments(self, path, status: Optional[str] = None, date_from: Optional[str] = None,
+                            date_to: Optional[str] = None, fmt: Optional[str] = None,
+                            compress: Optional[bool] = None, progress=None) -> int:
+        return self._export('appointments', path, status, date_from, date_to, fmt, compress, progress)
+
+    def export_medical_records(self, path, status: Optional[str] = None, date_from: Optional[str] = None,
+                               date_to: Optional[str] = None, fmt: Optional[str] = None,
+                               compress: Optional[bool] = None, progress=None) -> int:
+        return self._export('medical_records', path, status, date_from, date_to, fmt, compress, progress)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the clinic database to front-desk clients")
+    parser.add_argument("--db", default=str(db.DEFAULT_DB_PATH), help="database path")
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help=f"listen address; anything but loopback needs {ENV_TOKEN} set")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--readers", type=int, default=DEFAULT_READERS, help="reader threads")
+    args = parser.parse_args()
+    if not os.environ.get(ENV_TOKEN) and not is_loopback(args.host):
+        parser.error(f"listening on {args.host} requires a shared token in {ENV_TOKEN}")
+
+    service = DatabaseService(args.db, args.readers)
+    try:
+        asyncio.run(service.serve(args.host, args.port,
+                                  started=lambda address: print(f"listening on {address[0]}:{address[1]}")))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import argparse
+import sqlite3
+import sys
+from typing import Optional
+
+import archive
+import db
+
+
+# (table, key columns, counter columns, select that recomputes it from scratch, source table)
+AGGREGATES = [
+    ("daily_doctor_stats", ("stat_date", "id_doctor", "status"), ("visits", "revenue"),
+     db.DAILY_DOCTOR_STATS_SELECT, "appointments"),
+    ("daily_revenue", ("pay_date", "payment_method", "payment_status"), ("payments", "amount"),
+     db.DAILY_REVENUE_SELECT, "payments"),
+]
+# Money totals are kept as floats, so incremental sums may drift in the last digits.
+MONEY_PRECISION = 2
+
+
+def _expected(conn: sqlite3.Connection, schemas, select: str, source: str, expected: Optional[dict] = None) -> dict:
+    # The aggregates also count rows moved to archive files. The select runs
+    # over the hot table and each archive in turn and the counters are added
+    # up: a day can span both when an open appointment stayed behind.
+    expected = {} if expected is None else expected
+    for schema in schemas:
+        for *key, count, total in conn.execute(select.replace(f"FROM {source}", f"FROM {schema}.{source}", 1)):
+            seen_count, seen_total = expected.get(tuple(key), (0, 0))
+            expected[tuple(key)] = (seen_count + count, seen_total + total)
+    return expected
+
+
+def rebuild(conn: sqlite3.Connection) -> dict:
+    counts = {}
+    conn.commit()
+    years = archive.archived_years(conn)
+    # Archives only change while archive.py runs; the hot tables are read
+    # again inside the write transaction.
+    archived = [_expected(conn, archive.schemas(conn, years, main=False), select, source)
+                for _, _, _, select, source in AGGREGATES]
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for (table, keys, counters, select, source), expected in zip(AGGREGATES, archived):
+            _expected(conn, ["main"], select, source, expected)
+            conn.execute(f"DELETE FROM {table}")
+            columns = (*keys, *counters)
+            conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                             [(*key, count, total) for key, (count, total) in expected.items()])
+            counts[table] = len(expected)
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    return counts
+
+
+def _rounded(value):
+    return None if value is None else round(value, MONEY_PRECISION)
+
+
+def check(conn: sqlite3.Connection, limit: int = 20) -> dict:
+    problems = {}
+    years = archive.archived_years(conn)
+    for table, keys, counters, select, source in AGGREGATES:
+        count, total = counters
+        expected = _expected(conn, archive.schemas(conn, years), select, source)
+        stored = {tuple(row[:len(keys)]): (row[-2], row[-1]) for row in conn.execute(
+            f"SELECT {', '.join(keys)}, {count}, {total} FROM {table}")}
+        rows = []
+        # Full outer join of the stored rows against a fresh recomputation.
+        for key in sorted(expected.keys() | stored.keys()):
+            expected_count, expected_total = expected.get(key, (None, None))
+            stored_count, stored_total = stored.get(key, (None, None))
+            if expected_count == stored_count and _rounded(expected_total) == _rounded(stored_total):
+                continue
+            rows.append({**dict(zip(keys, key)),
+                         f"expected_{count}": expected_count, f"stored_{count}": stored_count,
+                         f"expected_{total}": expected_total, f"stored_{total}": stored_total})
+            if len(rows) == limit:
+                break
+        if rows:
+            problems[table] = rows
+    return problems
+
+
+def doctor_totals(conn: sqlite3.Connection, date_from: Optional[str] = None,
+                  date_to: Optional[str] = None) -> list[dict]:
+    cur = conn.execute(
+        """
+        SELECT s.id_doctor, d.fio AS doctor_fio, s.status,
+               SUM(s.visits) AS visits, SUM(s.revenue) AS revenue
+        FROM daily_doctor_stats s
+        LEFT JOIN doctors d ON d.id_doctor = s.id_doctor
+        WHERE s.stat_date >= COALESCE(?, '') AND s.stat_date <= COALESCE(?, '9999-12-31')
+        GROUP BY s.id_doctor, s.status
+        ORDER BY d.fio, s.status
+        """,
+        (date_from, date_to),
+    )
+    return [dict(row) for row in cur.fetchall()]
+
+
+def revenue_by_day(conn: sqlite3.Connection, date_from: Optional[str] = None,
+                   date_to: Optional[str] = None) -> list[dict]:
+    cur = conn.execute(
+        """
+        SELECT pay_date, payment_method, SUM(payments) AS payments, SUM(amount) AS amount
+        FROM daily_revenue
+        WHERE payment_status != 'Возврат'
+          AND pay_date >= COALESCE(?, '') AND pay_date <= COALESCE(?, '9999-12-31')
+        GROUP BY pay_date, payment_method
+        ORDER BY pay_date, payment_method
+        """,
+        (date_from, date_to),
+    )
+    return [dict(row) for row in cur.fetchall()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the daily statistics tables")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    parser.add_argument("--db", help="database path (default: the application database)")
+    args = parser.parse_args()
+
+    conn = db.get_connection(args.db)
+    try:
+        db.migrate(conn)
+        if args.command == "rebuild":
+            for table, count in rebuild(conn).items():
+                print(f"{table}: {count} rows")
+        else:
+            problems = check(conn)
+            for table, rows in problems.items():
+                print(f"{table}: {len(rows)} mismatched rows")
+                for row in rows:
+                    print(f"  {row}")
+            if not problems:
+                print("ok")
+            sys.exit(1 if problems else 0)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
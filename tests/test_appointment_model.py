@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+pytest.importorskip("PyQt5")
+
+import datagen  # noqa: E402
+import main  # noqa: E402
+from database import APPOINTMENT_SORT_KEYS, Database  # noqa: E402
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "clinic.sqlite3"
+    datagen.generate(path, 400, progress=lambda *args: None)
+    database = Database(path, setup=False)
+    with database.conn:
+        database.conn.execute("UPDATE appointments SET appointment_time = NULL WHERE id_appointment % 3 = 0")
+        database.conn.execute("UPDATE appointments SET appointment_date = NULL WHERE id_appointment % 5 = 0")
+        database.conn.execute("UPDATE appointments SET status = NULL WHERE id_appointment % 7 = 0")
+    yield database
+    database.close()
+
+
+def test_sort_key_matches_sql_order_with_nulls(database):
+    model = main.AppointmentTableModel(None)
+    for order_by in APPOINTMENT_SORT_KEYS:
+        for descending in (True, False):
+            rows, _ = database.get_appointments_page(page_size=1000, order_by=order_by, descending=descending)
+            model.order_by, model.descending = order_by, descending
+            expected = [row['id_appointment'] for row in rows]
+            assert [row['id_appointment'] for row in sorted(rows, key=model.sort_key, reverse=descending)] == expected
+
+
+def test_apply_change_with_null_date(database):
+    model = main.AppointmentTableModel(None)
+    model.rows, _ = database.get_appointments_page(page_size=1000)
+    model.exhausted = True
+    moved = dict(model.rows[0]._asdict(), appointment_date=None, appointment_time=None)
+    model.apply_change(moved)
+    ids = [row['id_appointment'] for row in model.rows]
+    assert ids == [row['id_appointment'] for row in sorted(model.rows, key=model.sort_key, reverse=True)]
+    assert ids.count(moved['id_appointment']) == 1
+    # Undated rows sort last when newest come first.
+    assert model.rows[-1]['appointment_date'] is None
+
+    model.filters = (None, '2000-01-01', None)
+    assert not model.matches(moved)
+    model.apply_change(moved)
+    assert moved['id_appointment'] not in [row['id_appointment'] for row in model.rows]
+
+
+def test_removed_row_leaves_the_grid(database):
+    model = main.AppointmentTableModel(None)
+    model.rows, _ = database.get_appointments_page(page_size=1000)
+    model.exhausted = True
+    gone = model.rows[3]['id_appointment']
+    tombstone = dict.fromkeys(model.rows[3]._fields, None)
+    model.on_changes(([dict(tombstone, id_appointment=gone, updated_at='2030-01-01 00:00:00.000', removed=1)],
+                      model.watermark))
+    assert gone not in [row['id_appointment'] for row in model.rows]
+    assert len(model.rows) == 399
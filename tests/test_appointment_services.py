@@ -0,0 +1,82 @@
+import sqlite3
+
+import pytest
+
+from database import Database
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = Database(tmp_path / "clinic.sqlite3")
+    yield database
+    database.close()
+
+
+def _ids(database):
+    id_doctor = database.conn.execute("SELECT id_doctor FROM doctors LIMIT 1").fetchone()[0]
+    services = [row[0] for row in database.conn.execute("SELECT id_service FROM service_pricelist LIMIT 3")]
+    return id_doctor, services
+
+
+def _counts(database):
+    return tuple(database.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                 for table in ("patients", "appointments", "appointment_services"))
+
+
+def _lines(database, id_appointment):
+    return database.conn.execute("SELECT id, id_service, price, quantity FROM appointment_services "
+                                 "WHERE id_appointment = ? ORDER BY id", (id_appointment,)).fetchall()
+
+
+def test_create_without_patient_is_rejected(database):
+    id_doctor, _ = _ids(database)
+    before = _counts(database)
+    for patient in (None, {'fio': '  '}):
+        with pytest.raises(ValueError):
+            database.create_appointment_with_services(None, id_doctor, '2099-03-02', '10:00:00', 'Первичный',
+                                                      '', 1000, [], patient=patient)
+    assert _counts(database) == before
+
+
+def test_failed_service_line_rolls_back_new_patient_and_appointment(database):
+    id_doctor, services = _ids(database)
+    before = _counts(database)
+    lines = [{'id_service': services[0], 'price': 500}, {'id_service': -1, 'price': 700}]
+    with pytest.raises(sqlite3.IntegrityError):
+        database.create_appointment_with_services(None, id_doctor, '2099-03-02', '10:00:00', 'Первичный', '',
+                                                  1200, lines, patient={'fio': 'Новый Пациент'})
+    assert _counts(database) == before
+    assert database.conn.execute("SELECT COUNT(*) FROM patients WHERE fio = 'Новый Пациент'").fetchone()[0] == 0
+    assert not database.conn.in_transaction
+
+
+def test_update_applies_only_changed_lines(database):
+    id_doctor, (first, second, third) = _ids(database)
+    id_patient = database.conn.execute("SELECT id_patient FROM patients LIMIT 1").fetchone()[0]
+    id_appointment = database.create_appointment_with_services(
+        id_patient, id_doctor, '2099-03-02', '10:00:00', 'Первичный', '', 1500,
+        [{'id_service': first, 'price': 500}, {'id_service': second, 'price': 1000, 'quantity': 2}])
+    kept, changed = _lines(database, id_appointment)
+
+    statements = []
+    database.conn.set_trace_callback(statements.append)
+    try:
+        database.update_appointment_with_services(
+            id_appointment, id_doctor, 'Запланирован', '', 2500,
+            [{'id_service': first, 'price': 500}, {'id_service': second, 'price': 1000, 'quantity': 1},
+             {'id_service': third, 'price': 1000}])
+    finally:
+        database.conn.set_trace_callback(None)
+    written = [sql.split()[0] for sql in statements
+               if "appointment_services" in sql and not sql.lstrip().startswith("SELECT")]
+    assert sorted(written) == ["INSERT", "UPDATE"]
+
+    lines = _lines(database, id_appointment)
+    assert tuple(lines[0]) == tuple(kept)
+    assert tuple(lines[1]) == (changed['id'], second, 1000, 1)
+    assert lines[2]['id_service'] == third
+
+    database.update_appointment_with_services(id_appointment, id_doctor, 'Запланирован', '', 2000,
+                                              [{'id_service': second, 'price': 1000},
+                                               {'id_service': third, 'price': 1000}])
+    assert [line['id'] for line in _lines(database, id_appointment)] == [lines[1]['id'], lines[2]['id']]
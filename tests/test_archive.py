@@ -0,0 +1,117 @@
+from datetime import date
+
+import pytest
+
+import archive
+import datagen
+import db
+import reports
+import stats
+from database import Database
+
+# Spread a generated clinic over twelve years, more archives than SQLite
+# can keep attached at once.
+SPREAD = [
+    "UPDATE appointments SET appointment_date = date(appointment_date, '-' || (id_appointment % 12) || ' years')",
+    """UPDATE payments SET payment_date = (SELECT a.appointment_date FROM appointments a
+                                          WHERE a.id_appointment = payments.id_appointment)""",
+    """UPDATE medical_records SET record_date = (SELECT a.appointment_date FROM appointments a
+                                                WHERE a.id_appointment = medical_records.id_appointment)""",
+    """UPDATE prescriptions SET prescription_date = (SELECT r.record_date FROM medical_records r
+                                                    WHERE r.id_record = prescriptions.id_record)""",
+    """UPDATE lab_orders SET order_date = (SELECT r.record_date FROM medical_records r
+                                          WHERE r.id_record = lab_orders.id_record)""",
+]
+
+
+def _history(database, id_patient):
+    events, cursor = [], None
+    while True:
+        page, cursor = database.get_patient_timeline(id_patient, cursor, limit=7)
+        events.extend(page)
+        if cursor is None:
+            break
+    appointments = sorted(row['id_appointment'] for row in database.get_patient_appointments(id_patient))
+    return appointments, events
+
+
+@pytest.fixture
+def spread_clinic(tmp_path):
+    # (database path, the patient with visits in the most years)
+    path = tmp_path / "clinic.sqlite3"
+    datagen.generate(path, 3000, today=date(2026, 1, 20), progress=lambda *args: None)
+    conn = db.get_connection(path)
+    try:
+        with conn:
+            for statement in SPREAD:
+                conn.execute(statement)
+        stats.rebuild(conn)
+        id_patient = conn.execute("SELECT id_patient FROM appointments GROUP BY id_patient "
+                                  "ORDER BY COUNT(DISTINCT substr(appointment_date, 1, 4)) DESC LIMIT 1").fetchone()[0]
+    finally:
+        conn.close()
+    return path, id_patient
+
+
+def test_more_archived_years_than_attachments(spread_clinic):
+    path, id_patient = spread_clinic
+    date_from, date_to = '2015-01-01', '2026-01-31'
+    database = Database(path, setup=False)
+    try:
+        before = {name: database.get_report(name, date_from, date_to) for name in reports.REPORTS}
+        history = _history(database, id_patient)
+        totals = archive.archive(database.conn, '2026-01-01')
+        assert totals['appointments'] > 0
+        assert len(archive.archived_years(database.conn)) > 10
+
+        for name in reports.REPORTS:
+            assert database.get_report(name, date_from, date_to) == before[name], name
+        assert _history(database, id_patient) == history
+        assert stats.check(database.conn) == {}
+        assert archive.attached(database.conn) == []
+    finally:
+        database.close()
+
+
+def test_timeline_reads_archives_only_when_needed(spread_clinic):
+    path, _ = spread_clinic
+    database = Database(path, setup=False)
+    try:
+        archive.archive(database.conn, '2026-01-01')
+        recent = database.conn.execute("SELECT id_patient FROM appointments GROUP BY id_patient "
+                                       "HAVING MIN(appointment_date) >= '2026-01-01' AND COUNT(*) > 1").fetchone()[0]
+        statements = []
+        database.conn.set_trace_callback(statements.append)
+        page, _ = database.get_patient_timeline(recent, limit=1)
+        assert page[0].event_date >= '2026-01-01'
+        assert not [sql for sql in statements if sql.startswith("ATTACH")]
+    finally:
+        database.close()
+
+
+def test_archived_appointments_reach_the_change_feed(spread_clinic):
+    path, _ = spread_clinic
+    database = Database(path, setup=False)
+    try:
+        before = {row[0] for row in database.conn.execute("SELECT id_appointment FROM appointments")}
+        _, since = database.get_appointment_changes()
+        archive.archive(database.conn, '2020-01-01', chunk_size=500)
+        moved = before - {row[0] for row in database.conn.execute("SELECT id_appointment FROM appointments")}
+        assert moved
+
+        removed = []
+        while True:
+            rows, since = database.get_appointment_changes(since, 400)
+            removed.extend(row['id_appointment'] for row in rows if row['removed'])
+            assert all(row['removed'] and row['status'] is None for row in rows if row['id_appointment'] in moved)
+            if len(rows) < 400:
+                break
+        assert set(removed) == moved
+
+        # Tombstones older than TOMBSTONE_DAYS go with the next run.
+        with database.conn:
+            database.conn.execute("UPDATE appointment_tombstones SET removed_at = '2000-01-01 00:00:00.000'")
+        archive.archive(database.conn, '2020-01-01')
+        assert database.conn.execute("SELECT COUNT(*) FROM appointment_tombstones").fetchone()[0] == 0
+    finally:
+        database.close()
@@ -0,0 +1,66 @@
+import pytest
+
+import datagen
+from database import Database, _encode_cursor
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "clinic.sqlite3"
+    datagen.generate(path, 200, progress=lambda *args: None)
+    database = Database(path, setup=False)
+    with database.conn:
+        database.conn.execute("UPDATE appointments SET updated_at = '2020-01-01 00:00:00.000'")
+    yield database
+    database.close()
+
+
+def _stamp(database, ids, stamp):
+    with database.conn:
+        database.conn.executemany("UPDATE appointments SET updated_at = ? WHERE id_appointment = ?",
+                                  [(stamp, i) for i in ids])
+
+
+def _poll(database, since, limit):
+    pages = []
+    while True:
+        rows, since = database.get_appointment_changes(since, limit)
+        pages.append([row['id_appointment'] for row in rows])
+        if len(rows) < limit:
+            return pages, since
+
+
+def test_pages_through_rows_sharing_a_millisecond(database):
+    ids = list(range(30, 55))
+    _stamp(database, ids, '2021-06-01 10:00:00.123')
+    start = _encode_cursor(['2020-01-01 00:00:00.000', 10 ** 9])
+    pages, since = _poll(database, start, 10)
+    assert pages == [ids[:10], ids[10:20], ids[20:]]
+    assert database.get_appointment_changes(since, 10) == ([], since)
+
+
+def test_fresh_rows_are_sent_again(database):
+    # A timestamp that has not settled yet: the page boundaries keep the id,
+    # but the watermark after the last page points before the whole
+    # millisecond, as another row may still commit with that stamp.
+    ids = list(range(30, 55))
+    _stamp(database, ids, '2999-01-01 00:00:00.000')
+    start = _encode_cursor(['2020-01-01 00:00:00.000', 10 ** 9])
+    pages, since = _poll(database, start, 10)
+    assert pages == [ids[:10], ids[10:20], ids[20:]]
+    rows, _ = database.get_appointment_changes(since, 100)
+    assert [row['id_appointment'] for row in rows] == ids
+    assert not any(row['removed'] for row in rows)
+
+
+def test_first_poll_returns_only_the_watermark(database):
+    _stamp(database, [7], '2021-06-01 10:00:00.123')
+    rows, since = database.get_appointment_changes()
+    assert rows == []
+    # The newest millisecond is sent once more, then the watermark settles.
+    rows, since = database.get_appointment_changes(since)
+    assert [row['id_appointment'] for row in rows] == [7]
+    assert database.get_appointment_changes(since) == ([], since)
+    _stamp(database, [8], '2021-06-01 10:00:00.124')
+    rows, _ = database.get_appointment_changes(since)
+    assert [row['id_appointment'] for row in rows] == [8]
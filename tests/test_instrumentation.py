@@ -0,0 +1,16 @@
+import io
+
+from database import Database
+from instrumentation import Instrumentation
+
+
+def test_instrumented_database_runs_static_helpers(tmp_path):
+    instrumentation = Instrumentation(slow_ms=0, stream=io.StringIO())
+    database = Database(tmp_path / "clinic.sqlite3", instrument=instrumentation)
+    try:
+        database.search_medical_records(icd_prefix="J")
+        database.search_medical_records("кашель")
+    finally:
+        database.close()
+    assert instrumentation.methods['search_medical_records'].calls == 2
+    assert instrumentation.methods['search_medical_records'].errors == 0
@@ -0,0 +1,103 @@
+import threading
+
+import pytest
+
+import labqueue
+from database import Database
+
+
+@pytest.fixture
+def queue(tmp_path):
+    path = tmp_path / "lab.sqlite3"
+    labqueue.build(path, 300, 120)
+    return path
+
+
+@pytest.fixture
+def desk(queue):
+    databases = []
+
+    def open_desk():
+        databases.append(Database(queue, 'server', setup=False))
+        return databases[-1]
+    yield open_desk
+    for database in databases:
+        database.close()
+
+
+def _ids(items):
+    return [item.id_lab_order for item in items]
+
+
+def _expire(database, ids):
+    with database.conn:
+        database.conn.executemany("UPDATE lab_orders SET claimed_at = '2000-01-01 00:00:00.000' "
+                                  "WHERE id_lab_order = ?", [(i,) for i in ids])
+
+
+def test_claims_do_not_overlap(desk):
+    first, second = desk(), desk()
+    a = _ids(first.claim_lab_orders('a', 10))
+    b = _ids(second.claim_lab_orders('b', 10))
+    assert len(a) == len(b) == 10 and not set(a) & set(b)
+    # Oldest orders go first.
+    assert max(a) < min(b)
+    status = first.get_lab_queue_status()
+    assert (status['pending'], status['claimed']) == (100, 20)
+
+
+def test_expired_lease_is_reclaimed_and_late_post_rejected(desk):
+    first, second = desk(), desk()
+    held = _ids(first.claim_lab_orders('a', 5))
+    _expire(first, held[:2])
+    # An unexpired lease survives another worker's claim.
+    taken = _ids(second.claim_lab_orders('b', 2))
+    assert taken == held[:2]
+    assert second.lab_metrics.as_dict()['expired'] == 2
+
+    posted, rejected = first.post_lab_results('a', [(i, 'Норма') for i in held])
+    assert (posted, rejected) == (3, held[:2])
+    assert second.post_lab_results('b', [(i, 'Повышен') for i in taken]) == (2, [])
+    results = dict(first.conn.execute(f"SELECT id_lab_order, result_text FROM lab_orders "
+                                      f"WHERE id_lab_order IN ({', '.join('?' * len(held))})", held).fetchall())
+    assert results == {**dict.fromkeys(held[2:], 'Норма'), **dict.fromkeys(taken, 'Повышен')}
+    # A completed order is not accepted twice.
+    assert first.post_lab_results('a', [(held[2], 'Норма')]) == (0, [held[2]])
+
+
+def test_release_returns_only_own_orders(desk):
+    first, second = desk(), desk()
+    held = _ids(first.claim_lab_orders('a', 4))
+    assert second.release_lab_orders('b', held) == 0
+    assert first.release_lab_orders('a', held[:2]) == 2
+    assert _ids(second.claim_lab_orders('b', 2)) == held[:2]
+    with pytest.raises(ValueError):
+        first.claim_lab_orders(' ', 1)
+
+
+def test_concurrent_workers_claim_each_order_once(queue):
+    claimed = {}
+    barrier = threading.Barrier(2)
+
+    def work(worker):
+        database = Database(queue, 'server', setup=False)
+        try:
+            barrier.wait()
+            mine = []
+            while True:
+                items = database.claim_lab_orders(worker, 7)
+                if not items:
+                    break
+                mine.extend(_ids(items))
+                database.post_lab_results(worker, [(i, labqueue.DEFAULT_RESULT) for i in _ids(items)])
+            claimed[worker] = mine
+        finally:
+            database.close()
+
+    threads = [threading.Thread(target=work, args=(worker,)) for worker in ('a', 'b')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(claimed['a']) + len(claimed['b']) == 120
+    assert not set(claimed['a']) & set(claimed['b'])
@@ -0,0 +1,28 @@
+from datetime import date
+
+import archive
+import datagen
+import db
+import reports
+from database import Database
+
+
+def test_reports_include_archived_years(tmp_path):
+    path = tmp_path / "clinic.sqlite3"
+    datagen.generate(path, 5000, today=date(2026, 1, 20), progress=lambda *args: None)
+    date_from, date_to = '2025-12-01', '2026-01-31'
+    conn = db.get_connection(path)
+    try:
+        before = {name: report.build(conn, date_from, date_to) for name, report in reports.REPORTS.items()}
+        totals = archive.archive(conn, '2026-01-01')
+        assert totals['appointments'] > 0 and totals['payments'] > 0
+        assert archive.archived_years(conn) == [2025]
+    finally:
+        conn.close()
+
+    database = Database(path, setup=False)
+    try:
+        for name in reports.REPORTS:
+            assert database.get_report(name, date_from, date_to) == before[name], name
+    finally:
+        database.close()
@@ -0,0 +1,88 @@
+from datetime import datetime
+
+import pytest
+
+import scheduling
+from database import Database
+
+DAY = '2099-03-02'  # a Monday with no bookings
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = Database(tmp_path / "clinic.sqlite3")
+    yield database
+    database.close()
+
+
+def _doctors(database):
+    return [row[0] for row in database.conn.execute("SELECT id_doctor FROM doctors ORDER BY id_doctor LIMIT 2")]
+
+
+def _book(database, id_doctor, time, minutes=30):
+    id_patient = database.conn.execute("SELECT id_patient FROM patients LIMIT 1").fetchone()[0]
+    services = [{'id_service': row[0], 'price': 0} for row in database.conn.execute(
+        "SELECT id_service FROM service_pricelist WHERE duration_minutes = ? LIMIT 1", (minutes,))]
+    return database.create_appointment_with_services(id_patient, id_doctor, DAY, time, 'Первичный', '', 0,
+                                                     services)
+
+
+def test_add_minutes_stays_within_the_day():
+    assert scheduling.add_minutes('23:15:00', 30) == '23:45:00'
+    for start, minutes in (('23:45:00', 30), ('23:30:00', 30)):
+        with pytest.raises(ValueError):
+            scheduling.add_minutes(start, minutes)
+
+
+def test_booking_across_midnight_is_rejected(database):
+    id_doctor, _ = _doctors(database)
+    with pytest.raises(ValueError):
+        _book(database, id_doctor, '23:45:00')
+    assert database.conn.execute("SELECT COUNT(*) FROM appointments WHERE appointment_date = ?",
+                                 (DAY,)).fetchone()[0] == 0
+
+
+def test_touching_appointments_do_not_overlap(database):
+    id_doctor, _ = _doctors(database)
+    _book(database, id_doctor, '10:00:00')
+    _book(database, id_doctor, '10:30:00')
+    _book(database, id_doctor, '09:30:00')
+    with pytest.raises(scheduling.ScheduleConflict):
+        _book(database, id_doctor, '10:15:00')
+
+
+def test_free_statuses_do_not_occupy_the_doctor(database):
+    id_doctor, _ = _doctors(database)
+    for status in scheduling.FREE_STATUSES:
+        id_appointment = _book(database, id_doctor, '11:00:00')
+        database.update_appointment_with_services(id_appointment, id_doctor, status, '', 0, [])
+    _book(database, id_doctor, '11:00:00')
+
+
+def test_changing_the_doctor_checks_the_new_doctor(database):
+    first, second = _doctors(database)
+    _book(database, second, '12:00:00')
+    id_appointment = _book(database, first, '12:00:00')
+    with pytest.raises(scheduling.ScheduleConflict):
+        database.update_appointment_with_services(id_appointment, second, 'Запланирован', '', 0, [])
+    assert database.conn.execute("SELECT id_doctor FROM appointments WHERE id_appointment = ?",
+                                 (id_appointment,)).fetchone()[0] == first
+    # Its own time does not count against the appointment being edited.
+    database.update_appointment_with_services(id_appointment, first, 'На приеме', '', 0, [])
+
+
+def test_doctor_without_schedule_gets_default_hours(database):
+    scheduled, unscheduled = _doctors(database)
+    with database.conn:
+        database.conn.execute("INSERT INTO doctor_schedules (id_doctor, weekday, start_time, end_time) "
+                              "VALUES (?, 0, '14:00:00', '15:00:00')", (scheduled,))
+    monday = datetime(2099, 3, 2, 7, 0)
+    assert scheduling.working_hours(database.conn, [unscheduled])[unscheduled][0] == [(9 * 60, 18 * 60)]
+    slots = scheduling.free_slots(database.conn, count=1, id_doctor=unscheduled, after=monday)
+    assert (slots[0]['date'], slots[0]['time']) == (DAY, '09:00:00')
+    slots = scheduling.free_slots(database.conn, count=1, id_doctor=scheduled, after=monday)
+    assert (slots[0]['date'], slots[0]['time']) == (DAY, '14:00:00')
+    # Default hours leave the weekend out.
+    saturday = datetime(2099, 3, 7, 7, 0)
+    slots = scheduling.free_slots(database.conn, count=1, id_doctor=unscheduled, after=saturday)
+    assert (slots[0]['date'], slots[0]['time']) == ('2099-03-09', '09:00:00')
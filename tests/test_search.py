@@ -0,0 +1,23 @@
+from database import Database
+
+
+def test_icd_search_pages_through_undated_records(tmp_path):
+    database = Database(tmp_path / "clinic.sqlite3")
+    try:
+        dates = ['2026-03-01', None, '2026-03-02', None, '2026-03-01', None, '2026-02-28']
+        with database.conn:
+            database.conn.executemany(
+                "INSERT INTO medical_records (record_date, diagnosis_icd10, complaints) VALUES (?, 'Z99.1', '')",
+                [(day,) for day in dates])
+        expected = [row[0] for row in database.conn.execute(
+            "SELECT id_record FROM medical_records WHERE diagnosis_icd10 LIKE 'Z99%'"
+            " ORDER BY record_date IS NULL, record_date DESC, id_record DESC")]
+        found, cursor = [], None
+        while True:
+            rows, cursor = database.search_medical_records(icd_prefix="Z99", page_size=2, cursor=cursor)
+            found.extend(row.id_record for row in rows)
+            if cursor is None:
+                break
+    finally:
+        database.close()
+    assert found == expected
@@ -0,0 +1,59 @@
+import asyncio
+import json
+import socket
+import threading
+
+import pytest
+
+import service
+
+
+@pytest.fixture
+def address(tmp_path, monkeypatch):
+    monkeypatch.setattr(service, "MAX_LINE_BYTES", 4096)
+    monkeypatch.delenv(service.ENV_TOKEN, raising=False)
+    database_service = service.DatabaseService(tmp_path / "clinic.sqlite3", readers=1)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    bound = []
+
+    def on_started(address):
+        bound.append(address)
+        started.set()
+
+    task = loop.create_task(database_service.serve("127.0.0.1", 0, started=on_started))
+    thread = threading.Thread(target=lambda: loop.run_until_complete(asyncio.wait([task])))
+    thread.start()
+    assert started.wait(10)
+    yield bound[0]
+    loop.call_soon_threadsafe(task.cancel)
+    thread.join()
+    loop.close()
+    database_service.close()
+
+
+def _lines(address, *messages):
+    with socket.create_connection(address) as sock, sock.makefile("rwb") as stream:
+        for message in messages:
+            stream.write(message)
+        stream.flush()
+        sock.shutdown(socket.SHUT_WR)
+        return [json.loads(line) for line in stream]
+
+
+def test_overlong_request_gets_an_error_and_closes(address):
+    hello = service._encode({'hello': 1})
+    doctors = service._encode({'id': 1, 'method': 'get_doctors'})
+    oversized = service._encode({'id': 2, 'method': 'get_doctors', 'args': ['x' * 8192]})
+    replies = _lines(address, hello, doctors, oversized, doctors)
+    assert replies[0] == {'hello': 'ok'}
+    assert replies[1]['id'] == 1 and replies[1]['result']
+    # Nothing after the overlong line is read.
+    assert replies[2:] == [{'id': None, 'error': {'type': 'ValueError', 'message': "Запрос длиннее 4096 байт"}}]
+
+    # The server keeps serving other connections.
+    remote = service.RemoteDatabase(f"{address[0]}:{address[1]}")
+    try:
+        assert remote.get_doctors()
+    finally:
+        remote.close()
@@ -0,0 +1,30 @@
+from database import Database
+
+
+def _pages(database, id_patient, limit):
+    events, cursor = [], None
+    while True:
+        page, cursor = database.get_patient_timeline(id_patient, cursor, limit=limit)
+        events.extend(page)
+        if cursor is None:
+            return events
+
+
+def test_timeline_includes_undated_events(tmp_path):
+    database = Database(tmp_path / "clinic.sqlite3")
+    try:
+        id_patient = database.conn.execute("SELECT id_patient FROM appointments LIMIT 1").fetchone()[0]
+        with database.conn:
+            database.conn.executemany(
+                "INSERT INTO medical_records (id_patient, record_date, diagnosis_icd10) VALUES (?, ?, 'J06.9')",
+                [(id_patient, None), (id_patient, '2020-05-01'), (id_patient, None)])
+            database.conn.execute("INSERT INTO prescriptions (id_patient, prescription_date, medication_name) "
+                                  "VALUES (?, NULL, 'Парацетамол')", (id_patient,))
+        everything = _pages(database, id_patient, 100)
+        undated = [event for event in everything if event.event_date == '']
+        assert [event.kind for event in undated] == ['record', 'record', 'prescription']
+        assert everything[-len(undated):] == undated
+        # Small pages hand out cursors inside the undated tail.
+        assert _pages(database, id_patient, 1) == everything
+    finally:
+        database.close()
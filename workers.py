@@ -0,0 +1,160 @@
+import itertools
+import threading
+from typing import Callable, Optional
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from PyQt5.QtWidgets import QProgressBar
+
+
+class _QuerySignals(QObject):
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, object)
+    progress = pyqtSignal(int, object)
+
+
+class _QueryTask(QRunnable):
+    def __init__(self, runner: "QueryRunner", ticket: int, method, args, kwargs):
+        super().__init__()
+        # The runner owns the Python wrapper; Qt must not delete it after run().
+        self.setAutoDelete(False)
+        self.runner = runner
+        self.ticket = ticket
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+        self.database = None
+        self.lock = threading.Lock()
+
+    def run(self):
+        signals = self.runner.signals
+        if self.cancelled:
+            signals.finished.emit(self.ticket, None)
+            return
+        database = self.runner.thread_database()
+        with self.lock:
+            self.database = database
+        try:
+            if isinstance(self.method, str):
+                result = getattr(database, self.method)(*self.args, **self.kwargs)
+            else:
+                result = self.method(database, *self.args, **self.kwargs)
+        except Exception as exc:
+            signals.failed.emit(self.ticket, exc)
+        else:
+            signals.finished.emit(self.ticket, result)
+        finally:
+            with self.lock:
+                self.database = None
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            if self.database is not None:
+                self.database.interrupt()
+
+
+class QueryRunner(QObject):
+    busy_changed = pyqtSignal(bool)
+    failed = pyqtSignal(str)
+
+    def __init__(self, database, parent=None, max_threads: int = 4):
+        super().__init__(parent)
+        self.database = database
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self.signals = _QuerySignals()
+        self.signals.finished.connect(self._on_finished)
+        self.signals.failed.connect(self._on_failed)
+        self.signals.progress.connect(self._on_progress)
+        self._local = threading.local()
+        self._tickets = itertools.count(1)
+        self._tasks = {}
+        self._channels = {}
+        self._busy = False
+
+    def thread_database(self):
+        database = getattr(self._local, 'database', None)
+        if database is None:
+            database = self._local.database = self.database.worker_copy()
+        return database
+
+    def submit(self, method, *args, on_result: Optional[Callable] = None,
+               on_error: Optional[Callable] = None, on_progress: Optional[Callable] = None,
+               channel=None, **kwargs) -> int:
+        if channel is not None:
+            self.cancel_channel(channel)
+        ticket = next(self._tickets)
+        if on_progress is not None:
+            # The method gets a progress(*values) callable that is safe to call
+            # from the pool thread; on_progress receives the values on the GUI thread.
+            kwargs['progress'] = lambda *values: self.signals.progress.emit(ticket, values)
+        task = _QueryTask(self, ticket, method, args, kwargs)
+        self._tasks[ticket] = (task, on_result, on_error, on_progress, channel)
+        if channel is not None:
+            self._channels[channel] = ticket
+        self.pool.start(task)
+        self._update_busy()
+        return ticket
+
+    def cancel(self, ticket: Optional[int]):
+        entry = self._tasks.get(ticket)
+        if entry is None:
+            return
+        task, _, _, _, channel = entry
+        task.cancel()
+        if self.pool.tryTake(task):
+            del self._tasks[ticket]
+        if channel is not None and self._channels.get(channel) == ticket:
+            del self._channels[channel]
+        self._update_busy()
+
+    def cancel_channel(self, channel):
+        self.cancel(self._channels.get(channel))
+
+    def _take(self, ticket: int):
+        entry = self._tasks.pop(ticket, None)
+        if entry is None:
+            return None
+        task, on_result, on_error, _, channel = entry
+        if channel is not None and self._channels.get(channel) == ticket:
+            del self._channels[channel]
+        self._update_busy()
+        if task.cancelled:
+            return None
+        return on_result, on_error
+
+    def _on_finished(self, ticket: int, result):
+        callbacks = self._take(ticket)
+        if callbacks and callbacks[0] is not None:
+            callbacks[0](result)
+
+    def _on_failed(self, ticket: int, exc):
+        callbacks = self._take(ticket)
+        if callbacks is None:
+            return
+        if callbacks[1] is not None:
+            callbacks[1](exc)
+        else:
+            self.failed.emit(str(exc))
+
+    def _on_progress(self, ticket: int, values):
+        entry = self._tasks.get(ticket)
+        if entry is not None and not entry[0].cancelled and entry[3] is not None:
+            entry[3](*values)
+
+    def _update_busy(self):
+        busy = any(not entry[0].cancelled for entry in self._tasks.values())
+        if busy != self._busy:
+            self._busy = busy
+            self.busy_changed.emit(busy)
+
+
+class BusyIndicator(QProgressBar):
+    def __init__(self, runner: QueryRunner, parent=None):
+        super().__init__(parent)
+        self.setRange(0, 0)
+        self.setMaximumWidth(120)
+        self.setTextVisible(False)
+        self.hide()
+        runner.busy_changed.connect(self.setVisible)